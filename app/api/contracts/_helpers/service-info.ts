@@ -122,20 +122,65 @@ const buildServiceInfoUrl = (path: string) => {
   }
 }
 
-const requestPayload = async <T>(path: string, markdown: string) => {
-  const url = buildServiceInfoUrl(path)
+const CONTRACT_ANALYSIS_PATH = "/api/v1/contract_analysis"
+
+const SERVICE_INFO_EXTRACTORS = [
+  "onsite_sla",
+  "yearly_maintenance",
+  "remote_maintenance",
+  "training_support",
+  "contract_and_compliance",
+  "after_sales_support",
+  "key_spare_parts",
+] as const
+
+type ServiceInfoExtractor = (typeof SERVICE_INFO_EXTRACTORS)[number]
+
+type ContractAnalysisNodeTiming = {
+  node: string
+  status: "success" | "failed" | "skipped"
+  error: string | null
+  started_ms: number
+  duration_ms: number
+}
+
+type ContractAnalysisResponse = Partial<Record<ServiceInfoExtractor, any>> & {
+  timings: ContractAnalysisNodeTiming[]
+  total_ms: number
+}
+
+const requestServiceInfoAnalysis = async (markdown: string) => {
+  const url = buildServiceInfoUrl(CONTRACT_ANALYSIS_PATH)
   const response = await fetch(url, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ content: markdown }),
+    body: JSON.stringify({ content: markdown, extractors: SERVICE_INFO_EXTRACTORS }),
   })
 
   if (!response.ok) {
-    throw new Error(`服务调用失败(${path})，状态码 ${response.status}`)
+    throw new Error(`服务调用失败(${CONTRACT_ANALYSIS_PATH})，状态码 ${response.status}`)
   }
 
-  const payload = (await response.json()) as T
-  return { url, payload }
+  const payload = (await response.json()) as ContractAnalysisResponse
+  const failedNodes = (payload.timings ?? []).filter((timing) => timing.status !== "success")
+  if (failedNodes.length) {
+    const details = failedNodes.map((timing) => `${timing.node}: ${timing.error ?? timing.status}`).join("; ")
+    throw new Error(`服务调用失败(${CONTRACT_ANALYSIS_PATH})，${details}`)
+  }
+
+  const pick = (extractor: ServiceInfoExtractor) => ({ url, payload: payload[extractor] })
+  return {
+    url,
+    timings: payload.timings ?? [],
+    totalMs: payload.total_ms,
+    onsiteRes: pick("onsite_sla"),
+    yearlyRes: pick("yearly_maintenance"),
+    remoteRes: pick("remote_maintenance"),
+    trainingRes: pick("training_support"),
+    complianceRes: pick("contract_and_compliance"),
+    afterSalesRes: pick("after_sales_support"),
+    keySparePartsRes: pick("key_spare_parts"),
+  }
 }
 
 export const parseServiceInfoSnapshotPayload = (payload: string | null | undefined) => {
@@ -210,15 +255,8 @@ export async function extractAndPersistServiceInfo(contractId: string, markdown:
   }
 
   try {
-    const [onsiteRes, yearlyRes, remoteRes, trainingRes, complianceRes, afterSalesRes, keySparePartsRes] = await Promise.all([
-      requestPayload<any>("/api/v1/onsite_SLA_extraction", markdown),
-      requestPayload<any>("/api/v1/yearly_maintenance_info_extraction", markdown),
-      requestPayload<any>("/api/v1/remote_maintenance_info_extraction", markdown),
-      requestPayload<any>("/api/v1/training_support_info_extraction", markdown),
-      requestPayload<any>("/api/v1/contract_and_compliance_info_extraction", markdown),
-      requestPayload<any>("/api/v1/after_sales_support_info_extraction", markdown),
-      requestPayload<any>("/api/v1/key_spare_parts_info_extraction", markdown),
-    ])
+    const analysis = await requestServiceInfoAnalysis(markdown)
+    const { onsiteRes, yearlyRes, remoteRes, trainingRes, complianceRes, afterSalesRes, keySparePartsRes } = analysis
 
     const onsiteSla: OnsiteSlaItem[] = Array.isArray(onsiteRes.payload?.item_list)
       ? onsiteRes.payload.item_list.map((item: Record<string, unknown>) => ({
@@ -400,6 +438,10 @@ export async function extractAndPersistServiceInfo(contractId: string, markdown:
           afterSales: afterSalesRes.url,
           keySpareParts: keySparePartsRes.url,
         },
+        timings: {
+          totalMs: analysis.totalMs,
+          nodes: analysis.timings.map((timing) => ({ node: timing.node, durationMs: timing.duration_ms })),
+        },
         counts: {
           onsiteSla: onsiteSla.length,
           yearlyMaintenance: yearlyMaintenance.length,
@@ -0,0 +1,314 @@
+"""提示词 / Schema 回归：在黄金合同语料上回放录制的模型响应，按抽取类型与基线对比。
+
+用法（在 backend 目录下）：
+    # 用真实模型录制（BASE_URL / API_KEY / LLM_MODEL 指向真实服务），每个合同写入 cassettes/<合同名>.jsonl
+    python benchmarks/llm_regression.py --record
+    # 或用离线桩服务录制：回答取自 canned/<Schema 标题>.json（仓库中的录制文件与基线即由此生成）
+    python benchmarks/llm_regression.py --record --stub
+    # 离线回放并把结果写为基线
+    python benchmarks/llm_regression.py --update-baseline
+    # 修改 prompts.py 或 models/* 后离线回放，任一指标变差超过阈值时退出码为 1
+    python benchmarks/llm_regression.py --output results/regression.json
+
+语料目录（--corpus，默认 benchmarks/golden）：contracts/*.md 为合同正文，cassettes/ 为录制文件，baseline.json 为基线，
+canned/ 为 --stub 录制时桩服务使用的固定回答。仓库中的录制文件由桩服务按 canned/ 录制，回答本身都是合法 JSON，
+parse_success_rate 在这份语料上恒为 1.0；它只在用真实模型录制的语料上才反映模型输出的可解析程度。
+
+token 数默认按字符数估算（--tokenizer heuristic），不依赖能否下载 tiktoken 编码，各环境结果一致；
+本次与基线的分词器不同时 token 数不可比，直接报错退出，需用相同的 --tokenizer 回放或重新生成基线。
+回放时提示词按当前代码重新生成，系统提示词、输出格式说明或 Schema 改动后按合同内容匹配录制的响应，
+因此结果反映的是改动后的输入 token 数，以及录制的回答在新 Schema 下能否不经 LLM 格式修复直接解析。
+
+每个抽取类型报告（多个合同合计）：
+- prompt_tokens：抽取调用（不含格式修复）的输入 token 数，按当前分词器计算；
+- parse_success_rate：不经 LLM 格式修复即解析成功（直接通过或本地修复）的比例；
+- local_ms：回放时（模型耗时为 0）的耗时中位数，即章节路由、提示词组装、JSON 解析与原文定位等本地处理时间；
+  每个抽取类型先不计时地预热回放一次（首次调用的导入、正则编译与分词器加载不计入）。
+回放出错（如录制中没有对应请求）的抽取类型同样视为回归。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ.setdefault("OCR_MODEL", "benchmark-ocr")
+os.environ.setdefault("LLM_MODEL", "benchmark-llm")
+# 结果缓存会跳过解析，录制文件由本脚本按合同指定
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["LLM_CASSETTE_MODE"] = "off"
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(BENCHMARK_DIR, "golden")
+
+PARSED_WITHOUT_REFINE = ("direct", "repaired")
+PARSE_OUTCOMES = ("direct", "repaired", "truncated", "llm_refined", "failed")
+
+
+def load_corpus(corpus: str) -> Dict[str, str]:
+    directory = os.path.join(corpus, "contracts")
+    if not os.path.isdir(directory):
+        raise SystemExit(f"语料目录不存在: {directory}")
+    contracts = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".md"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                contracts[name[: -len(".md")]] = f.read()
+    if not contracts:
+        raise SystemExit(f"语料目录中没有合同: {directory}/*.md")
+    return contracts
+
+
+async def run_extractor(agent, method: str, extractor: str, contract: str) -> Dict[str, Any]:
+    """执行一次抽取，返回输入 token 数、解析结果计数与耗时（毫秒）"""
+    from service.json_repair import json_repair_stats
+    from service.token_usage import token_usage, usage_scope
+
+    def stage_tokens() -> int:
+        # 格式修复记在 "<抽取类型>/refine" 阶段，这里只取抽取调用本身
+        return (token_usage.stats()["stages"].get(extractor) or {}).get("estimated_prompt_tokens", 0)
+
+    outcomes_before = dict(json_repair_stats.outcomes)
+    tokens_before = stage_tokens()
+    error = None
+    started = time.perf_counter()
+    try:
+        with usage_scope(stage=extractor):
+            await getattr(agent, method)(contract)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    outcomes = {name: json_repair_stats.outcomes[name] - outcomes_before.get(name, 0) for name in PARSE_OUTCOMES}
+    return {
+        "prompt_tokens": stage_tokens() - tokens_before,
+        "parse_calls": sum(outcomes.values()),
+        "parsed_without_refine": sum(outcomes[name] for name in PARSED_WITHOUT_REFINE),
+        "local_ms": elapsed_ms,
+        "error": error,
+    }
+
+
+async def run_contract(
+    agent, extractors: Dict[str, str], contract: str, cassette, repeat: int, warmup: bool
+) -> Dict[str, Dict[str, Any]]:
+    from service.llm_cassette import cassette_scope
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with cassette_scope(cassette):
+        for extractor, method in extractors.items():
+            if warmup:
+                await run_extractor(agent, method, extractor, contract)
+            runs = [await run_extractor(agent, method, extractor, contract) for _ in range(repeat)]
+            # 各次回放的 token 数与解析结果相同，耗时取中位数
+            results[extractor] = {**runs[0], "local_ms": round(statistics.median(run["local_ms"] for run in runs), 3)}
+    return results
+
+
+def aggregate(details: Dict[str, Dict[str, Dict[str, Any]]], contracts: List[str]) -> Dict[str, Dict[str, Any]]:
+    totals: Dict[str, Dict[str, Any]] = {}
+    for contract in contracts:
+        for extractor, result in details[contract].items():
+            total = totals.setdefault(
+                extractor, {"prompt_tokens": 0, "parse_calls": 0, "parsed_without_refine": 0, "local_ms": 0.0, "errors": []}
+            )
+            for key in ("prompt_tokens", "parse_calls", "parsed_without_refine", "local_ms"):
+                total[key] += result[key]
+            if result["error"]:
+                total["errors"].append(f"{contract}: {result['error']}")
+    for total in totals.values():
+        total["local_ms"] = round(total["local_ms"], 3)
+        total["parse_success_rate"] = (
+            round(total["parsed_without_refine"] / total["parse_calls"], 4) if total["parse_calls"] else None
+        )
+    return totals
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    """只在两边都有的合同上对比，语料增减不会误报；分词器不同时 token 数不可比，直接报错"""
+    tokenizer, baseline_tokenizer = report["parameters"]["tokenizer"], baseline["parameters"].get("tokenizer")
+    if tokenizer != baseline_tokenizer:
+        raise SystemExit(
+            f"分词器不一致（基线 {baseline_tokenizer}，本次 {tokenizer}），输入 token 数不可比；"
+            f"请用 --tokenizer {baseline_tokenizer} 回放，或用 --update-baseline 重新生成基线"
+        )
+    contracts = [name for name in report["contracts"] if name in baseline["details"]]
+    current = aggregate(report["details"], contracts)
+    previous = aggregate(baseline["details"], contracts)
+    regressions = []
+    for extractor, now in current.items():
+        before = previous.get(extractor)
+        for error in now["errors"]:
+            regressions.append(f"{extractor}: 回放出错 {error}")
+        if before is None:
+            continue
+        if now["prompt_tokens"] > before["prompt_tokens"] * (1 + args.max_prompt_growth):
+            regressions.append(f"{extractor}: 输入 token {before['prompt_tokens']} -> {now['prompt_tokens']}")
+        if (
+            before["parse_success_rate"] is not None
+            and (now["parse_success_rate"] or 0.0) < before["parse_success_rate"] - args.max_parse_drop
+        ):
+            regressions.append(f"{extractor}: 免修复解析成功率 {before['parse_success_rate']} -> {now['parse_success_rate']}")
+        if now["local_ms"] > before["local_ms"] * (1 + args.max_time_growth) + args.time_slack_ms:
+            regressions.append(f"{extractor}: 本地处理耗时 {before['local_ms']}ms -> {now['local_ms']}ms")
+    return regressions
+
+
+async def start_stub(corpus: str) -> subprocess.Popen:
+    """启动离线桩服务并把 BASE_URL 指向它；须在导入 config 之前调用"""
+    from benchmarks.load_benchmark import BACKEND_DIR, _free_port, _wait_ready
+
+    port = _free_port()
+    stub = subprocess.Popen(
+        [
+            sys.executable, os.path.join(BENCHMARK_DIR, "stub_llm_server.py"),
+            "--port", str(port),
+            "--latency", "fixed:0.05",
+            "--seed", "0",
+            "--canned-dir", os.path.join(corpus, "canned"),
+        ],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        await _wait_ready(f"http://127.0.0.1:{port}/stub/stats", stub)
+    except Exception:
+        stub.kill()
+        raise
+    os.environ["BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    return stub
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    # 须在导入 config 之前设置
+    os.environ["TOKENIZER_ENCODING"] = args.tokenizer
+    stub = await start_stub(args.corpus) if args.stub else None
+    try:
+        return await run(args)
+    finally:
+        if stub is not None:
+            stub.terminate()
+            try:
+                stub.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                stub.kill()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.load_benchmark import _git_commit
+    from config import LLM_MODEL
+    from service.analysis_pipeline import EXTRACTOR_METHODS
+    from service.contract_info_extraction import ContractInfoExtractionAgent
+    from service.llm_cassette import RECORD, REPLAY, Cassette
+    from service.token_usage import token_counter
+
+    contracts = load_corpus(args.corpus)
+    selected = list(EXTRACTOR_METHODS) if args.extractors == "all" else [name.strip() for name in args.extractors.split(",")]
+    unknown = [name for name in selected if name not in EXTRACTOR_METHODS]
+    if unknown:
+        raise SystemExit(f"未知抽取类型: {', '.join(unknown)}（可选: {', '.join(EXTRACTOR_METHODS)}）")
+    extractors = {name: EXTRACTOR_METHODS[name] for name in selected}
+
+    agent = ContractInfoExtractionAgent()
+    details: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for name, contract in contracts.items():
+        path = os.path.join(args.corpus, "cassettes", f"{name}.jsonl")
+        if args.record:
+            # 重新录制整份合同，避免新旧响应混在一起
+            if os.path.exists(path):
+                os.remove(path)
+            cassette = Cassette(path, RECORD)
+        else:
+            if not os.path.exists(path):
+                raise SystemExit(f"缺少录制文件 {path}，请先用 --record 录制")
+            cassette = Cassette(path, REPLAY)
+        details[name] = await run_contract(
+            agent, extractors, contract, cassette, 1 if args.record else args.repeat, warmup=not args.record
+        )
+        print(f"{name}: {cassette.stats()}", flush=True)
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "mode": ("record-stub" if args.stub else "record") if args.record else "replay",
+        "parameters": {
+            "corpus": os.path.relpath(args.corpus, BENCHMARK_DIR),
+            "repeat": args.repeat,
+            "model": LLM_MODEL,
+            "tokenizer": token_counter.tokenizer(LLM_MODEL),
+        },
+        "contracts": list(contracts),
+        "extractors": aggregate(details, list(contracts)),
+        "details": details,
+    }
+    for extractor, total in report["extractors"].items():
+        print(
+            f"{extractor:<26} prompt={total['prompt_tokens']:>7} tokens  "
+            f"parse_without_refine={total['parsed_without_refine']}/{total['parse_calls']}  local={total['local_ms']:.2f}ms"
+            + (f"  errors={len(total['errors'])}" if total["errors"] else ""),
+            flush=True,
+        )
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="语料目录（contracts/、cassettes/、baseline.json）")
+    parser.add_argument("--extractors", default="all", help="逗号分隔的抽取类型，默认全部")
+    parser.add_argument("--record", action="store_true", help="调用真实模型重新录制，不做对比")
+    parser.add_argument("--stub", action="store_true", help="与 --record 一起使用：改为调用离线桩服务，回答取自 <corpus>/canned")
+    parser.add_argument("--repeat", type=int, default=5, help="回放次数，本地耗时取中位数")
+    parser.add_argument(
+        "--tokenizer",
+        default="heuristic",
+        help="计算输入 token 的编码：heuristic（按字符数估算，离线且结果稳定）或 tiktoken 编码名如 o200k_base",
+    )
+    parser.add_argument("--baseline", help="基线 JSON 路径，默认 <corpus>/baseline.json")
+    parser.add_argument("--update-baseline", action="store_true", help="把本次回放结果写为基线")
+    parser.add_argument("--max-prompt-growth", type=float, default=0.05, help="输入 token 数允许的相对增长")
+    parser.add_argument("--max-parse-drop", type=float, default=0.0, help="免修复解析成功率允许的绝对下降")
+    parser.add_argument("--max-time-growth", type=float, default=0.5, help="本地处理耗时允许的相对增长")
+    parser.add_argument("--time-slack-ms", type=float, default=20.0, help="本地处理耗时额外允许的绝对增长（毫秒），吸收计时抖动")
+    parser.add_argument("--output", help="结果写入的 JSON 文件路径")
+    args = parser.parse_args()
+    if args.stub and not args.record:
+        parser.error("--stub 只能与 --record 一起使用")
+    args.repeat = max(1, args.repeat)
+    args.baseline = args.baseline or os.path.join(args.corpus, "baseline.json")
+    return args
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = asyncio.run(main(arguments))
+    regressions: List[str] = []
+    if not arguments.record and not arguments.update_baseline:
+        if os.path.exists(arguments.baseline):
+            with open(arguments.baseline, encoding="utf-8") as f:
+                regressions = compare(report, json.load(f), arguments)
+        else:
+            print(f"没有基线 {arguments.baseline}，跳过对比（用 --update-baseline 生成）")
+    report["regressions"] = regressions
+    if arguments.update_baseline:
+        errors = [error for total in report["extractors"].values() for error in total["errors"]]
+        if errors:
+            raise SystemExit("回放出错，未写入基线:\n" + "\n".join(errors))
+        with open(arguments.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已写入 {arguments.baseline}")
+    if arguments.output:
+        os.makedirs(os.path.dirname(os.path.abspath(arguments.output)), exist_ok=True)
+        with open(arguments.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {arguments.output}")
+    if regressions:
+        print("回归:\n" + "\n".join(f"  - {item}" for item in regressions))
+        sys.exit(1)
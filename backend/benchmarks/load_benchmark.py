@@ -0,0 +1,408 @@
+"""接口压测：在离线桩模型上按递增并发压测 server.py 的各个接口。
+
+用法（在 backend 目录下）：
+    python benchmarks/load_benchmark.py --concurrency 1,4,16,64 --requests 64 --output results/load.json
+    python benchmarks/load_benchmark.py --scenarios basic_info_extraction,pdf_to_markdown --latency lognormal:0.8,0.4
+
+依次启动 benchmarks/stub_llm_server.py（OpenAI 兼容桩）与后端（独立进程，BASE_URL 指向桩服务，
+LLM/OCR 结果缓存与文本层快速通道关闭），对每个场景、每个并发级别用固定数量的工作协程循环发送请求，
+记录 requests/s、p50/p95/p99 延迟、状态码分布，以及后端进程的事件循环延迟与峰值内存（RSS）。
+结果（含提交号与参数）写入 JSON，便于跨提交对比；--backend-env KEY=VALUE 可覆盖后端配置。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ.setdefault("OCR_MODEL", "benchmark-ocr")
+os.environ.setdefault("LLM_MODEL", "benchmark-llm")
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+
+CONTRACT_MARKDOWN = """# 医疗设备维保服务合同
+
+## 第一条 合同基本信息
+合同编号：HT-2025-0001，甲方：某市人民医院，乙方：某医疗科技有限公司。合同期限自2025年1月1日至2027年12月31日，
+合同总金额人民币1,200,000元，分三期支付。
+
+## 第二条 服务内容
+| 设备 | 服务类型 | 响应时间 | 到场时间 | 标准保养 |
+| --- | --- | --- | --- | --- |
+| CT | 全保 | 4小时 | 48小时 | 每年2次 |
+| MR | 全保 | 4小时 | 24小时 | 每年2次 |
+
+乙方通过远程监测平台每季度进行1次远程保养，提供7x24小时热线支持，保证设备开机率不低于95%。
+
+## 第三条 关键备件
+CT球管、探测器与心电模块在合同期内提供先换后修服务，旧件须在15个工作日内返还。
+
+## 第四条 培训
+乙方每年提供2次操作培训，覆盖10名学员，每次培训2天。
+
+## 第五条 违约责任
+任何一方违约应赔偿对方因此遭受的损失，保密义务在合同终止后继续有效。
+"""
+
+STANDARD_CLAUSES = [
+    {"category": "售后服务", "item": "响应时间", "standard_text": "乙方应在接到报修后2小时内响应。", "risk_level": "中"},
+    {"category": "售后服务", "item": "到场时间", "standard_text": "乙方应在24小时内到场。", "risk_level": "高"},
+    {"category": "付款", "item": "付款方式", "standard_text": "合同款项分两期支付。", "risk_level": "低"},
+    {"category": "保密", "item": "保密义务", "standard_text": "保密义务在合同终止后三年内有效。", "risk_level": "中"},
+]
+
+PLAN_REQUEST = {
+    "clauses": [
+        {
+            "clauseId": "c1",
+            "clauseType": "onsite_sla",
+            "clauseText": "CT 全保，4小时响应，48小时到场，7x24",
+            "structuredAttributes": {"响应时间": "4小时", "到场时间": "48小时", "覆盖时段": "7x24"},
+        },
+        {
+            "clauseId": "c2",
+            "clauseType": "yearly_maintenance",
+            "clauseText": "每年2次标准保养",
+            "structuredAttributes": {"标准保养次数": "2"},
+        },
+    ],
+    "candidates": [
+        {
+            "planId": f"plan-{tier}",
+            "planName": name,
+            "clauses": [
+                {"category": "响应", "clauseItem": "响应与到场", "requirement": f"{response}小时内响应，{onsite}小时内到场，服务时段7x24"},
+                {"category": "保养", "clauseItem": "标准保养", "requirement": f"每年{pm}次标准保养"},
+            ],
+        }
+        for tier, name, response, onsite, pm in [
+            ("gold", "金牌服务", 2, 24, 4),
+            ("silver", "银牌服务", 4, 48, 2),
+            ("bronze", "铜牌服务", 8, 72, 1),
+        ]
+    ],
+}
+
+EXTRACTION_ENDPOINTS = {
+    "basic_info_extraction": "/api/v1/basic_info_extraction",
+    "training_support_info_extraction": "/api/v1/training_support_info_extraction",
+    "contract_and_compliance_info_extraction": "/api/v1/contract_and_compliance_info_extraction",
+    "after_sales_support_info_extraction": "/api/v1/after_sales_support_info_extraction",
+    "key_spare_parts_info_extraction": "/api/v1/key_spare_parts_info_extraction",
+    "onsite_SLA_extraction": "/api/v1/onsite_SLA_extraction",
+    "yearly_maintenance_info_extraction": "/api/v1/yearly_maintenance_info_extraction",
+    "remote_maintenance_info_extraction": "/api/v1/remote_maintenance_info_extraction",
+}
+
+
+def build_scenarios(pdf_bytes: bytes, contract: str) -> Dict[str, Dict[str, Any]]:
+    """场景名 -> httpx 请求参数"""
+    scenarios: Dict[str, Dict[str, Any]] = {
+        "pdf_to_markdown": {
+            "url": "/api/v1/pdf_to_markdown",
+            "files": {"file": ("contract.pdf", pdf_bytes, "application/pdf")},
+        },
+    }
+    for name, url in EXTRACTION_ENDPOINTS.items():
+        scenarios[name] = {"url": url, "json": {"content": contract}}
+    scenarios["non_standard_detection"] = {
+        "url": "/api/v1/non_standard_detection",
+        "json": {"content": contract, "standard_clauses": STANDARD_CLAUSES},
+    }
+    scenarios["service_plan_recommendation"] = {"url": "/api/v1/service_plan_recommendation", "json": PLAN_REQUEST}
+    return scenarios
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 2)
+
+
+# ---------- 后端进程（--serve-backend）：在 server.app 上附加事件循环延迟与内存探针 ----------
+
+def _children_peak_rss_kb() -> int:
+    """渲染进程池等子进程的峰值 RSS 之和（仅 Linux，读取 /proc）"""
+    total = 0
+    try:
+        tasks = os.listdir("/proc/self/task")
+    except OSError:
+        return 0
+    for tid in tasks:
+        try:
+            with open(f"/proc/self/task/{tid}/children") as f:
+                children = f.read().split()
+        except OSError:
+            continue
+        for pid in children:
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            total += int(line.split()[1])
+            except OSError:
+                continue
+    return total
+
+
+def serve_backend(port: int) -> None:
+    import uvicorn
+
+    import server
+
+    samples: List[float] = []
+    state: Dict[str, Any] = {"monitor": None}
+
+    async def measure_loop_lag(interval: float = 0.01) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            samples.append(max(0.0, loop.time() - expected) * 1000)
+
+    async def probe(reset: bool = False) -> Dict[str, Any]:
+        if state["monitor"] is None:
+            state["monitor"] = asyncio.create_task(measure_loop_lag())
+        ordered = sorted(samples)
+        result = {
+            "loop_lag_ms": {
+                "samples": len(ordered),
+                "p50": _percentile(ordered, 0.5),
+                "p99": _percentile(ordered, 0.99),
+                "max": round(ordered[-1], 2) if ordered else None,
+            },
+            # ru_maxrss 在 Linux 上以 KB 为单位，为进程启动以来的峰值
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "children_peak_rss_mb": round(_children_peak_rss_kb() / 1024, 1),
+        }
+        if reset:
+            samples.clear()
+        return result
+
+    server.app.add_api_route("/benchmark/probe", probe, methods=["GET"], include_in_schema=False)
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ---------- 压测驱动 ----------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"进程已退出（{process.returncode}）: {' '.join(process.args)}")
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"等待 {url} 就绪超时")
+
+
+async def run_level(client, scenario: Dict[str, Any], concurrency: int, total: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = total
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(scenario["url"], json=scenario.get("json"), files=scenario.get("files"))
+                status = str(response.status_code)
+            except Exception as exc:
+                status = type(exc).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    succeeded = statuses.get("200", 0)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "succeeded": succeeded,
+        "statuses": statuses,
+        "wall_time_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+        "success_per_s": round(succeeded / elapsed, 2),
+        "latency_ms": {
+            "p50": _percentile(ordered, 0.5),
+            "p95": _percentile(ordered, 0.95),
+            "p99": _percentile(ordered, 0.99),
+            "max": round(ordered[-1], 2) if ordered else None,
+        },
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    from benchmarks.ocr_render_benchmark import build_fixture_pdf
+
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+    workdir = tempfile.mkdtemp(prefix="load_benchmark_")
+    pdf_path = os.path.join(workdir, "fixture.pdf")
+    build_fixture_pdf(pdf_path, args.pdf_pages)
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    scenarios = build_scenarios(pdf_bytes, CONTRACT_MARKDOWN * max(1, args.contract_repeat))
+    selected = list(scenarios) if args.scenarios == "all" else [name.strip() for name in args.scenarios.split(",")]
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        raise SystemExit(f"未知场景: {', '.join(unknown)}（可选: {', '.join(scenarios)}）")
+
+    stub_port, backend_port = _free_port(), _free_port()
+    stub = subprocess.Popen(
+        [
+            sys.executable, os.path.join(BENCHMARK_DIR, "stub_llm_server.py"),
+            "--port", str(stub_port),
+            "--latency", args.latency,
+            "--vision-latency", args.vision_latency,
+            "--error-rate", str(args.error_rate),
+            "--rate-limit-rate", str(args.rate_limit_rate),
+            *(["--seed", str(args.seed)] if args.seed is not None else []),
+        ],
+        cwd=BACKEND_DIR,
+    )
+    backend_env = {
+        **os.environ,
+        "BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "LLM_CACHE_ENABLED": "false",
+        "OCR_CACHE_ENABLED": "false",
+        "OCR_TEXT_LAYER_ENABLED": "false",
+        "LLM_CACHE_DIR": os.path.join(workdir, "cache"),
+        "JOB_WORKERS": "0",
+        "LLM_HTTP2": "false",
+    }
+    for item in args.backend_env:
+        key, _, value = item.partition("=")
+        backend_env[key] = value
+    backend_log = open(os.path.join(workdir, "backend.log"), "w")
+    backend = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve-backend", "--port", str(backend_port)],
+        cwd=BACKEND_DIR,
+        env=backend_env,
+        stdout=backend_log,
+        stderr=subprocess.STDOUT,
+    )
+
+    results: List[Dict[str, Any]] = []
+    try:
+        await _wait_ready(f"http://127.0.0.1:{stub_port}/stub/stats", stub)
+        await _wait_ready(f"http://127.0.0.1:{backend_port}/benchmark/probe", backend)
+        limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{backend_port}", limits=limits, timeout=args.timeout
+        ) as client:
+            for name in selected:
+                for concurrency in levels:
+                    await client.get("/benchmark/probe", params={"reset": True})
+                    level = await run_level(client, scenarios[name], concurrency, max(concurrency, args.requests))
+                    probe = (await client.get("/benchmark/probe", params={"reset": True})).json()
+                    results.append({"scenario": name, **level, **probe})
+                    print(
+                        f"{name:<42} c={concurrency:<4} {level['requests_per_s']:>8.2f} req/s  "
+                        f"p50={level['latency_ms']['p50']}ms p95={level['latency_ms']['p95']}ms p99={level['latency_ms']['p99']}ms  "
+                        f"lag_p99={probe['loop_lag_ms']['p99']}ms rss={probe['peak_rss_mb']}MB statuses={level['statuses']}",
+                        flush=True,
+                    )
+            stub_stats = httpx.get(f"http://127.0.0.1:{stub_port}/stub/stats").json()
+    finally:
+        for process in (backend, stub):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        backend_log.close()
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {
+            "concurrency": levels,
+            "requests": args.requests,
+            "latency": args.latency,
+            "vision_latency": args.vision_latency,
+            "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate,
+            "pdf_pages": args.pdf_pages,
+            "contract_chars": len(CONTRACT_MARKDOWN) * max(1, args.contract_repeat),
+            "backend_env": args.backend_env,
+        },
+        "stub": stub_stats,
+        "backend_log": os.path.join(workdir, "backend.log"),
+        "results": results,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serve-backend", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--concurrency", default="1,4,16,64", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=64, help="每个并发级别的请求数（不少于并发数）")
+    parser.add_argument("--scenarios", default="all", help="逗号分隔的场景名，默认全部")
+    parser.add_argument("--latency", default="lognormal:0.5,0.3", help="桩模型文本请求延迟分布")
+    parser.add_argument("--vision-latency", default="lognormal:1.0,0.3", help="桩模型视觉请求延迟分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="桩模型返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="桩模型返回 429 的比例")
+    parser.add_argument("--seed", type=int, default=0, help="桩模型随机种子")
+    parser.add_argument("--pdf-pages", type=int, default=5, help="pdf_to_markdown 场景的 PDF 页数")
+    parser.add_argument("--contract-repeat", type=int, default=1, help="合同正文重复次数，用于放大输入")
+    parser.add_argument("--timeout", type=float, default=600.0, help="单个请求的客户端超时（秒）")
+    parser.add_argument("--backend-env", action="append", default=[], metavar="KEY=VALUE", help="覆盖后端环境变量，可重复")
+    parser.add_argument("--output", help="结果写入的 JSON 文件路径")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.serve_backend:
+        serve_backend(arguments.port)
+    else:
+        report = asyncio.run(main(arguments))
+        if arguments.output:
+            os.makedirs(os.path.dirname(os.path.abspath(arguments.output)), exist_ok=True)
+            with open(arguments.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"结果已写入 {arguments.output}")
+        else:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
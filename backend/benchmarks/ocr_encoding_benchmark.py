@@ -0,0 +1,211 @@
+"""页面图片编码基准：对比各编码策略发送给OCR模型的负载字节数与端到端耗时。
+
+用法（在 backend 目录下）：
+    python benchmarks/ocr_encoding_benchmark.py --pages 40 --bandwidth-mbps 20
+
+夹具 PDF 混合了原生文本页、带噪点的扫描页、含彩色印章的页面与 A3 横向图纸页。
+OCR 模型调用被替换为本地桩，延迟 = 固定延迟 + 负载字节数 / 上行带宽，用于模拟图片上传成本；
+页面缓存与文本层快速通道关闭，保证每页都经过渲染与编码。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ.setdefault("OCR_MODEL", "benchmark-ocr")
+os.environ.setdefault("LLM_MODEL", "benchmark-llm")
+
+STRATEGIES = {
+    "png_2x": {"strategy": "png_2x"},
+    "adaptive_auto": {"strategy": "adaptive", "image_format": "auto"},
+    "adaptive_png": {"strategy": "adaptive", "image_format": "png"},
+    "adaptive_jpeg": {"strategy": "adaptive", "image_format": "jpeg"},
+    "adaptive_webp": {"strategy": "adaptive", "image_format": "webp"},
+}
+
+PARAGRAPH = "第{page}条 乙方应在合同生效起30天内根据产品周期安排硬件交付，并提供4小时响应、48小时到场的保修服务。"
+
+
+def _text_page(document, page_num: int) -> None:
+    page = document.new_page()
+    for line in range(40):
+        page.insert_text((72, 80 + line * 17), PARAGRAPH.format(page=page_num + 1)[: 30 + line % 20], fontname="china-s", fontsize=10)
+
+
+def _scanned_page(document, page_num: int) -> None:
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    # 先把文本页渲染为灰度图，再叠加噪点与轻微底色，模拟扫描件
+    source = fitz.open()
+    _text_page(source, page_num)
+    pix = source[0].get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width).astype(np.int16)
+    rng = np.random.default_rng(page_num)
+    pixels = np.clip(pixels - 12 + rng.normal(0, 10, pixels.shape), 0, 255).astype(np.uint8)
+    noisy = fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, pixels.tobytes(), False)
+    page = document.new_page()
+    page.insert_image(page.rect, pixmap=noisy)
+    source.close()
+
+
+def _stamped_page(document, page_num: int) -> None:
+    import fitz  # PyMuPDF
+
+    _text_page(document, page_num)
+    page = document[-1]
+    page.draw_circle((450, 700), 50, color=(0.85, 0.1, 0.1), width=3)
+    page.insert_text((415, 705), "合同专用章", fontname="china-s", fontsize=12, color=(0.85, 0.1, 0.1))
+
+
+def _drawing_page(document, page_num: int) -> None:
+    import fitz  # PyMuPDF
+
+    page = document.new_page(width=1191, height=842)  # A3 横向
+    for col in range(12):
+        for row in range(8):
+            rect = fitz.Rect(60 + col * 88, 60 + row * 88, 130 + col * 88, 130 + row * 88)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.6)
+            page.insert_text((rect.x0 + 4, rect.y0 + 14), f"设备{row * 12 + col + 1}", fontname="china-s", fontsize=7)
+
+
+def build_fixture_pdf(path: str, pages: int) -> dict:
+    import fitz  # PyMuPDF
+
+    builders = [_text_page, _scanned_page, _stamped_page, _drawing_page]
+    composition: dict = {}
+    document = fitz.open()
+    for page_num in range(pages):
+        builder = builders[page_num % len(builders)]
+        builder(document, page_num)
+        composition[builder.__name__.strip("_")] = composition.get(builder.__name__.strip("_"), 0) + 1
+    document.save(path)
+    document.close()
+    return composition
+
+
+class _Response:
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.usage_metadata = None
+
+
+class StubOcrModel:
+    """延迟随图片负载线性增长的OCR模型桩"""
+
+    def __init__(self, model_name: str, latency: float, bytes_per_second: float) -> None:
+        self.model_name = model_name
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+
+    async def ainvoke(self, messages):
+        payload = sum(
+            len(part["image_url"]["url"])
+            for message in messages
+            for part in message["content"]
+            if isinstance(part, dict) and part.get("type") == "image_url"
+        )
+        await asyncio.sleep(self.latency + payload / self.bytes_per_second)
+        return _Response("# 第X条\n乙方应在合同生效起30天内安排硬件交付。")
+
+
+def measure_encoding(pdf_path: str, pages: int, options) -> dict:
+    """在当前进程中逐页编码，统计纯渲染/编码耗时与图片规格"""
+    from service.page_renderer import render_page
+
+    durations, dpis, mime_types = [], [], {}
+    for page_num in range(pages):
+        started = time.perf_counter()
+        rendered = render_page(pdf_path, page_num, options)
+        durations.append((time.perf_counter() - started) * 1000)
+        dpis.append(rendered.dpi)
+        mime_types[rendered.mime_type] = mime_types.get(rendered.mime_type, 0) + 1
+    return {
+        "encode_ms_mean": round(statistics.fmean(durations), 2),
+        "encode_ms_total": round(sum(durations), 1),
+        "dpi_mean": round(statistics.fmean(dpis), 1),
+        "mime_types": mime_types,
+    }
+
+
+async def run_case(name: str, pdf_path: str, pages: int, workers: int, latency: float, bytes_per_second: float) -> dict:
+    from service.page_encoding import EncodingOptions
+    from service.page_renderer import PageRenderer
+    from service.pdf_converter import OcrPdfParser
+
+    options = EncodingOptions(**STRATEGIES[name])
+    parser = OcrPdfParser()
+    parser.llm = StubOcrModel(parser.llm.model_name, latency, bytes_per_second)
+    parser.page_cache.enabled = False
+    parser.text_layer = None
+    parser.encoding = options
+    parser.renderer = PageRenderer(workers=workers)
+
+    started = time.perf_counter()
+    result = await parser.parse_document(pdf_path)
+    elapsed = time.perf_counter() - started
+    parser.close()
+
+    payloads = [page.payload_bytes for page in result.pages]
+    return {
+        "strategy": name,
+        "payload_bytes_total": sum(payloads),
+        "payload_bytes_mean": round(statistics.fmean(payloads)),
+        "payload_bytes_max": max(payloads),
+        "wall_time_s": round(elapsed, 3),
+        **measure_encoding(pdf_path, pages, options),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--ocr-latency", type=float, default=0.2, help="桩OCR模型每页固定延迟（秒）")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0, help="模拟上行带宽（Mbit/s）")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES), help="逗号分隔的策略名")
+    parser.add_argument("--output", help="结果写入的 JSON 文件路径")
+    args = parser.parse_args()
+
+    bytes_per_second = args.bandwidth_mbps * 1_000_000 / 8
+    names = [name.strip() for name in args.strategies.split(",") if name.strip()]
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        parser.error(f"未知策略: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, "fixture.pdf")
+        composition = build_fixture_pdf(pdf_path, args.pages)
+        results = [
+            await run_case(name, pdf_path, args.pages, args.workers, args.ocr_latency, bytes_per_second)
+            for name in names
+        ]
+
+    baseline = next((item for item in results if item["strategy"] == "png_2x"), None)
+    if baseline:
+        for item in results:
+            item["payload_vs_png_2x"] = round(item["payload_bytes_total"] / baseline["payload_bytes_total"], 3)
+
+    report = {
+        "pages": args.pages,
+        "composition": composition,
+        "ocr_latency_s": args.ocr_latency,
+        "bandwidth_mbps": args.bandwidth_mbps,
+        "results": results,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""PDF 渲染基准：对比事件循环内同步渲染与进程池渲染的事件循环延迟和吞吐。
+
+用法（在 backend 目录下）：
+    python benchmarks/ocr_render_benchmark.py --pages 200 --workers 4 --ocr-latency 0.2
+
+OCR 模型调用被替换为固定延迟的本地桩，页面缓存关闭，仅衡量渲染/编码对事件循环的影响。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ.setdefault("OCR_MODEL", "benchmark-ocr")
+os.environ.setdefault("LLM_MODEL", "benchmark-llm")
+
+
+def build_fixture_pdf(path: str, pages: int) -> None:
+    import fitz  # PyMuPDF
+
+    document = fitz.open()
+    paragraph = "第{page}条 乙方应在合同生效起30天内根据产品周期安排硬件交付，并提供4小时响应、48小时到场的保修服务。"
+    for page_num in range(pages):
+        page = document.new_page()
+        for line in range(40):
+            page.insert_text((50, 60 + line * 18), paragraph.format(page=page_num + 1)[: 40 + line % 20], fontname="china-s", fontsize=10)
+        page.draw_rect(fitz.Rect(40, 40, 555, 800), color=(0, 0, 0), width=0.5)
+    document.save(path)
+    document.close()
+
+
+class _Response:
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.usage_metadata = None
+
+
+class StubOcrModel:
+    def __init__(self, model_name: str, latency: float) -> None:
+        self.model_name = model_name
+        self.latency = latency
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.latency)
+        return _Response("# 第X条\n乙方应在合同生效起30天内安排硬件交付。")
+
+
+async def _measure_loop_lag(stop: asyncio.Event, samples: list, interval: float = 0.01) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected) * 1000)
+
+
+async def run_case(pdf_path: str, workers: int, ocr_latency: float) -> dict:
+    from service.pdf_converter import OcrPdfParser
+    from service.page_renderer import PageRenderer
+
+    parser = OcrPdfParser()
+    parser.llm = StubOcrModel(parser.llm.model_name, ocr_latency)
+    parser.page_cache.enabled = False
+    # 夹具为原生文本 PDF，关闭文本层快速通道以保证每页都经过渲染
+    parser.text_layer = None
+    parser.renderer = PageRenderer(workers=workers)
+
+    lag_samples: list = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_measure_loop_lag(stop, lag_samples))
+    started = time.perf_counter()
+    result = await parser.parse_document(pdf_path)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    parser.close()
+
+    lag_samples.sort()
+    return {
+        "mode": "event_loop" if workers <= 0 else f"process_pool[{workers}]",
+        "pages": len(result.pages),
+        "wall_time_s": round(elapsed, 3),
+        "pages_per_s": round(len(result.pages) / elapsed, 2),
+        "loop_lag_ms": {
+            "mean": round(statistics.fmean(lag_samples), 2) if lag_samples else None,
+            "p99": round(lag_samples[int(len(lag_samples) * 0.99) - 1], 2) if lag_samples else None,
+            "max": round(lag_samples[-1], 2) if lag_samples else None,
+        },
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--ocr-latency", type=float, default=0.2, help="桩OCR模型每页延迟（秒）")
+    parser.add_argument("--output", help="结果写入的 JSON 文件路径")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, "fixture.pdf")
+        build_fixture_pdf(pdf_path, args.pages)
+        results = [
+            await run_case(pdf_path, 0, args.ocr_latency),
+            await run_case(pdf_path, args.workers, args.ocr_latency),
+        ]
+
+    report = {"pages": args.pages, "ocr_latency_s": args.ocr_latency, "results": results}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,336 @@
+"""离线 OpenAI 兼容桩服务：用于压测与回归，不消耗真实模型额度。
+
+用法（在 backend 目录下）：
+    python benchmarks/stub_llm_server.py --port 8900 --latency lognormal:0.8,0.4 --vision-latency uniform:1,3 \\
+        --error-rate 0.01 --rate-limit-rate 0.02
+
+然后以 BASE_URL=http://127.0.0.1:8900/v1 启动后端。
+
+- POST /v1/chat/completions：含 image_url 的视觉请求返回固定的合同页面 markdown；
+  其他请求按请求中的 JSON Schema（response_format、tools 或提示词中的输出格式说明）生成一份合法的 JSON 回答，
+  --canned-dir 目录下的 <Schema 标题>.json 优先（如 BasicInfoExtractionResult.json）。
+- 延迟分布：fixed:秒、uniform:最小,最大、lognormal:中位数,sigma。
+- 按比例注入 500 错误与带 Retry-After 的 429。
+- stream=true 时以 SSE 分块返回（每块 --stream-chunk-chars 个字符，间隔 --stream-interval 秒），
+  stream_options.include_usage 为 true 时最后附带用量块。
+- GET /stub/stats 返回各类请求与注入错误的计数。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PAGE_MARKDOWN = """## 第三条 售后服务
+
+| 服务项目 | 服务要求 |
+| --- | --- |
+| 响应时间 | 接到报修后4小时内响应 |
+| 到场时间 | 48小时内工程师到场 |
+| 标准保养 | 每年2次标准保养 |
+
+乙方应在合同生效起30天内安排硬件交付，并提供为期12个月的保修服务。"""
+
+_SCHEMA_BLOCK = re.compile(r"```(?:json)?\s*(\{.*\})\s*```", re.S)
+
+
+def parse_latency(spec: str) -> Tuple[str, List[float]]:
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+    if kind not in expected or len(values) != expected[kind]:
+        raise argparse.ArgumentTypeError(f"无效的延迟分布: {spec}（fixed:秒 / uniform:最小,最大 / lognormal:中位数,sigma）")
+    return kind, values
+
+
+def sample_latency(distribution: Tuple[str, List[float]], rng: random.Random) -> float:
+    kind, values = distribution
+    if kind == "fixed":
+        return values[0]
+    if kind == "uniform":
+        return rng.uniform(values[0], values[1])
+    median, sigma = values
+    return median * rng.lognormvariate(0.0, sigma)
+
+
+def sample_from_schema(schema: Dict[str, Any], root: Optional[Dict[str, Any]] = None, depth: int = 0) -> Any:
+    """按 JSON Schema 生成一份最小但合法的实例：可选字段也填写，数组给一个元素，枚举取第一个值"""
+    root = root or schema
+    if "$ref" in schema:
+        name = schema["$ref"].split("/")[-1]
+        definitions = root.get("$defs") or root.get("definitions") or {}
+        return sample_from_schema(definitions.get(name, {}), root, depth + 1)
+    if "default" in schema and schema["default"] is not None:
+        return schema["default"]
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return schema["enum"][0]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"]
+            return sample_from_schema(options[0], root, depth + 1) if options else None
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((item for item in kind if item != "null"), None)
+    if kind == "object" or "properties" in schema:
+        if depth > 8:
+            return {}
+        return {name: sample_from_schema(prop, root, depth + 1) for name, prop in (schema.get("properties") or {}).items()}
+    if kind == "array":
+        count = max(1, schema.get("minItems", 1)) if depth <= 8 else 0
+        return [sample_from_schema(schema.get("items") or {}, root, depth + 1) for _ in range(count)]
+    if kind == "integer":
+        return max(1, schema.get("minimum", 1))
+    if kind == "number":
+        return float(max(1, schema.get("minimum", 1)))
+    if kind == "boolean":
+        return True
+    if kind == "string":
+        if schema.get("format") == "date":
+            return "2025-01-01"
+        if schema.get("format") == "date-time":
+            return "2025-01-01T00:00:00"
+        return "示例"
+    return None
+
+
+def _text_parts(messages: List[Dict[str, Any]]) -> Tuple[str, bool]:
+    texts, vision = [], False
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "image_url":
+                vision = True
+            elif part.get("type") == "text":
+                texts.append(part.get("text", ""))
+    return "\n".join(texts), vision
+
+
+def request_schema(body: Dict[str, Any], prompt: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """返回 (JSON Schema, 回答方式)：json_schema / tool / text"""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        json_schema = response_format["json_schema"]
+        return {"title": json_schema.get("name"), **(json_schema.get("schema") or {})}, "json_schema"
+    if body.get("tools"):
+        function = body["tools"][0]["function"]
+        return {"title": function["name"], **function.get("parameters", {})}, "tool"
+    # text 方式：PydanticOutputParser 的输出格式说明中以代码块给出 JSON Schema
+    for block in reversed(_SCHEMA_BLOCK.findall(prompt)):
+        try:
+            return json.loads(block), "text"
+        except ValueError:
+            continue
+    return None, "text"
+
+
+@dataclass
+class StubConfig:
+    latency: Tuple[str, List[float]] = ("fixed", [0.5])
+    vision_latency: Tuple[str, List[float]] = ("fixed", [1.0])
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    canned_dir: Optional[str] = None
+    seed: Optional[int] = None
+    stream_chunk_chars: int = 16
+    stream_interval: float = 0.01
+    canned: Dict[str, Any] = field(default_factory=dict)
+
+    def load_canned(self) -> None:
+        if not self.canned_dir:
+            return
+        for name in os.listdir(self.canned_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(self.canned_dir, name), encoding="utf-8") as f:
+                    self.canned[name[: -len(".json")]] = json.load(f)
+
+    def canned_answer(self, schema: Dict[str, Any]) -> Any:
+        """按 Schema 标题查找；text 方式的输出格式说明不含标题，改按字段集合匹配"""
+        if schema.get("title") in self.canned:
+            return self.canned[schema["title"]]
+        return next((answer for answer in self.canned.values() if _shape_matches(answer, schema, schema)), None)
+
+
+def _shape_matches(answer: Any, schema: Dict[str, Any], root: Dict[str, Any]) -> bool:
+    """顶层字段集合相同，且对象数组的首个元素字段与元素 Schema 相同（多个抽取器的输出都只有 item_list）"""
+    properties = schema.get("properties") or {}
+    if not isinstance(answer, dict) or set(answer) != set(properties):
+        return False
+    for name, prop in properties.items():
+        items = prop.get("items") or {}
+        if "$ref" in items:
+            definitions = root.get("$defs") or root.get("definitions") or {}
+            items = definitions.get(items["$ref"].split("/")[-1], {})
+        value = answer[name]
+        if items.get("properties") and isinstance(value, list) and value and not _shape_matches(value[0], items, root):
+            return False
+    return True
+
+
+def _completion(model: str, message: Dict[str, Any], prompt_chars: int) -> Dict[str, Any]:
+    completion_tokens = len(json.dumps(message, ensure_ascii=False)) // 2
+    prompt_tokens = prompt_chars // 2 + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _stream_chunks(completion: Dict[str, Any], chunk_chars: int, include_usage: bool) -> List[Dict[str, Any]]:
+    """把完整回答拆成 chat.completion.chunk 序列：文本按字符切分，工具调用先给名称再分段给参数"""
+    message = completion["choices"][0]["message"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+
+    def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    step = max(1, chunk_chars)
+    chunks = [chunk({"role": "assistant", "content": ""})]
+    if message.get("tool_calls"):
+        call = message["tool_calls"][0]
+        arguments = call["function"]["arguments"]
+        chunks.append(chunk({"tool_calls": [{"index": 0, "id": call["id"], "type": "function", "function": {"name": call["function"]["name"], "arguments": ""}}]}))
+        chunks.extend(
+            chunk({"tool_calls": [{"index": 0, "function": {"arguments": arguments[i:i + step]}}]})
+            for i in range(0, len(arguments), step)
+        )
+    else:
+        content = message.get("content") or ""
+        chunks.extend(chunk({"content": content[i:i + step]}) for i in range(0, len(content), step))
+    chunks.append(chunk({}, completion["choices"][0]["finish_reason"]))
+    if include_usage:
+        chunks.append({**base, "choices": [], "usage": completion["usage"]})
+    return chunks
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="OpenAI compatible stub")
+    rng = random.Random(config.seed)
+    counts: Counter = Counter()
+    config.load_canned()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt, vision = _text_parts(body.get("messages", []))
+        counts["vision" if vision else "chat"] += 1
+        await asyncio.sleep(sample_latency(config.vision_latency if vision else config.latency, rng))
+
+        draw = rng.random()
+        if draw < config.rate_limit_rate:
+            counts["injected_429"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": str(config.retry_after)},
+            )
+        if draw < config.rate_limit_rate + config.error_rate:
+            counts["injected_500"] += 1
+            return JSONResponse(status_code=500, content={"error": {"message": "Internal error (stub)", "type": "server_error"}})
+
+        if vision:
+            message = {"role": "assistant", "content": PAGE_MARKDOWN}
+        else:
+            schema, mode = request_schema(body, prompt)
+            if schema is None:
+                counts["plain"] += 1
+                message = {"role": "assistant", "content": "{}"}
+            else:
+                title = schema.get("title", "")
+                answer = config.canned_answer(schema)
+                if answer is None:
+                    answer = sample_from_schema(schema)
+                counts[f"schema:{title or 'untitled'}"] += 1
+                arguments = json.dumps(answer, ensure_ascii=False)
+                if mode == "tool":
+                    message = {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [{
+                            "id": f"call_{uuid.uuid4().hex[:12]}",
+                            "type": "function",
+                            "function": {"name": title, "arguments": arguments},
+                        }],
+                    }
+                else:
+                    message = {"role": "assistant", "content": arguments}
+        completion = _completion(body.get("model", "stub"), message, len(prompt))
+        if not body.get("stream"):
+            return completion
+
+        counts["streamed"] += 1
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def events():
+            for index, chunk in enumerate(_stream_chunks(completion, config.stream_chunk_chars, include_usage)):
+                if index and config.stream_interval > 0:
+                    await asyncio.sleep(config.stream_interval)
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+    @app.get("/stub/stats")
+    async def stats():
+        return dict(counts)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=parse_latency, default="fixed:0.5", help="文本请求延迟分布")
+    parser.add_argument("--vision-latency", type=parse_latency, default="fixed:1.0", help="视觉（OCR）请求延迟分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--canned-dir", help="按 Schema 标题命名的固定回答 JSON 文件目录")
+    parser.add_argument("--seed", type=int, help="随机种子，固定后延迟与错误注入可复现")
+    parser.add_argument("--stream-chunk-chars", type=int, default=16, help="流式响应每块的字符数")
+    parser.add_argument("--stream-interval", type=float, default=0.01, help="流式响应块之间的间隔（秒）")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StubConfig(
+        latency=args.latency,
+        vision_latency=args.vision_latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        canned_dir=args.canned_dir,
+        seed=args.seed,
+        stream_chunk_chars=args.stream_chunk_chars,
+        stream_interval=args.stream_interval,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
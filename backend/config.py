@@ -8,5 +8,152 @@ API_BASE_URL = os.getenv("BASE_URL")
 
 LLM_MODEL = os.getenv("LLM_MODEL")
 OCR_MODEL = os.getenv("OCR_MODEL")
+# OCR 模型部署在其他上游时单独配置，默认与 LLM 相同
+OCR_BASE_URL = os.getenv("OCR_BASE_URL") or API_BASE_URL
+OCR_API_KEY = os.getenv("OCR_API_KEY") or API_KEY
 
-PORT = os.getenv("PORT")
\ No newline at end of file
+PORT = os.getenv("PORT")
+
+# 一次性合同分析流程中，所有 LLM 节点共享的最大并发数
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "8"))
+
+# LLM 结果缓存（内存 LRU + sqlite/zstd 磁盘缓存）
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".cache")
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "256"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# 请求头取值为 bypass / no-cache 时跳过读缓存
+LLM_CACHE_BYPASS_HEADER = os.getenv("LLM_CACHE_BYPASS_HEADER", "X-LLM-Cache")
+
+# 页面级OCR结果缓存（与LLM结果缓存共用 LLM_CACHE_DIR 目录）
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# 全局 LLM 准入控制：按模型限制并发与每分钟 token 数（0 表示不限制），
+# 排队深度超过阈值时直接返回 503 + Retry-After
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "64"))
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "8"))
+OCR_TOKENS_PER_MINUTE = int(os.getenv("OCR_TOKENS_PER_MINUTE", "0"))
+OCR_MAX_QUEUE_DEPTH = int(os.getenv("OCR_MAX_QUEUE_DEPTH", "1000"))
+
+# PDF 页面渲染进程池大小（0 表示在事件循环中同步渲染），以及最多预先渲染、等待OCR的页数
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_RENDER_PREFETCH_PAGES = int(os.getenv("PDF_RENDER_PREFETCH_PAGES", "32"))
+
+# 原生文本页面快速通道：文本层字符数不少于阈值、图片面积占比不超过阈值的页面不再调用OCR模型
+OCR_TEXT_LAYER_ENABLED = os.getenv("OCR_TEXT_LAYER_ENABLED", "true").lower() in ("1", "true", "yes")
+OCR_TEXT_LAYER_MIN_CHARS = int(os.getenv("OCR_TEXT_LAYER_MIN_CHARS", "50"))
+OCR_TEXT_LAYER_MAX_IMAGE_RATIO = float(os.getenv("OCR_TEXT_LAYER_MAX_IMAGE_RATIO", "0.3"))
+
+# 页面图片编码策略：png_2x（固定2倍彩色PNG）/ adaptive（裁剪留白、按尺寸与密度选DPI、无彩色时灰度）
+# OCR_IMAGE_FORMAT 仅对 adaptive 生效：auto / png / jpeg / webp
+OCR_IMAGE_STRATEGY = os.getenv("OCR_IMAGE_STRATEGY", "png_2x")
+OCR_IMAGE_FORMAT = os.getenv("OCR_IMAGE_FORMAT", "auto")
+OCR_IMAGE_MAX_SIDE = int(os.getenv("OCR_IMAGE_MAX_SIDE", "2000"))
+OCR_IMAGE_JPEG_QUALITY = int(os.getenv("OCR_IMAGE_JPEG_QUALITY", "85"))
+
+# PDF 上传大小上限（字节），在接收请求体的过程中检查，0 表示不限制
+PDF_UPLOAD_MAX_BYTES = int(os.getenv("PDF_UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# 结构化输出方式：text（提示词附带格式说明并解析文本）/ json_schema（response_format）/ function_calling（工具调用）
+# LLM_STRUCTURED_OUTPUT 为默认方式，LLM_STRUCTURED_OUTPUT_MODELS 按模型覆盖，例如 "gpt-4o=json_schema,qwen-max=function_calling"
+# 模型不支持所选方式时自动退回 text
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "text")
+LLM_STRUCTURED_OUTPUT_MODELS = os.getenv("LLM_STRUCTURED_OUTPUT_MODELS", "")
+
+# 章节路由：按抽取类型只发送相关章节（标题/第X条/表格），结构不足或命中不充分时退回全文
+# SECTION_ROUTING_RULES_FILE 可指定 JSON 文件覆盖各抽取类型的关键词规则
+SECTION_ROUTING_ENABLED = os.getenv("SECTION_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+SECTION_ROUTING_RULES_FILE = os.getenv("SECTION_ROUTING_RULES_FILE", "")
+SECTION_ROUTING_MAX_RATIO = float(os.getenv("SECTION_ROUTING_MAX_RATIO", "0.8"))
+SECTION_ROUTING_MIN_SECTIONS = int(os.getenv("SECTION_ROUTING_MIN_SECTIONS", "3"))
+
+# 分片抽取：item_list 类抽取的输入超过该字符数时，按章节/表格切分为多个分片并行抽取后合并
+CHUNKED_EXTRACTION_MAX_CHARS = int(os.getenv("CHUNKED_EXTRACTION_MAX_CHARS", "30000"))
+CHUNKED_EXTRACTION_OVERLAP_CHARS = int(os.getenv("CHUNKED_EXTRACTION_OVERLAP_CHARS", "800"))
+CHUNKED_EXTRACTION_MAX_PARALLEL = int(os.getenv("CHUNKED_EXTRACTION_MAX_PARALLEL", "4"))
+
+# 非标准条款检测方式：single（全部标准条款一次调用）/ per_category（按类别拆分并行调用）/ auto（条款数不少于阈值时按类别拆分）
+NON_STANDARD_DETECTION_MODE = os.getenv("NON_STANDARD_DETECTION_MODE", "auto")
+NON_STANDARD_PER_CATEGORY_MIN_CLAUSES = int(os.getenv("NON_STANDARD_PER_CATEGORY_MIN_CLAUSES", "20"))
+NON_STANDARD_CATEGORY_MAX_PARALLEL = int(os.getenv("NON_STANDARD_CATEGORY_MAX_PARALLEL", "4"))
+
+# 已注册的标准条款集（按内容哈希存储），以及内存中保留的预编译条款集数量
+CLAUSE_SET_DB_PATH = os.getenv("CLAUSE_SET_DB_PATH", os.path.join(LLM_CACHE_DIR, "clause_sets.sqlite3"))
+CLAUSE_SET_MEMORY_ITEMS = int(os.getenv("CLAUSE_SET_MEMORY_ITEMS", "64"))
+
+# 原文片段定位：把 original_contract_snippet / contract_snippet 定位到合同原文的字符偏移，
+# 忽略空白与标点后仍不一致时做近似匹配，相似度不低于阈值时替换为合同原文
+SNIPPET_LOCATOR_ENABLED = os.getenv("SNIPPET_LOCATOR_ENABLED", "true").lower() in ("1", "true", "yes")
+SNIPPET_MIN_SIMILARITY = float(os.getenv("SNIPPET_MIN_SIMILARITY", "0.8"))
+
+# 服务计划推荐：本地按关键字段为候选计划打分，只把得分最高的若干计划发送给模型；
+# 至少有 N 个关键字段与唯一一个计划完全一致的条款直接按规则匹配，不调用模型
+SERVICE_PLAN_SHORTLIST_SIZE = int(os.getenv("SERVICE_PLAN_SHORTLIST_SIZE", "3"))
+SERVICE_PLAN_EXACT_MIN_ATTRIBUTES = int(os.getenv("SERVICE_PLAN_EXACT_MIN_ATTRIBUTES", "2"))
+
+# 已注册的服务计划目录（按内容哈希存储，预先解析关键字段并渲染提示词），以及批量推荐的并发合同数
+PLAN_CATALOG_DB_PATH = os.getenv("PLAN_CATALOG_DB_PATH", os.path.join(LLM_CACHE_DIR, "plan_catalogs.sqlite3"))
+PLAN_CATALOG_MEMORY_ITEMS = int(os.getenv("PLAN_CATALOG_MEMORY_ITEMS", "16"))
+SERVICE_PLAN_BATCH_MAX_PARALLEL = int(os.getenv("SERVICE_PLAN_BATCH_MAX_PARALLEL", "4"))
+
+# 异步任务：sqlite 持久化任务队列与检查点（按阶段、按页），进程重启后从检查点继续
+# JOB_WORKERS 为 API 进程内的工作协程数，0 表示只由独立的 worker.py 进程执行；执行中的任务超过租约未续期时视为中断，重新排队
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(LLM_CACHE_DIR, "jobs.sqlite3"))
+JOB_DATA_DIR = os.getenv("JOB_DATA_DIR", os.path.join(LLM_CACHE_DIR, "job_inputs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# 模型调用的 HTTP 连接池：同一上游（BASE_URL）的所有角色共用一个连接池，保持长连接；
+# 安装 h2 且上游支持时使用 HTTP/2（TLS ALPN 协商），否则为 HTTP/1.1
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "64"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "32"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+LLM_HTTP_READ_TIMEOUT = float(os.getenv("LLM_HTTP_READ_TIMEOUT", "300"))
+LLM_HTTP_POOL_TIMEOUT = float(os.getenv("LLM_HTTP_POOL_TIMEOUT", "30"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# 模型调用超时与重试：单次调用超时不含排队时间；超时、限流、5xx、连接错误按带抖动的指数退避重试
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "180"))
+OCR_CALL_TIMEOUT_SECONDS = float(os.getenv("OCR_CALL_TIMEOUT_SECONDS", "90"))
+LLM_RETRY_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "1"))
+LLM_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_MAX_SECONDS", "20"))
+
+# OCR 对冲请求：页面调用超过近期耗时的分位数（样本不少于 OCR_HEDGE_MIN_SAMPLES，且不短于最小延迟）仍未返回时，
+# 在有空闲并发额度时再发一次相同请求，取先成功返回的结果
+OCR_HEDGE_ENABLED = os.getenv("OCR_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+OCR_HEDGE_QUANTILE = float(os.getenv("OCR_HEDGE_QUANTILE", "0.95"))
+OCR_HEDGE_MIN_SAMPLES = int(os.getenv("OCR_HEDGE_MIN_SAMPLES", "20"))
+OCR_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("OCR_HEDGE_MIN_DELAY_SECONDS", "2"))
+
+# 端到端截止时间：取请求头 REQUEST_TIMEOUT_HEADER（秒）或默认值（0 表示不限制），排队与所有模型调用（含重试）都不超过该时间
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "0"))
+REQUEST_TIMEOUT_HEADER = os.getenv("REQUEST_TIMEOUT_HEADER", "X-Request-Timeout")
+
+# token 预检与用量统计：调用前用 tiktoken 计算输入 token（编码名为空时按模型名推断，为 heuristic 或无法加载时按字符数估算），
+# 输入加预留输出超过上下文窗口时直接拒绝；配置了长上下文模型时改用该模型
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "")
+# 长文本的 token 数按内容哈希缓存（同一份合同正文会在多次调用中重复计数）；
+# 输入总字符数超过 TOKENIZER_OFFLOAD_CHARS 且未命中缓存时在线程池中计算，不阻塞事件循环
+TOKENIZER_CACHE_ITEMS = int(os.getenv("TOKENIZER_CACHE_ITEMS", "1024"))
+TOKENIZER_OFFLOAD_CHARS = int(os.getenv("TOKENIZER_OFFLOAD_CHARS", "20000"))
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "131072"))
+OCR_CONTEXT_TOKENS = int(os.getenv("OCR_CONTEXT_TOKENS", "32768"))
+LLM_OUTPUT_TOKEN_RESERVE = int(os.getenv("LLM_OUTPUT_TOKEN_RESERVE", "4096"))
+LLM_LONG_CONTEXT_MODEL = os.getenv("LLM_LONG_CONTEXT_MODEL", "")
+LLM_LONG_CONTEXT_TOKENS = int(os.getenv("LLM_LONG_CONTEXT_TOKENS", "1000000"))
+TOKEN_USAGE_HEADER = os.getenv("TOKEN_USAGE_HEADER", "X-Token-Usage")
+
+# 模型调用录制/回放：record 时把每次成功调用的响应（含 token 用量与耗时）追加写入 LLM_CASSETTE_PATH（JSONL），
+# replay 时直接返回录制的响应、不访问模型（先按完整请求匹配，提示词或 Schema 变化后按接口、阶段与非系统消息内容匹配）；
+# LLM_CASSETTE_REPLAY_LATENCY 为 true 时回放按录制耗时等待
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", os.path.join(LLM_CACHE_DIR, "llm_cassette.jsonl"))
+LLM_CASSETTE_REPLAY_LATENCY = os.getenv("LLM_CASSETTE_REPLAY_LATENCY", "false").lower() in ("1", "true", "yes")
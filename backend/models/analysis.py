@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+from models.compliance import CategoryTiming, LlmAnalysisResult, StandardClauses
+from models.ocr import OcrCacheStats
+from models.usage import TokenUsage
+from models.service_plan import (
+    AfterSalesSupportInfoModel,
+    BasicInfoExtractionResult,
+    ContractAndComplianceInfoExtractionResult,
+    DetectorEcgWarrantyLLMOutput,
+    RemoteMaintenanceLLMOutput,
+    ResponseArrivalLLMOutput,
+    TrainingLLMOutput,
+    YearlyMaintenanceLLMOutput,
+)
+
+
+# requests
+class ContractAnalysisRequest(BaseModel):
+    content: str
+    standard_clauses: Optional[List[StandardClauses]] = Field(None, description="标准条款，为空时跳过非标准条款检测")
+    clause_set_id: Optional[str] = Field(None, description="已注册的标准条款集ID，提供时忽略 standard_clauses")
+    extractors: Optional[List[str]] = Field(
+        None,
+        description="需要执行的抽取类型，为空时执行全部",
+        example=["onsite_sla", "yearly_maintenance", "training_support"],
+    )
+
+
+## 输出model
+class AnalysisNodeTiming(BaseModel):
+    node: str = Field(..., description="节点名称")
+    status: str = Field(..., description="节点状态：success / failed / skipped")
+    error: Optional[str] = Field(None, description="失败或跳过原因")
+    started_ms: float = Field(..., description="相对流程开始的启动时间（毫秒）")
+    duration_ms: float = Field(..., description="节点执行耗时（毫秒）")
+    restored: bool = Field(False, description="是否从异步任务检查点恢复（未重新执行）")
+    usage: Optional[TokenUsage] = Field(None, description="节点内模型调用的 token 用量，跳过或恢复的节点为空")
+
+
+class ContractAnalysisResult(BaseModel):
+    markdown: Optional[str] = Field(None, description="PDF 输入时的 OCR 结果")
+    ocr_cache: Optional[OcrCacheStats] = Field(None, description="PDF 输入时的页面OCR缓存命中情况")
+    basic_info: Optional[BasicInfoExtractionResult] = None
+    training_support: Optional[TrainingLLMOutput] = None
+    contract_and_compliance: Optional[ContractAndComplianceInfoExtractionResult] = None
+    after_sales_support: Optional[AfterSalesSupportInfoModel] = None
+    key_spare_parts: Optional[DetectorEcgWarrantyLLMOutput] = None
+    onsite_sla: Optional[ResponseArrivalLLMOutput] = None
+    yearly_maintenance: Optional[YearlyMaintenanceLLMOutput] = None
+    remote_maintenance: Optional[RemoteMaintenanceLLMOutput] = None
+    non_standard_detection: Optional[LlmAnalysisResult] = None
+    non_standard_category_timings: List[CategoryTiming] = Field(default_factory=list, description="非标准条款按类别检测时各类别的耗时")
+    timings: List[AnalysisNodeTiming] = Field(default_factory=list, description="各节点耗时")
+    usage: Optional[TokenUsage] = Field(None, description="本次分析全部模型调用的 token 用量")
+    total_ms: float = Field(..., description="流程总耗时（毫秒）")
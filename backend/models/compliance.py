@@ -1,6 +1,9 @@
 from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
 from enum import Enum
-from typing import List, Optional
+from typing import List, Literal, Optional
+
+from models.snippet import SnippetLocation
 
 
 # basic types
@@ -14,6 +17,13 @@ class StandardClauses(BaseModel):
 class NonStandardDetectionRequest(BaseModel):
     content: str
     standard_clauses: Optional[List[StandardClauses]] = Field(None, description="标准条款")
+    clause_set_id: Optional[str] = Field(None, description="已注册的标准条款集ID，提供时忽略 standard_clauses")
+    mode: Optional[Literal["single", "per_category"]] = Field(None, description="检测方式，为空时按配置 NON_STANDARD_DETECTION_MODE 决定")
+
+class ClauseSetRegisterRequest(BaseModel):
+    name: Optional[str] = Field(None, description="条款集名称")
+    version: Optional[str] = Field(None, description="条款集版本")
+    standard_clauses: List[StandardClauses] = Field(..., min_length=1, description="标准条款")
 
 
 ## 输出model
@@ -45,6 +55,7 @@ class ExtractedClause(BaseModel):
     clause_category: str = Field(..., description="条款所属类别", example = "交付与运输")
     clause_item: str = Field(..., description="具体条款项", example = "交付期")
     contract_snippet: str = Field(..., description="该条款中最能体现约束的原文片段")
+    snippet_location: SkipJsonSchema[Optional[SnippetLocation]] = Field(None, description="原文片段在合同中的位置（服务端定位，不要求模型输出）")
     standard_reference: StandardReference = Field(..., description="标准文本的来源")
     compliance: Compliance = Field(..., description="条款的合规情况")
     risk: Risk = Field(..., description="条款的风险情况")
@@ -56,3 +67,27 @@ class MissingStandardItem(BaseModel):
 
 class LlmAnalysisResult(BaseModel):
     extracted_clauses: List[ExtractedClause] = Field(..., description="抽取的条款")
+
+
+class CategoryTiming(BaseModel):
+    category: str = Field(..., description="条款所属类别")
+    clause_count: int = Field(..., description="该类别的标准条款数")
+    extracted_count: int = Field(0, description="该类别返回的条款数（去重前）")
+    status: str = Field(..., description="success / failed")
+    error: Optional[str] = Field(None, description="失败原因")
+    started_ms: float = Field(..., description="相对检测开始的启动时间（毫秒）")
+    duration_ms: float = Field(..., description="该类别调用耗时（毫秒）")
+
+class NonStandardDetectionReport(BaseModel):
+    mode: Literal["single", "per_category"] = Field(..., description="实际使用的检测方式")
+    result: LlmAnalysisResult
+    category_timings: List[CategoryTiming] = Field(default_factory=list, description="按类别检测时各类别的耗时")
+
+class ClauseSetInfo(BaseModel):
+    id: str = Field(..., description="条款集ID（条款内容哈希），内容相同的条款集ID相同")
+    name: Optional[str] = Field(None, description="条款集名称（以首次注册为准）")
+    version: Optional[str] = Field(None, description="条款集版本（以首次注册为准）")
+    clause_count: int = Field(..., description="去重后的条款数")
+    categories: List[str] = Field(..., description="条款所属类别")
+    created_at: float = Field(..., description="首次注册时间（Unix 时间戳）")
+    created: bool = Field(False, description="本次请求是否新注册")
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+
+JobKind = Literal["pdf_to_markdown", "contract_analysis", "non_standard_detection", "service_plan_recommendation"]
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+
+
+# requests
+class JobCreateRequest(BaseModel):
+    kind: JobKind = Field(..., description="任务类型；pdf_to_markdown 以及 PDF 输入的 contract_analysis 请使用 /api/v1/jobs/pdf 上传文件")
+    payload: Dict[str, Any] = Field(
+        ...,
+        description="与同步接口相同的请求体：contract_analysis → ContractAnalysisRequest，"
+        "non_standard_detection → NonStandardDetectionRequest，service_plan_recommendation → ServicePlanRecommendationRequest",
+    )
+
+
+## 输出model
+class JobProgress(BaseModel):
+    stages_completed: List[str] = Field(default_factory=list, description="已保存检查点的阶段（分析流程节点名）")
+    pages_completed: int = Field(0, description="已保存检查点的OCR页数")
+    page_count: Optional[int] = Field(None, description="PDF 总页数（PDF 输入时）")
+
+
+class JobInfo(BaseModel):
+    id: str = Field(..., description="任务ID")
+    kind: JobKind = Field(..., description="任务类型")
+    status: JobStatus = Field(..., description="任务状态：queued / running / succeeded / failed / cancelled")
+    attempts: int = Field(0, description="已开始执行的次数（进程中断后重新执行会累加）")
+    cancel_requested: bool = Field(False, description="是否已请求取消（执行中的任务会在下一次心跳时停止）")
+    created_at: float = Field(..., description="提交时间（Unix 时间戳）")
+    started_at: Optional[float] = Field(None, description="首次开始执行时间")
+    finished_at: Optional[float] = Field(None, description="结束时间")
+    progress: JobProgress = Field(default_factory=JobProgress, description="检查点进度")
+    result: Optional[Any] = Field(None, description="任务结果，与对应同步接口的响应相同（仅 succeeded）")
+    error: Optional[str] = Field(None, description="失败原因")
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import Dict, List
+from pydantic import BaseModel, Field
+
+
+class OcrPageSummary(BaseModel):
+    page_number: int = Field(..., description="页码，从1开始")
+    source: str = Field("ocr", description="处理路径：ocr（视觉模型识别）/ text_layer（直接读取PDF文本层）")
+    cache_hit: bool = Field(False, description="是否命中页面OCR缓存")
+    latency_ms: float = Field(0.0, description="该页处理耗时（毫秒）")
+    payload_bytes: int = Field(0, description="该页发送给OCR模型的图片 base64 字节数（文本层页面为0）")
+
+
+class OcrPageResult(OcrPageSummary):
+    markdown: str = Field(..., description="该页识别出的markdown内容")
+
+
+class OcrCacheStats(BaseModel):
+    hits: int = Field(0, description="命中缓存的页数")
+    misses: int = Field(0, description="实际调用OCR模型的页数")
+
+
+class OcrDocumentResult(BaseModel):
+    pages: List[OcrPageResult] = Field(default_factory=list, description="按页码排序的逐页结果")
+
+    @property
+    def markdown(self) -> str:
+        return "\n".join(page.markdown for page in self.pages)
+
+    @property
+    def cache(self) -> OcrCacheStats:
+        ocr_pages = [page for page in self.pages if page.source == "ocr"]
+        hits = sum(1 for page in ocr_pages if page.cache_hit)
+        return OcrCacheStats(hits=hits, misses=len(ocr_pages) - hits)
+
+    @property
+    def sources(self) -> Dict[str, int]:
+        return dict(Counter(page.source for page in self.pages))
+
+    @property
+    def payload_bytes(self) -> int:
+        return sum(page.payload_bytes for page in self.pages)
+
+    def to_response(self) -> "PdfToMarkdownResult":
+        return PdfToMarkdownResult(
+            markdown=self.markdown,
+            cache=self.cache,
+            sources=self.sources,
+            payload_bytes=self.payload_bytes,
+            pages=[OcrPageSummary(**page.model_dump(exclude={"markdown"})) for page in self.pages],
+        )
+
+
+class PdfToMarkdownResult(BaseModel):
+    markdown: str
+    cache: OcrCacheStats
+    sources: Dict[str, int] = Field(default_factory=dict, description="各处理路径的页数")
+    payload_bytes: int = Field(0, description="发送给OCR模型的图片负载总字节数")
+    pages: List[OcrPageSummary] = Field(default_factory=list, description="逐页处理路径与耗时")
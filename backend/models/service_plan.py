@@ -3,6 +3,9 @@ from __future__ import annotations
 from enum import Enum
 from typing import Dict, List, Optional
 from pydantic import BaseModel, Field, ConfigDict
+from pydantic.json_schema import SkipJsonSchema
+
+from models.snippet import SnippetLocation
 
 
 # =============== Enums（str） ===============
@@ -40,6 +43,7 @@ class ResponseArrivalParams(BaseModel):
     on_site_time_hours: Optional[float] = Field(..., description="到场时间（小时）")
     coverage: str = Field("24x7", description="服务覆盖时段", example="周一至周五8:30至17:30, 国家法定假日除外")
     original_contract_snippet: str = Field(..., description="原始合同片段，原文摘录一定要与原文保持一致，不要做任何修改，也**不得对标点符号、空格或格式做任何修改**。")
+    snippet_location: SkipJsonSchema[Optional[SnippetLocation]] = Field(None, description="原文片段在合同中的位置（服务端定位，不要求模型输出）")
     devices_info: List[DeviceInfoModel] = Field(..., description="所有符合该维修服务SLA的设备信息列表")
 
 class ResponseArrivalLLMOutput(BaseModel):
@@ -74,6 +78,7 @@ class YearlyMaintenanceParams(BaseModel):
     deliverables: Optional[str] = Field(None, description="交付物与报告", example="保养报告、质控记录")
     scheduling: Optional[str] = Field(None, description="排期与提前期", example="提前7日沟通，年度固定窗口")
     original_contract_snippet: str = Field(..., description="原始合同片段，原文摘录一定要与原文保持一致，不要做任何修改，也**不得对标点符号、空格或格式做任何修改**。")
+    snippet_location: SkipJsonSchema[Optional[SnippetLocation]] = Field(None, description="原文片段在合同中的位置（服务端定位，不要求模型输出）")
     devices_info: List[DeviceInfoModel] = Field(..., description="所有符合该年度保养协议的设备信息列表")
 
 
@@ -111,6 +116,7 @@ class RemoteMaintenanceParams(BaseModel):
         None, description="报告类型（IPM/usage/alarms/maintenance-log 等）"
     )
     original_contract_snippet: str = Field(..., description="原始合同片段，原文摘录一定要与原文保持一致，不要做任何修改，也**不得对标点符号、空格或格式做任何修改**。")
+    snippet_location: SkipJsonSchema[Optional[SnippetLocation]] = Field(None, description="原文片段在合同中的位置（服务端定位，不要求模型输出）")
 
 
 class RemoteMaintenanceLLMOutput(BaseModel):
@@ -154,6 +160,7 @@ class DetectorEcgWarrantyModel(BaseModel):
     logistics_by: Optional[LogisticsBy] = Field(None, description="物流承担方")
     lead_time_business_days: Optional[float] = Field(None, description="发货/更换时效（工作日）")
     original_contract_snippet: str = Field(..., description="原始合同片段，原文摘录一定要与原文保持一致，不要做任何修改，也**不得对标点符号、空格或格式做任何修改**。")
+    snippet_location: SkipJsonSchema[Optional[SnippetLocation]] = Field(None, description="原文片段在合同中的位置（服务端定位，不要求模型输出）")
 
 
     tubes: List[CTTubeInfoModel] = Field([], description="所有球管备件信息列表，如合同中未涉及，返回空列表")
@@ -181,6 +188,7 @@ class TrainingSupportInfoModel(BaseModel):
     training_seats: Optional[int] = Field(None, description="培训名额", example = 5)
     training_cost: Optional[str] = Field(None, description="培训费用相关信息", examples=["乙方承担交通/住宿/会务", "乙方不承担费用"])
     original_contract_snippet: str = Field(..., description="原始合同片段，原文摘录一定要与原文保持一致，不要做任何修改，也**不得对标点符号、空格或格式做任何修改**。")
+    snippet_location: SkipJsonSchema[Optional[SnippetLocation]] = Field(None, description="原文片段在合同中的位置（服务端定位，不要求模型输出）")
 
 
 class TrainingLLMOutput(BaseModel):
@@ -226,7 +234,50 @@ class ServicePlanRecommendationRequest(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
     clauses: List[ServiceClauseForMatching] = Field(..., description="需要匹配服务计划的合同条款列表")
-    candidates: List[ServicePlanCandidate] = Field(..., description="候选服务计划列表")
+    candidates: List[ServicePlanCandidate] = Field(default_factory=list, description="候选服务计划列表（提供 catalogId 时可省略）")
+    catalog_id: Optional[str] = Field(None, description="已注册的服务计划目录ID，提供时忽略 candidates", alias="catalogId")
+
+
+class PlanCatalogRegisterRequest(BaseModel):
+    name: Optional[str] = Field(None, description="服务计划目录名称")
+    version: Optional[str] = Field(None, description="服务计划目录版本")
+    candidates: List[ServicePlanCandidate] = Field(..., min_length=1, description="候选服务计划列表")
+
+
+class PlanCatalogInfo(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: str = Field(..., description="目录ID（候选计划内容哈希），内容相同的目录ID相同")
+    name: Optional[str] = Field(None, description="目录名称（以首次注册为准）")
+    version: Optional[str] = Field(None, description="目录版本（以首次注册为准）")
+    plan_count: int = Field(..., description="候选计划数量", alias="planCount")
+    plan_ids: List[str] = Field(..., description="候选计划ID（按注册顺序）", alias="planIds")
+    created_at: float = Field(..., description="首次注册时间（Unix 时间戳）", alias="createdAt")
+    created: bool = Field(False, description="本次请求是否新注册")
+
+
+class ServicePlanBatchContract(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    contract_id: str = Field(..., description="合同标识，原样返回用于对应结果", alias="contractId")
+    clauses: List[ServiceClauseForMatching] = Field(..., min_length=1, description="该合同需要匹配服务计划的条款列表")
+
+
+class ServicePlanBatchRequest(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    catalog_id: Optional[str] = Field(None, description="已注册的服务计划目录ID，提供时忽略 candidates", alias="catalogId")
+    candidates: List[ServicePlanCandidate] = Field(default_factory=list, description="候选服务计划列表，所有合同共用")
+    contracts: List[ServicePlanBatchContract] = Field(..., min_length=1, description="待匹配的合同列表")
+
+
+class PlanScore(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    plan_id: str = Field(..., description="服务计划ID", alias="planId")
+    plan_name: str = Field(..., description="服务计划名称", alias="planName")
+    score: float = Field(..., description="本地关键字段匹配得分（0~1），合同条款中无法比较的字段按0计")
+    attribute_scores: Dict[str, float] = Field(default_factory=dict, description="逐字段得分，缺失字段不列出", alias="attributeScores")
 
 
 class ClausePlanRecommendation(BaseModel):
@@ -239,6 +290,8 @@ class ClausePlanRecommendation(BaseModel):
     rationale: str = Field(..., description="匹配理由与判断依据，限制在30字以内", max_length=60)
     alternative_plan_ids: List[str] = Field(default_factory=list, description="备选计划ID列表", alias="alternativePlanIds")
     alternative_plan_names: List[str] = Field(default_factory=list, description="备选计划名称列表", alias="alternativePlanNames")
+    resolved_by: SkipJsonSchema[str] = Field("llm", description="匹配方式：rule（关键字段完全一致，本地匹配）/ llm", alias="resolvedBy")
+    candidate_scores: SkipJsonSchema[List[PlanScore]] = Field(default_factory=list, description="各候选计划的本地匹配得分（降序）", alias="candidateScores")
 
 
 class ServicePlanRecommendationLLMOutput(BaseModel):
@@ -253,6 +306,8 @@ class ServicePlanRecommendationLLMOutput(BaseModel):
         alias="overallAdjustmentNotes",
     )
     matches: List[ClausePlanRecommendation] = Field(..., description="逐条款的推荐结果")
+    plan_scores: SkipJsonSchema[List[PlanScore]] = Field(default_factory=list, description="各候选计划在全部条款上的平均得分（降序）", alias="planScores")
+    shortlisted_plan_ids: SkipJsonSchema[List[str]] = Field(default_factory=list, description="发送给模型的候选计划ID（未调用模型时为空）", alias="shortlistedPlanIds")
 
 
 #### Contract Meta ####
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class SnippetLocation(BaseModel):
+    start: Optional[int] = Field(None, description="原文片段在合同Markdown中的起始字符偏移（含），未定位时为空")
+    end: Optional[int] = Field(None, description="原文片段在合同Markdown中的结束字符偏移（不含），未定位时为空")
+    match: Literal["exact", "normalized", "fuzzy", "not_found"] = Field(
+        ...,
+        description="定位方式：exact（逐字一致）/ normalized（忽略空白与标点后一致）/ fuzzy（近似匹配并已替换为原文）/ not_found",
+    )
+    score: float = Field(..., description="片段与原文的相似度（0~1）")
+    llm_snippet: Optional[str] = Field(None, description="片段被替换为原文时，模型返回的原始片段")
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from pydantic import BaseModel, Field
+
+
+class TokenUsage(BaseModel):
+    calls: int = Field(0, description="实际调用模型的次数（不含缓存命中）")
+    prompt_tokens: int = Field(0, description="模型返回的输入 token 数")
+    completion_tokens: int = Field(0, description="模型返回的输出 token 数")
+    estimated_prompt_tokens: int = Field(0, description="调用前预估的输入 token 数")
+    rerouted: int = Field(0, description="因超出上下文窗口改用长上下文模型的调用次数")
+    latency_ms: float = Field(0.0, description="模型调用耗时之和（毫秒，不含排队）")
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
@@ -1,8 +1,15 @@
-from fastapi import FastAPI, File, UploadFile
+from fastapi import Depends, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from models.compliance import (
+    ClauseSetInfo,
+    ClauseSetRegisterRequest,
     NonStandardDetectionRequest, 
+    StandardClauses,
 )
+from models.analysis import ContractAnalysisRequest, ContractAnalysisResult
+from models.job import JobCreateRequest, JobInfo, JobStatus
+from models.ocr import OcrDocumentResult, PdfToMarkdownResult
 from models.service_plan import (
     RemoteMaintenanceLLMOutput, 
     ResponseArrivalLLMOutput, 
@@ -15,27 +22,77 @@ from models.service_plan import (
     InfoExtractionRequest, 
     ServicePlanRecommendationRequest,
     ServicePlanRecommendationLLMOutput,
+    PlanCatalogInfo,
+    PlanCatalogRegisterRequest,
+    ServicePlanBatchRequest,
 )
 from service.pdf_converter import OcrPdfParser
 from service.non_statndard_detection import NonStandardDetectionAgent
 from service.contract_info_extraction import ContractInfoExtractionAgent
 from service.service_plan_recommendation import ServicePlanRecommendationAgent
-from config import PORT
-import uuid
-import os
+from service.analysis_pipeline import EXTRACTOR_METHODS, ContractAnalysisPipeline
+from service.call_policy import DeadlineExceededError, call_policies, reset_deadline, set_deadline
+from service.clause_sets import ClauseSetNotFoundError, clause_sets
+from service.jobs import JOB_REQUEST_MODELS, JobNotFoundError, JobRunner, JobWorkerPool, job_store
+from service.json_repair import json_repair_stats
+from service.llm_cache import cache_bypass, llm_response_cache
+from service.llm_cassette import cassette_stats
+from service.llm_clients import llm_clients
+from service.llm_scheduler import LlmOverloadedError, Priority, llm_scheduler
+from service.plan_catalogs import PlanCatalogNotFoundError, plan_catalogs
+from service.section_index import section_router
+from service.snippet_locator import locate_snippets, snippet_locator_stats
+from service.structured_output import item_stream, structured_output
+from service.token_usage import PromptTooLargeError, current_ledger, token_counter, token_usage, usage_scope
+from service.uploads import UploadSizeLimitMiddleware, open_pdf_upload
+from config import (
+    PORT,
+    ANALYSIS_MAX_CONCURRENCY,
+    LLM_CACHE_BYPASS_HEADER,
+    LLM_MODEL,
+    OCR_MODEL,
+    REQUEST_DEADLINE_SECONDS,
+    REQUEST_TIMEOUT_HEADER,
+    SERVICE_PLAN_BATCH_MAX_PARALLEL,
+    TOKEN_USAGE_HEADER,
+)
+from pydantic import TypeAdapter, ValidationError
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, List, Literal, Optional
+import asyncio
+import json
+import time
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 提前加载分词器（可能需要下载编码文件），避免首个请求在事件循环中阻塞
+    await asyncio.to_thread(token_counter.tokenizer, LLM_MODEL)
+    # 进程内的任务工作协程（JOB_WORKERS=0 时只由独立的 worker.py 进程执行）
+    job_workers.start()
+    yield
+    # 执行中的任务放回队列，下次启动时从检查点继续
+    await job_workers.stop()
+    # 关闭 PDF 渲染进程池与模型连接池
+    ocr_parser.close()
+    await llm_clients.aclose()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 from fastapi import Request
 
 # 添加请求日志中间件
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    # 读取请求体
-    body = await request.body()
     # 打印请求信息
     print(f"收到请求: {request.method} {request.url}")
     print(f"请求头: {dict(request.headers)}")
+    # 文件上传不读取请求体，避免把整个 PDF 缓存在内存中
+    if request.headers.get("content-type", "").startswith("multipart/"):
+        body = b""
+        print(f"请求体 (multipart): {request.headers.get('content-length', '未知')} bytes")
+    else:
+        body = await request.body()
     if body:
         try:
             # 尝试解析JSON
@@ -43,13 +100,88 @@ async def log_requests(request: Request, call_next):
             print(f"请求体: {body_str}")
         except:
             print(f"请求体 (二进制): {len(body)} bytes")
-    # 重新构造请求以便后续处理
-    async def receive():
-        return {"type": "http.request", "body": body}
-    request._receive = receive
-    response = await call_next(request)
+    # starlette 会缓存中间件已读取的请求体并转交给后续处理，无需手动替换 receive
+
+    # 请求头要求跳过缓存时，只跳过读取，新结果仍会写入缓存
+    bypass = request.headers.get(LLM_CACHE_BYPASS_HEADER, "").lower() in ("bypass", "no-cache")
+    token = cache_bypass.set(bypass)
+    # 端到端截止时间：请求头（秒）优先，其次是 REQUEST_DEADLINE_SECONDS，所有模型调用的超时与重试都不会超过它
+    deadline_token = set_deadline(request_deadline(request))
+    try:
+        # 本次请求的模型调用用量，按接口路径汇总到 /api/v1/metrics
+        with usage_scope(endpoint=request.url.path) as ledger:
+            response = await call_next(request)
+    finally:
+        reset_deadline(deadline_token)
+        cache_bypass.reset(token)
+    # 流式接口的响应头在调用模型之前就已发送，用量放在 done 事件中
+    if ledger.usage.calls and response.headers.get("content-type", "").startswith("application/json"):
+        response.headers[TOKEN_USAGE_HEADER] = ledger.usage.model_dump_json()
     return response
 
+
+def request_deadline(request: Request) -> Optional[float]:
+    raw = request.headers.get(REQUEST_TIMEOUT_HEADER)
+    if raw:
+        try:
+            return float(raw)
+        except ValueError:
+            print(f"忽略无效的 {REQUEST_TIMEOUT_HEADER}: {raw}")
+    return REQUEST_DEADLINE_SECONDS or None
+
+
+# 上传大小限制在最外层执行，超限时不会进入日志中间件与路由
+app.add_middleware(UploadSizeLimitMiddleware)
+
+@app.exception_handler(LlmOverloadedError)
+async def llm_overloaded_handler(request: Request, exc: LlmOverloadedError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceededError):
+    return JSONResponse(status_code=504, content={"detail": f"请求处理超时: {exc}"})
+
+
+@app.exception_handler(PromptTooLargeError)
+async def prompt_too_large_handler(request: Request, exc: PromptTooLargeError):
+    return JSONResponse(
+        status_code=413,
+        content={"detail": str(exc), "model": exc.model, "prompt_tokens": exc.prompt_tokens, "limit": exc.limit},
+    )
+
+
+@app.exception_handler(ClauseSetNotFoundError)
+async def clause_set_not_found_handler(request: Request, exc: ClauseSetNotFoundError):
+    return JSONResponse(status_code=404, content={"detail": f"未注册的标准条款集: {exc.args[0]}"})
+
+
+@app.exception_handler(PlanCatalogNotFoundError)
+async def plan_catalog_not_found_handler(request: Request, exc: PlanCatalogNotFoundError):
+    return JSONResponse(status_code=404, content={"detail": f"未注册的服务计划目录: {exc.args[0]}"})
+
+
+@app.exception_handler(JobNotFoundError)
+async def job_not_found_handler(request: Request, exc: JobNotFoundError):
+    return JSONResponse(status_code=404, content={"detail": f"任务不存在: {exc.args[0]}"})
+
+
+def admit_llm():
+    llm_scheduler.admit(LLM_MODEL, Priority.INTERACTIVE)
+
+
+def admit_llm_bulk():
+    llm_scheduler.admit(LLM_MODEL, Priority.BULK)
+
+
+def admit_ocr():
+    llm_scheduler.admit(OCR_MODEL, Priority.BULK)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -62,24 +194,191 @@ ocr_parser = OcrPdfParser()
 non_standard_detector = NonStandardDetectionAgent()
 contract_info_extractor = ContractInfoExtractionAgent()
 service_plan_recommender = ServicePlanRecommendationAgent()
+contract_analysis_pipeline = ContractAnalysisPipeline(
+    ocr_parser,
+    contract_info_extractor,
+    non_standard_detector,
+    max_concurrency=ANALYSIS_MAX_CONCURRENCY,
+)
+job_workers = JobWorkerPool(
+    job_store,
+    JobRunner(ocr_parser, contract_analysis_pipeline, non_standard_detector, service_plan_recommender),
+)
 
-@app.post("/api/v1/pdf_to_markdown", tags=["File Reading"])
+@app.post("/api/v1/pdf_to_markdown", response_model=PdfToMarkdownResult, tags=["File Reading"], dependencies=[Depends(admit_ocr)])
 async def pdf_to_markdown(file: UploadFile = File(...)):
     if file.content_type != "application/pdf":
-        return {"error": "File type must be application/pdf"}
-    pdf_path = f"temp_{uuid.uuid4()}.pdf"
-    with open(pdf_path, "wb") as f:
-        f.write(file.file.read())
-    markdown = await ocr_parser.parse(pdf_path)
-    os.remove(pdf_path)
-    return {"markdown": markdown}
+        return JSONResponse(content={"error": "File type must be application/pdf"})
+    with await open_pdf_upload(file) as upload:
+        result = await ocr_parser.parse_document(upload.path)
+    return result.to_response()
+
+
+def _request_usage() -> Optional[dict]:
+    """流式接口在 done 事件中返回本次请求的 token 用量（响应体生成时仍处于请求的账本中）"""
+    ledger = current_ledger()
+    return ledger.usage.model_dump() if ledger is not None else None
+
+
+def _format_stream_event(event: str, payload: dict, stream_format: str) -> str:
+    data = json.dumps(payload, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {data}\n\n"
+    return json.dumps({"event": event, **payload}, ensure_ascii=False) + "\n"
+
+
+def _item_event_stream(
+    run: Callable[[], Awaitable[Any]],
+    markdown: str,
+    stream_format: str,
+    summarize: Callable[[Any], dict],
+) -> StreamingResponse:
+    """边生成边推送：run 中的结构化调用改为流式，列表元素（item_list / extracted_clauses）每通过一条校验就推送
+    item 事件（原文片段已定位）；最后推送 done 事件，其中的完整结果经过合并与去重，以它为准"""
+
+    async def events():
+        started = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue()
+        count = 0
+        # 任务创建时复制上下文：逐条回调、请求账本与截止时间都随之传入
+        with item_stream(queue.put_nowait):
+            task = asyncio.ensure_future(run())
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                items = [getter.result()] if getter.done() else []
+                getter.cancel()
+                while not queue.empty():
+                    items.append(queue.get_nowait())
+                for item in items:
+                    item = locate_snippets(item, markdown)
+                    yield _format_stream_event("item", {"index": count, "item": item.model_dump(mode="json")}, stream_format)
+                    count += 1
+                if task.done() and queue.empty():
+                    break
+            result = task.result()
+            yield _format_stream_event(
+                "done",
+                {
+                    **summarize(result),
+                    "streamed_items": count,
+                    "usage": _request_usage(),
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                },
+                stream_format,
+            )
+        except Exception as exc:
+            print(f"Streaming extraction failed: {exc}")
+            yield _format_stream_event("error", {"detail": str(exc)}, stream_format)
+        finally:
+            # 客户端断开时不再继续调用模型
+            task.cancel()
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+
+@app.post("/api/v1/pdf_to_markdown/stream", tags=["File Reading"], dependencies=[Depends(admit_ocr)])
+async def pdf_to_markdown_stream(
+    file: UploadFile = File(...),
+    stream_format: Literal["ndjson", "sse"] = "ndjson",
+):
+    """逐页推送OCR结果（按完成先后），最后推送按页码排序拼接的完整markdown"""
+    if file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="File type must be application/pdf")
+    # 响应流开始前 FastAPI 就会关闭 UploadFile，由 upload 持有独立的文件句柄直到推送结束
+    upload = await open_pdf_upload(file)
+    pdf_path = upload.path
+
+    async def events():
+        started = time.perf_counter()
+        pages = []
+        try:
+            total = ocr_parser.page_count(pdf_path)
+            yield _format_stream_event("start", {"page_count": total}, stream_format)
+            async for page in ocr_parser.stream_pages(pdf_path):
+                pages.append(page)
+                yield _format_stream_event(
+                    "page",
+                    {**page.model_dump(), "completed": len(pages), "page_count": total},
+                    stream_format,
+                )
+            result = OcrDocumentResult(pages=sorted(pages, key=lambda page: page.page_number))
+            yield _format_stream_event(
+                "done",
+                {
+                    "markdown": result.markdown,
+                    "cache": result.cache.model_dump(),
+                    "sources": result.sources,
+                    "payload_bytes": result.payload_bytes,
+                    "usage": _request_usage(),
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                },
+                stream_format,
+            )
+        except Exception as exc:
+            print(f"Streaming OCR failed: {exc}")
+            yield _format_stream_event("error", {"detail": str(exc)}, stream_format)
+        finally:
+            upload.close()
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
 
 
-@app.post("/api/v1/non_standard_detection", tags=["Compliance"])
+@app.post("/api/v1/clause_sets", response_model=ClauseSetInfo, tags=["Compliance"])
+async def register_clause_set(req: ClauseSetRegisterRequest):
+    # 按条款内容哈希注册，重复注册返回同一个ID（created=false）
+    return await clause_sets.register(req.standard_clauses, req.name, req.version)
+
+
+@app.get("/api/v1/clause_sets", response_model=List[ClauseSetInfo], tags=["Compliance"])
+async def list_clause_sets():
+    return await clause_sets.list()
+
+
+@app.get("/api/v1/clause_sets/{clause_set_id}", response_model=ClauseSetInfo, tags=["Compliance"])
+async def get_clause_set(clause_set_id: str):
+    return await clause_sets.info(clause_set_id)
+
+
+@app.post("/api/v1/non_standard_detection", tags=["Compliance"], dependencies=[Depends(admit_llm)])
 async def non_standard_detection(NonStandardDetectionRequest: NonStandardDetectionRequest):
     markdown = NonStandardDetectionRequest.content
-    result = await non_standard_detector.process(markdown, NonStandardDetectionRequest.standard_clauses)
-    return {"result": result}
+    clause_set = await clause_sets.resolve(
+        NonStandardDetectionRequest.standard_clauses,
+        NonStandardDetectionRequest.clause_set_id,
+    )
+    if clause_set is None:
+        raise HTTPException(status_code=400, detail="必须提供 standard_clauses 或 clause_set_id")
+    report = await non_standard_detector.process_with_timings(
+        markdown,
+        clause_set,
+        NonStandardDetectionRequest.mode,
+    )
+    return {"result": report.result, "mode": report.mode, "category_timings": report.category_timings}
+
+
+@app.post("/api/v1/non_standard_detection/stream", tags=["Compliance"], dependencies=[Depends(admit_llm)])
+async def non_standard_detection_stream(
+    req: NonStandardDetectionRequest,
+    stream_format: Literal["ndjson", "sse"] = "ndjson",
+):
+    """逐条推送抽取的条款（item 事件），最后推送与 /api/v1/non_standard_detection 相同的完整结果（done 事件）"""
+    clause_set = await clause_sets.resolve(req.standard_clauses, req.clause_set_id)
+    if clause_set is None:
+        raise HTTPException(status_code=400, detail="必须提供 standard_clauses 或 clause_set_id")
+    return _item_event_stream(
+        lambda: non_standard_detector.process_with_timings(req.content, clause_set, req.mode),
+        req.content,
+        stream_format,
+        lambda report: {
+            "result": report.result.model_dump(mode="json"),
+            "mode": report.mode,
+            "category_timings": [timing.model_dump(mode="json") for timing in report.category_timings],
+        },
+    )
 
 
 # @app.post("/api/v1/device_info_extraction", response_model=DeviceInfoExtractionResult)
@@ -102,60 +401,282 @@ async def non_standard_detection(NonStandardDetectionRequest: NonStandardDetecti
 #     result = await contract_info_extractor.extract_digital_solution_info(markdown)
 #     return result
 
-@app.post("/api/v1/basic_info_extraction", response_model=BasicInfoExtractionResult, tags=["Info Extraction"])
+@app.post("/api/v1/basic_info_extraction", response_model=BasicInfoExtractionResult, tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
 async def basic_info_extraction(req: InfoExtractionRequest):
     markdown = req.content
     result = await contract_info_extractor.extract_basic_info(markdown)
     return result
     
-@app.post("/api/v1/training_support_info_extraction", response_model=TrainingLLMOutput, tags=["Info Extraction"])
+@app.post("/api/v1/training_support_info_extraction", response_model=TrainingLLMOutput, tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
 async def training_support_info_extraction(req: InfoExtractionRequest):
     markdown = req.content
     result = await contract_info_extractor.extract_training_support_info(markdown)
     return result
 
-@app.post("/api/v1/contract_and_compliance_info_extraction", response_model=ContractAndComplianceInfoExtractionResult, tags=["Info Extraction"])
+@app.post("/api/v1/contract_and_compliance_info_extraction", response_model=ContractAndComplianceInfoExtractionResult, tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
 async def contract_and_compliance_info_extraction(req: InfoExtractionRequest):
     markdown = req.content
     result = await contract_info_extractor.extract_contract_and_compliance_info(markdown)
     return result
 
-@app.post("/api/v1/after_sales_support_info_extraction", response_model=AfterSalesSupportInfoModel, tags=["Info Extraction"])
+@app.post("/api/v1/after_sales_support_info_extraction", response_model=AfterSalesSupportInfoModel, tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
 async def after_sales_support_info_extraction(req: InfoExtractionRequest):
     markdown = req.content
     result = await contract_info_extractor.extract_after_sales_support_info(markdown)
     return result
 
-@app.post("/api/v1/key_spare_parts_info_extraction", response_model=DetectorEcgWarrantyLLMOutput, tags=["Info Extraction"])
+@app.post("/api/v1/key_spare_parts_info_extraction", response_model=DetectorEcgWarrantyLLMOutput, tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
 async def key_spare_parts_info_extraction(req: InfoExtractionRequest):
     markdown = req.content
     result = await contract_info_extractor.extract_key_spare_parts_info(markdown)
     return result
 
-@app.post("/api/v1/onsite_SLA_extraction", response_model=ResponseArrivalLLMOutput, tags=["Info Extraction"])
+@app.post("/api/v1/onsite_SLA_extraction", response_model=ResponseArrivalLLMOutput, tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
 async def response_arrival_info_extraction(req: InfoExtractionRequest):
     markdown = req.content
     result = await contract_info_extractor.extract_response_arrival_info(markdown)
     return result
 
-@app.post("/api/v1/yearly_maintenance_info_extraction", response_model=YearlyMaintenanceLLMOutput, tags=["Info Extraction"])
+@app.post("/api/v1/yearly_maintenance_info_extraction", response_model=YearlyMaintenanceLLMOutput, tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
 async def yearly_maintenance_info_extraction(req: InfoExtractionRequest):
     markdown = req.content
     result = await contract_info_extractor.extract_yearly_maintenance_info(markdown)
     return result
 
-@app.post("/api/v1/remote_maintenance_info_extraction", response_model=RemoteMaintenanceLLMOutput, tags=["Info Extraction"])
+@app.post("/api/v1/remote_maintenance_info_extraction", response_model=RemoteMaintenanceLLMOutput, tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
 async def remote_maintenance_info_extraction(req: InfoExtractionRequest):
     markdown = req.content
     result = await contract_info_extractor.extract_remote_maintenance_info(markdown)
     return result
 
 
-@app.post("/api/v1/service_plan_recommendation", response_model=ServicePlanRecommendationLLMOutput, tags=["Service Plans"])
+@app.post("/api/v1/info_extraction/{extractor}/stream", tags=["Info Extraction"], dependencies=[Depends(admit_llm)])
+async def info_extraction_stream(
+    extractor: str,
+    req: InfoExtractionRequest,
+    stream_format: Literal["ndjson", "sse"] = "ndjson",
+):
+    """extractor 为抽取类型（onsite_sla、training_support 等）：item_list 中的元素逐条推送（item 事件），
+    最后推送完整结果（done 事件）；没有列表字段的抽取类型只推送 done 事件"""
+    method = EXTRACTOR_METHODS.get(extractor)
+    if method is None:
+        raise HTTPException(status_code=404, detail=f"未知的抽取类型: {extractor}（可选: {', '.join(EXTRACTOR_METHODS)}）")
+    return _item_event_stream(
+        lambda: getattr(contract_info_extractor, method)(req.content),
+        req.content,
+        stream_format,
+        lambda result: {"extractor": extractor, "result": result.model_dump(mode="json")},
+    )
+
+@app.post("/api/v1/service_plan_recommendation", response_model=ServicePlanRecommendationLLMOutput, tags=["Service Plans"], dependencies=[Depends(admit_llm)])
 async def service_plan_recommendation(req: ServicePlanRecommendationRequest):
-    result = await service_plan_recommender.recommend(req)
+    try:
+        result = await service_plan_recommender.recommend(req)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     return result
 
+
+@app.post("/api/v1/plan_catalogs", response_model=PlanCatalogInfo, tags=["Service Plans"])
+async def register_plan_catalog(req: PlanCatalogRegisterRequest):
+    # 按候选计划内容哈希注册，重复注册返回同一个ID（created=false）
+    return await plan_catalogs.register(req.candidates, req.name, req.version)
+
+
+@app.get("/api/v1/plan_catalogs", response_model=List[PlanCatalogInfo], tags=["Service Plans"])
+async def list_plan_catalogs():
+    return await plan_catalogs.list()
+
+
+@app.get("/api/v1/plan_catalogs/{catalog_id}", response_model=PlanCatalogInfo, tags=["Service Plans"])
+async def get_plan_catalog(catalog_id: str):
+    return await plan_catalogs.info(catalog_id)
+
+
+@app.post("/api/v1/service_plan_recommendation/batch", tags=["Service Plans"], dependencies=[Depends(admit_llm_bulk)])
+async def service_plan_recommendation_batch(
+    req: ServicePlanBatchRequest,
+    stream_format: Literal["ndjson", "sse"] = "ndjson",
+):
+    """多份合同共用同一服务计划目录，按完成先后逐份推送推荐结果；单份合同失败推送 error 事件，不影响其他合同"""
+    catalog = await plan_catalogs.resolve(req.candidates, req.catalog_id)
+    if catalog is None:
+        raise HTTPException(status_code=400, detail="必须提供 candidates 或 catalogId")
+
+    async def events():
+        started = time.perf_counter()
+        total = len(req.contracts)
+        completed = failed = 0
+        yield _format_stream_event("start", {"catalog_id": catalog.id, "total": total}, stream_format)
+        outcomes = service_plan_recommender.recommend_batch(req.contracts, catalog, SERVICE_PLAN_BATCH_MAX_PARALLEL)
+        try:
+            async for outcome in outcomes:
+                completed += 1
+                progress = {
+                    "contract_id": outcome.contract_id,
+                    "completed": completed,
+                    "total": total,
+                    "duration_ms": outcome.duration_ms,
+                    "usage": outcome.usage.model_dump() if outcome.usage else None,
+                }
+                if outcome.error is not None:
+                    failed += 1
+                    yield _format_stream_event("error", {**progress, "detail": str(outcome.error)}, stream_format)
+                else:
+                    yield _format_stream_event(
+                        "result",
+                        {**progress, "result": outcome.result.model_dump(mode="json", by_alias=True)},
+                        stream_format,
+                    )
+            yield _format_stream_event(
+                "done",
+                {
+                    "total": total,
+                    "succeeded": completed - failed,
+                    "failed": failed,
+                    "usage": _request_usage(),
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                },
+                stream_format,
+            )
+        finally:
+            await outcomes.aclose()
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+@app.post("/api/v1/contract_analysis", response_model=ContractAnalysisResult, tags=["Contract Analysis"], dependencies=[Depends(admit_llm)])
+async def contract_analysis(req: ContractAnalysisRequest):
+    try:
+        return await contract_analysis_pipeline.run(
+            markdown=req.content,
+            standard_clauses=await clause_sets.resolve(req.standard_clauses, req.clause_set_id),
+            extractors=req.extractors,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.post("/api/v1/contract_analysis/pdf", response_model=ContractAnalysisResult, tags=["Contract Analysis"], dependencies=[Depends(admit_ocr), Depends(admit_llm)])
+async def contract_analysis_pdf(
+    file: UploadFile = File(...),
+    standard_clauses: Optional[str] = Form(None, description="标准条款 JSON 数组"),
+    clause_set_id: Optional[str] = Form(None, description="已注册的标准条款集ID，提供时忽略 standard_clauses"),
+    extractors: Optional[str] = Form(None, description="逗号分隔的抽取类型，为空时执行全部"),
+):
+    if file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="File type must be application/pdf")
+    try:
+        clauses = TypeAdapter(List[StandardClauses]).validate_json(standard_clauses) if standard_clauses else None
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors())
+    selected = [name.strip() for name in extractors.split(",") if name.strip()] if extractors else None
+    clause_set = await clause_sets.resolve(clauses, clause_set_id)
+
+    with await open_pdf_upload(file) as upload:
+        try:
+            return await contract_analysis_pipeline.run(
+                pdf_path=upload.path,
+                standard_clauses=clause_set,
+                extractors=selected,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+
+def _check_extractors(extractors: Optional[List[str]]) -> None:
+    unknown = [name for name in extractors or [] if name not in EXTRACTOR_METHODS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知的抽取类型: {', '.join(unknown)}")
+
+
+@app.post("/api/v1/jobs", response_model=JobInfo, status_code=202, tags=["Jobs"])
+async def create_job(req: JobCreateRequest):
+    """提交异步任务，立即返回任务ID；请求体在提交时校验，引用的条款集/服务计划目录必须已注册"""
+    model = JOB_REQUEST_MODELS.get(req.kind)
+    if model is None:
+        raise HTTPException(status_code=400, detail=f"{req.kind} 任务需要上传PDF，请使用 /api/v1/jobs/pdf")
+    try:
+        payload = model.model_validate(req.payload)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors(include_url=False))
+    if req.kind == "contract_analysis":
+        _check_extractors(payload.extractors)
+        await clause_sets.resolve(None, payload.clause_set_id)
+    elif req.kind == "non_standard_detection":
+        if await clause_sets.resolve(payload.standard_clauses, payload.clause_set_id) is None:
+            raise HTTPException(status_code=400, detail="必须提供 standard_clauses 或 clause_set_id")
+    elif await plan_catalogs.resolve(payload.candidates, payload.catalog_id) is None:
+        raise HTTPException(status_code=400, detail="必须提供 candidates 或 catalogId")
+    job = await job_store.create(req.kind, payload.model_dump(mode="json", by_alias=True))
+    job_workers.notify()
+    return job
+
+
+@app.post("/api/v1/jobs/pdf", response_model=JobInfo, status_code=202, tags=["Jobs"])
+async def create_pdf_job(
+    file: UploadFile = File(...),
+    kind: Literal["pdf_to_markdown", "contract_analysis"] = Form("contract_analysis"),
+    standard_clauses: Optional[str] = Form(None, description="标准条款 JSON 数组（contract_analysis）"),
+    clause_set_id: Optional[str] = Form(None, description="已注册的标准条款集ID，提供时忽略 standard_clauses"),
+    extractors: Optional[str] = Form(None, description="逗号分隔的抽取类型，为空时执行全部"),
+):
+    """上传PDF并提交异步任务：文件保存在 JOB_DATA_DIR，逐页OCR结果与各分析节点结果作为检查点保存"""
+    if file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="File type must be application/pdf")
+    request = {}
+    if kind == "contract_analysis":
+        try:
+            clauses = TypeAdapter(List[StandardClauses]).validate_json(standard_clauses) if standard_clauses else None
+        except ValidationError as exc:
+            raise HTTPException(status_code=422, detail=exc.errors())
+        selected = [name.strip() for name in extractors.split(",") if name.strip()] if extractors else None
+        _check_extractors(selected)
+        await clause_sets.resolve(None, clause_set_id)
+        request = {
+            "standard_clauses": [clause.model_dump() for clause in clauses] if clauses else None,
+            "clause_set_id": clause_set_id,
+            "extractors": selected,
+        }
+    job = await job_store.create(kind, request, file.file)
+    job_workers.notify()
+    return job
+
+
+@app.get("/api/v1/jobs", response_model=List[JobInfo], tags=["Jobs"])
+async def list_jobs(status: Optional[JobStatus] = None, limit: int = 50):
+    # 列表不返回任务结果
+    return await job_store.list(status, max(1, min(limit, 500)))
+
+
+@app.get("/api/v1/jobs/{job_id}", response_model=JobInfo, tags=["Jobs"])
+async def get_job(job_id: str, include_result: bool = True):
+    return await job_store.info(job_id, include_result)
+
+
+@app.post("/api/v1/jobs/{job_id}/cancel", response_model=JobInfo, tags=["Jobs"])
+async def cancel_job(job_id: str):
+    return await job_store.cancel(job_id)
+
+
+@app.get("/api/v1/metrics", tags=["Monitoring"])
+async def metrics():
+    return {
+        "llm_scheduler": llm_scheduler.stats(),
+        "llm_clients": llm_clients.stats(),
+        "llm_calls": call_policies.stats(),
+        "token_usage": token_usage.stats(),
+        "llm_cassette": cassette_stats(),
+        "llm_cache": llm_response_cache.store.stats(),
+        "ocr_cache": ocr_parser.page_cache.stats(),
+        "json_repair": json_repair_stats.stats(),
+        "structured_output": structured_output.stats(),
+        "section_router": section_router.stats(),
+        "snippet_locator": snippet_locator_stats.stats(),
+        "jobs": await job_store.stats(),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=int(PORT))
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+from models.analysis import AnalysisNodeTiming, ContractAnalysisResult
+from models.compliance import NonStandardDetectionReport, StandardClauses
+from models.ocr import OcrDocumentResult
+from models.usage import TokenUsage
+from service.clause_sets import CompiledClauseSet
+from service.token_usage import usage_scope
+
+# 节点名 -> ContractInfoExtractionAgent 上的方法名
+EXTRACTOR_METHODS: Dict[str, str] = {
+    "basic_info": "extract_basic_info",
+    "training_support": "extract_training_support_info",
+    "contract_and_compliance": "extract_contract_and_compliance_info",
+    "after_sales_support": "extract_after_sales_support_info",
+    "key_spare_parts": "extract_key_spare_parts_info",
+    "onsite_sla": "extract_response_arrival_info",
+    "yearly_maintenance": "extract_yearly_maintenance_info",
+    "remote_maintenance": "extract_remote_maintenance_info",
+}
+
+OCR_NODE = "pdf_to_markdown"
+NON_STANDARD_NODE = "non_standard_detection"
+
+
+@dataclass
+class AnalysisNode:
+    """DAG 中的一个节点，run 接收所有依赖节点的结果（按节点名索引）"""
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: List[str] = field(default_factory=list)
+
+
+@dataclass
+class NodeOutcome:
+    name: str
+    status: str
+    result: Any = None
+    error: Optional[str] = None
+    started_ms: float = 0.0
+    duration_ms: float = 0.0
+    restored: bool = False
+    usage: Optional[TokenUsage] = None
+
+
+def _topological_order(nodes: Iterable[AnalysisNode]) -> List[AnalysisNode]:
+    by_name = {node.name: node for node in nodes}
+    for node in by_name.values():
+        for dep in node.depends_on:
+            if dep not in by_name:
+                raise ValueError(f"节点 {node.name} 依赖未知节点 {dep}")
+
+    ordered: List[AnalysisNode] = []
+    state: Dict[str, int] = {}
+
+    def visit(name: str) -> None:
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"分析流程存在循环依赖: {name}")
+        state[name] = 1
+        for dep in by_name[name].depends_on:
+            visit(dep)
+        state[name] = 2
+        ordered.append(by_name[name])
+
+    for name in by_name:
+        visit(name)
+    return ordered
+
+
+async def run_dag(nodes: Iterable[AnalysisNode], max_concurrency: int, checkpoint=None) -> Dict[str, NodeOutcome]:
+    """按依赖关系并发执行节点，所有节点共享同一个并发额度。
+
+    单个节点失败不会中断整个流程，只有依赖它的下游节点会被跳过。
+    checkpoint（可选）提供 load_node(name) -> (是否存在, 结果) 与 save_node(name, result)：
+    已保存的节点直接恢复结果、不再执行，新成功的节点结果立即保存。
+    """
+    ordered = _topological_order(nodes)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    pipeline_start = time.perf_counter()
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def execute(node: AnalysisNode) -> NodeOutcome:
+        upstream: List[NodeOutcome] = (
+            await asyncio.gather(*(tasks[dep] for dep in node.depends_on)) if node.depends_on else []
+        )
+        failed = [outcome.name for outcome in upstream if outcome.status != "success"]
+        if failed:
+            return NodeOutcome(
+                name=node.name,
+                status="skipped",
+                error=f"上游节点未成功: {', '.join(failed)}",
+            )
+        if checkpoint is not None:
+            found, result = await checkpoint.load_node(node.name)
+            if found:
+                return NodeOutcome(name=node.name, status="success", result=result, restored=True)
+        async with semaphore:
+            started = time.perf_counter()
+            # 节点内的模型调用按节点名记账，失败节点已消耗的用量同样保留
+            with usage_scope(stage=node.name) as ledger:
+                try:
+                    result = await node.run({outcome.name: outcome.result for outcome in upstream})
+                    status, error = "success", None
+                    if checkpoint is not None:
+                        await checkpoint.save_node(node.name, result)
+                except Exception as exc:
+                    print(f"Analysis node {node.name} failed: {exc}")
+                    result, status, error = None, "failed", str(exc)
+            finished = time.perf_counter()
+        return NodeOutcome(
+            name=node.name,
+            status=status,
+            result=result,
+            error=error,
+            started_ms=(started - pipeline_start) * 1000,
+            duration_ms=(finished - started) * 1000,
+            usage=ledger.summary(),
+        )
+
+    for node in ordered:
+        tasks[node.name] = asyncio.create_task(execute(node))
+    outcomes = await asyncio.gather(*tasks.values())
+    return {outcome.name: outcome for outcome in outcomes}
+
+
+class ContractAnalysisPipeline:
+    """一次性完成 OCR（可选）、全部信息抽取与非标准条款检测"""
+
+    def __init__(self, ocr_parser, contract_info_extractor, non_standard_detector, max_concurrency: int) -> None:
+        self.ocr_parser = ocr_parser
+        self.contract_info_extractor = contract_info_extractor
+        self.non_standard_detector = non_standard_detector
+        self.max_concurrency = max_concurrency
+
+    def build_nodes(
+        self,
+        markdown: Optional[str] = None,
+        pdf_path: Optional[str] = None,
+        standard_clauses: Optional[Union[List[StandardClauses], CompiledClauseSet]] = None,
+        extractors: Optional[List[str]] = None,
+        checkpoint=None,
+    ) -> List[AnalysisNode]:
+        if markdown is None and pdf_path is None:
+            raise ValueError("必须提供合同Markdown内容或PDF文件")
+        selected = list(EXTRACTOR_METHODS) if extractors is None else extractors
+        unknown = [name for name in selected if name not in EXTRACTOR_METHODS]
+        if unknown:
+            raise ValueError(f"未知的抽取类型: {', '.join(unknown)}")
+
+        nodes: List[AnalysisNode] = []
+        content_deps: List[str] = []
+        if pdf_path is not None:
+            async def run_ocr(_: Dict[str, Any]) -> OcrDocumentResult:
+                return await self.ocr_parser.parse_document(pdf_path, checkpoint=checkpoint)
+
+            nodes.append(AnalysisNode(name=OCR_NODE, run=run_ocr))
+            content_deps = [OCR_NODE]
+
+        def contract_content(upstream: Dict[str, Any]) -> str:
+            return upstream[OCR_NODE].markdown if pdf_path is not None else markdown
+
+        for name in selected:
+            method = getattr(self.contract_info_extractor, EXTRACTOR_METHODS[name])
+
+            async def run_extractor(upstream: Dict[str, Any], method=method):
+                return await method(contract_content(upstream))
+
+            nodes.append(AnalysisNode(name=name, run=run_extractor, depends_on=content_deps))
+
+        if standard_clauses:
+            async def run_detection(upstream: Dict[str, Any]):
+                return await self.non_standard_detector.process_with_timings(contract_content(upstream), standard_clauses)
+
+            nodes.append(AnalysisNode(name=NON_STANDARD_NODE, run=run_detection, depends_on=content_deps))
+        return nodes
+
+    async def run(
+        self,
+        markdown: Optional[str] = None,
+        pdf_path: Optional[str] = None,
+        standard_clauses: Optional[Union[List[StandardClauses], CompiledClauseSet]] = None,
+        extractors: Optional[List[str]] = None,
+        checkpoint=None,
+    ) -> ContractAnalysisResult:
+        """checkpoint 用于异步任务的断点续跑：按节点保存/恢复结果，OCR 节点另按页保存"""
+        nodes = self.build_nodes(markdown, pdf_path, standard_clauses, extractors, checkpoint)
+        started = time.perf_counter()
+        with usage_scope() as ledger:
+            outcomes = await run_dag(nodes, self.max_concurrency, checkpoint)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        results = {name: outcome.result for name, outcome in outcomes.items() if outcome.status == "success"}
+        ocr_result: Optional[OcrDocumentResult] = results.pop(OCR_NODE, None)
+        detection: Optional[NonStandardDetectionReport] = results.pop(NON_STANDARD_NODE, None)
+        return ContractAnalysisResult(
+            markdown=ocr_result.markdown if ocr_result else None,
+            ocr_cache=ocr_result.cache if ocr_result else None,
+            **results,
+            non_standard_detection=detection.result if detection else None,
+            non_standard_category_timings=detection.category_timings if detection else [],
+            timings=[
+                AnalysisNodeTiming(
+                    node=outcome.name,
+                    status=outcome.status,
+                    error=outcome.error,
+                    started_ms=round(outcome.started_ms, 1),
+                    duration_ms=round(outcome.duration_ms, 1),
+                    restored=outcome.restored,
+                    usage=outcome.usage,
+                )
+                for outcome in outcomes.values()
+            ],
+            usage=ledger.summary(),
+            total_ms=round(total_ms, 1),
+        )
+
+
+__all__ = [
+    "NON_STANDARD_NODE",
+    "OCR_NODE",
+    "AnalysisNode",
+    "ContractAnalysisPipeline",
+    "EXTRACTOR_METHODS",
+    "NodeOutcome",
+    "run_dag",
+]
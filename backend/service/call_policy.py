@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+import numpy as np
+import openai
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from config import (
+    LLM_CALL_TIMEOUT_SECONDS,
+    LLM_MODEL,
+    LLM_RETRY_BACKOFF_MAX_SECONDS,
+    LLM_RETRY_BACKOFF_SECONDS,
+    LLM_RETRY_MAX_ATTEMPTS,
+    OCR_CALL_TIMEOUT_SECONDS,
+    OCR_HEDGE_ENABLED,
+    OCR_HEDGE_MIN_DELAY_SECONDS,
+    OCR_HEDGE_MIN_SAMPLES,
+    OCR_HEDGE_QUANTILE,
+    OCR_MODEL,
+)
+
+T = TypeVar("T")
+
+# 当前请求的截止时间（time.monotonic()），由请求中间件设置；异步任务等非请求上下文中为 None
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class DeadlineExceededError(TimeoutError):
+    """端到端截止时间已到，不再重试，由接口层转换为 504"""
+
+
+def set_deadline(seconds: Optional[float]) -> contextvars.Token:
+    """seconds 为空或不大于0时不限制；已有更早的截止时间时保留较早者"""
+    current = _deadline.get()
+    deadline = time.monotonic() + seconds if seconds and seconds > 0 else None
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token: contextvars.Token) -> None:
+    _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """等待 awaitable，但不超过当前截止时间（用于排队等）"""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceededError("已超过请求截止时间")
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError("已超过请求截止时间") from None
+
+
+def classify(exc: BaseException) -> str:
+    if isinstance(exc, DeadlineExceededError):
+        return "deadline"
+    if isinstance(exc, (asyncio.TimeoutError, openai.APITimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(exc, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return "connection_error"
+    if isinstance(exc, openai.APIStatusError):
+        return "server_error" if exc.status_code >= 500 or exc.status_code in (408, 409) else "client_error"
+    return "error"
+
+
+def is_retryable(exc: BaseException) -> bool:
+    return classify(exc) in ("timeout", "rate_limited", "connection_error", "server_error")
+
+
+class CallPolicy:
+    """单个模型的调用策略与统计：单次超时、带抖动的指数退避重试、可选的对冲请求"""
+
+    def __init__(
+        self,
+        model: str,
+        timeout: float,
+        max_attempts: int,
+        backoff: float,
+        backoff_max: float,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 2.0,
+    ) -> None:
+        self.model = model
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        # 近期成功调用的耗时（秒，不含排队），用于分位数统计与对冲延迟
+        self._latencies: Deque[float] = deque(maxlen=512)
+        self.outcomes: Counter = Counter()
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self._latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, float(np.quantile(self._latencies, self.hedge_quantile)))
+
+    async def bounded(self, awaitable: Awaitable[T]) -> T:
+        """等待 awaitable，超时取单次超时与截止时间中较早者（不计入统计，流式调用逐块等待时使用）"""
+        left = remaining()
+        timeout = self.timeout if left is None else min(self.timeout, left)
+        if timeout <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceededError("已超过请求截止时间")
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            if left is not None and left <= self.timeout:
+                raise DeadlineExceededError("已超过请求截止时间") from None
+            raise
+
+    def observe(self, exc: Optional[BaseException], latency: float = 0.0) -> None:
+        """记录一次模型调用的结果：失败按类别计数，成功时记录耗时"""
+        if exc is not None:
+            self.outcomes[classify(exc)] += 1
+            return
+        self.outcomes["success"] += 1
+        self._latencies.append(latency)
+
+    async def timed(self, awaitable: Awaitable[T]) -> T:
+        """单次模型调用：超时取单次超时与截止时间中较早者，结果按类别计数"""
+        started = time.monotonic()
+        try:
+            result = await self.bounded(awaitable)
+        except asyncio.CancelledError:
+            # 对冲请求中落后的一方被取消，不计入结果
+            raise
+        except BaseException as exc:
+            self.observe(exc)
+            raise
+        self.observe(None, time.monotonic() - started)
+        return result
+
+    async def _hedged(self, call: Callable[[], Awaitable[T]], can_hedge: Callable[[], bool]) -> T:
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(call())
+        tasks = [primary]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and can_hedge():
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future(call()))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _stop_at_deadline(self, retry_state) -> bool:
+        left = remaining()
+        return left is not None and left <= (retry_state.upcoming_sleep or 0)
+
+    def _before_sleep(self, retry_state) -> None:
+        self.retries += 1
+        exc = retry_state.outcome.exception()
+        print(
+            f"LLM call to {self.model} failed ({classify(exc)}: {exc}), "
+            f"retry {retry_state.attempt_number}/{self.max_attempts - 1} in {retry_state.upcoming_sleep:.1f}s"
+        )
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        hedge: bool = False,
+        can_hedge: Callable[[], bool] = lambda: True,
+    ) -> T:
+        """call 每次执行一次完整调用（排队 + 模型调用）；hedge 为 True 且本模型开启对冲时，每次尝试可能并发两份"""
+        self.calls += 1
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts) | self._stop_at_deadline,
+            wait=wait_random_exponential(multiplier=self.backoff, max=self.backoff_max),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=self._before_sleep,
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                if hedge and self.hedge:
+                    return await self._hedged(call, can_hedge)
+                return await call()
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.array(self._latencies) if self._latencies else None
+        quantiles = (
+            {f"p{q}": round(float(np.quantile(latencies, q / 100)), 2) for q in (50, 95, 99)}
+            if latencies is not None
+            else {}
+        )
+        hedge_delay = self.hedge_delay()
+        return {
+            "calls": self.calls,
+            "outcomes": dict(self.outcomes),
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_s": round(hedge_delay, 2) if hedge_delay is not None else None,
+            "timeout_s": self.timeout,
+            "latency_s": quantiles,
+        }
+
+
+class CallPolicyRegistry:
+    def __init__(self) -> None:
+        self._policies: Dict[str, CallPolicy] = {}
+
+    def configure(self, model: str, **kwargs: Any) -> None:
+        # 与调度器一致：同一个模型名只配置一次
+        if model not in self._policies:
+            self._policies[model] = CallPolicy(model, **kwargs)
+
+    def policy(self, model: str) -> CallPolicy:
+        if model not in self._policies:
+            self.configure(
+                model,
+                timeout=LLM_CALL_TIMEOUT_SECONDS,
+                max_attempts=LLM_RETRY_MAX_ATTEMPTS,
+                backoff=LLM_RETRY_BACKOFF_SECONDS,
+                backoff_max=LLM_RETRY_BACKOFF_MAX_SECONDS,
+            )
+        return self._policies[model]
+
+    def stats(self) -> Dict[str, Any]:
+        return {model: policy.stats() for model, policy in self._policies.items()}
+
+
+call_policies = CallPolicyRegistry()
+call_policies.configure(
+    OCR_MODEL,
+    timeout=OCR_CALL_TIMEOUT_SECONDS,
+    max_attempts=LLM_RETRY_MAX_ATTEMPTS,
+    backoff=LLM_RETRY_BACKOFF_SECONDS,
+    backoff_max=LLM_RETRY_BACKOFF_MAX_SECONDS,
+    hedge=OCR_HEDGE_ENABLED,
+    hedge_quantile=OCR_HEDGE_QUANTILE,
+    hedge_min_samples=OCR_HEDGE_MIN_SAMPLES,
+    hedge_min_delay=OCR_HEDGE_MIN_DELAY_SECONDS,
+)
+call_policies.configure(
+    LLM_MODEL,
+    timeout=LLM_CALL_TIMEOUT_SECONDS,
+    max_attempts=LLM_RETRY_MAX_ATTEMPTS,
+    backoff=LLM_RETRY_BACKOFF_SECONDS,
+    backoff_max=LLM_RETRY_BACKOFF_MAX_SECONDS,
+)
+
+
+__all__ = [
+    "CallPolicy",
+    "CallPolicyRegistry",
+    "DeadlineExceededError",
+    "call_policies",
+    "classify",
+    "is_retryable",
+    "remaining",
+    "reset_deadline",
+    "set_deadline",
+    "within_deadline",
+]
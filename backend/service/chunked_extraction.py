@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+from models.service_plan import (
+    CTCoilInfoModel,
+    CTTubeInfoModel,
+    DetectorEcgWarrantyModel,
+    DeviceInfoModel,
+    RemoteMaintenanceParams,
+    ResponseArrivalParams,
+    TrainingSupportInfoModel,
+    YearlyMaintenanceParams,
+)
+from service.section_index import build_section_index
+
+T = TypeVar("T", bound=BaseModel)
+
+_CHUNK_SEPARATOR = "\n\n"
+
+# 同一服务项的判定字段：service_type 加上区分不同档位的关键条款，避免未标注合同类型的不同档位被合并
+ITEM_KEY_FIELDS: Dict[type, Tuple[str, ...]] = {
+    ResponseArrivalParams: ("service_type", "response_time_hours", "on_site_time_hours"),
+    YearlyMaintenanceParams: ("service_type", "standard_pm_per_year", "smart_pm_per_year", "remote_pm_per_year"),
+    RemoteMaintenanceParams: ("service_type", "platform"),
+    DetectorEcgWarrantyModel: ("service_type", "covered_items"),
+    TrainingSupportInfoModel: ("service_type", "training_category"),
+}
+
+
+def _table_pieces(text: str, budget: int) -> List[str]:
+    """把超长表格按行切分，每一段都重复表头"""
+    lines = text.splitlines(keepends=True)
+    header_size = 2 if len(lines) > 1 and set(lines[1].strip()) <= set("|-: ") else 1
+    header = "".join(lines[:header_size])
+    pieces, current = [], header
+    for row in lines[header_size:]:
+        if len(current) + len(row) > budget and current != header:
+            pieces.append(current)
+            current = header
+        current += row
+    if current != header or not pieces:
+        pieces.append(current)
+    return pieces
+
+
+def _line_pieces(text: str, budget: int) -> List[str]:
+    pieces, current = [], ""
+    for line in text.splitlines(keepends=True):
+        if current and len(current) + len(line) > budget:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _pack(pieces: List[str], budget: int) -> List[str]:
+    groups: List[str] = []
+    for piece in pieces:
+        if groups and len(groups[-1]) + len(_CHUNK_SEPARATOR) + len(piece) <= budget:
+            groups[-1] += _CHUNK_SEPARATOR + piece
+        else:
+            groups.append(piece)
+    return groups
+
+
+def _overlap_tail(text: str, overlap_chars: int) -> str:
+    if overlap_chars <= 0:
+        return ""
+    tail = text[-overlap_chars:]
+    # 从行首开始，避免截断半行
+    newline = tail.find("\n")
+    return tail[newline + 1:] if 0 <= newline < len(tail) - 1 else tail
+
+
+def split_into_chunks(markdown: str, max_chars: int, overlap_chars: int) -> List[str]:
+    """按章节/表格边界把合同切分为不超过 max_chars 的分片。
+
+    条款正文较短而附件设备表很长时（常见的框架协议），每个分片都带上全部条款正文，只切分表格行，
+    保证每个分片都能把设备与对应的服务条款关联；否则在章节边界处切分，相邻分片保留 overlap_chars 的重叠。
+    """
+    if len(markdown) <= max_chars:
+        return [markdown]
+
+    index = build_section_index(markdown)
+    tables = [section for section in index.sections if section.kind == "table"]
+    text_ranges, cursor = [], 0
+    for table in tables:
+        if table.start > cursor:
+            text_ranges.append((cursor, table.start))
+        cursor = table.end
+    text_ranges.append((cursor, len(markdown)))
+    clauses = index.render(text_ranges)
+
+    if tables and len(clauses) <= max_chars // 3:
+        budget = max_chars - len(clauses) - len(_CHUNK_SEPARATOR)
+        pieces: List[str] = []
+        for table in tables:
+            pieces.extend(_table_pieces(markdown[table.start:table.end], budget))
+        return [clauses + _CHUNK_SEPARATOR + group for group in _pack(pieces, budget)]
+
+    boundaries = sorted(
+        {0, len(markdown)}
+        | {section.start for section in index.sections if section.kind != "preamble"}
+        | {table.end for table in tables}
+    )
+    budget = max_chars - overlap_chars
+    blocks: List[str] = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        block = markdown[start:end].strip("\n")
+        if not block:
+            continue
+        if len(block) <= budget:
+            blocks.append(block)
+        elif block.lstrip().startswith("|"):
+            blocks.extend(_table_pieces(block, budget))
+        else:
+            blocks.extend(_line_pieces(block, budget))
+
+    groups = _pack(blocks, budget)
+    chunks = [groups[0]]
+    for previous, group in zip(groups, groups[1:]):
+        tail = _overlap_tail(previous, overlap_chars)
+        chunks.append(tail + _CHUNK_SEPARATOR + group if tail else group)
+    return chunks
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+def _identity(item: Any) -> Any:
+    if isinstance(item, DeviceInfoModel):
+        # 同一注册证可对应多台设备，只有缺少主机系统编号时才退回注册证号 + 型号
+        if item.ge_host_system_number.strip():
+            return ("system", item.ge_host_system_number.strip())
+        if item.registration_number.strip():
+            return ("registration", item.registration_number.strip(), item.device_model.strip())
+    if isinstance(item, CTTubeInfoModel):
+        return ("tube", item.ge_host_system_number.strip(), item.xr_tube_id.strip())
+    if isinstance(item, CTCoilInfoModel):
+        return ("coil", item.coil_serial_number.strip() or (item.ge_host_system_number.strip(), item.coil_order_number.strip()))
+    if isinstance(item, BaseModel):
+        fields = ITEM_KEY_FIELDS.get(type(item))
+        if fields:
+            return (type(item).__name__,) + tuple(_hashable(getattr(item, name)) for name in fields)
+        return item.model_dump_json()
+    return _hashable(item)
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(sorted(_hashable(item) for item in value))
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def _merge_lists(left: List[Any], right: List[Any]) -> List[Any]:
+    merged: "OrderedDict[Any, Any]" = OrderedDict()
+    for item in [*left, *right]:
+        key = _identity(item)
+        if key in merged and isinstance(item, BaseModel):
+            merged[key] = merge_models(merged[key], item)
+        else:
+            merged.setdefault(key, item)
+    return list(merged.values())
+
+
+def merge_models(left: T, right: T) -> T:
+    """合并同一对象的两份抽取结果：列表按标识去重合并，标量取先出现的非空值"""
+    values = {}
+    for name in type(left).model_fields:
+        a, b = getattr(left, name), getattr(right, name)
+        if isinstance(a, list) and isinstance(b, list):
+            values[name] = _merge_lists(a, b)
+        else:
+            values[name] = b if _is_empty(a) else a
+    return type(left).model_construct(**values)
+
+
+def merge_item_lists(results: List[T], output_model: Type[T]) -> T:
+    """把各分片的 item_list 合并为一个结果，合并顺序与分片顺序一致，结果确定"""
+    items: List[Any] = []
+    for result in results:
+        items = _merge_lists(items, list(result.item_list))
+    return output_model.model_validate({"item_list": [item.model_dump() for item in items]})
+
+
+async def map_reduce_extract(
+    chunks: List[str],
+    extract: Callable[[str], Awaitable[T]],
+    output_model: Type[T],
+    max_parallel: int,
+) -> T:
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+    async def run(chunk: str) -> T:
+        async with semaphore:
+            return await extract(chunk)
+
+    results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+    return merge_item_lists(list(results), output_model)
+
+
+__all__ = [
+    "ITEM_KEY_FIELDS",
+    "map_reduce_extract",
+    "merge_item_lists",
+    "merge_models",
+    "split_into_chunks",
+]
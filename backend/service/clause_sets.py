@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import CLAUSE_SET_DB_PATH, CLAUSE_SET_MEMORY_ITEMS
+from models.compliance import ClauseSetInfo, StandardClauses
+from prompts import NON_STANDARD_ANALYSIS_DEVELOPER_PROMPT, NON_STANDARD_ANALYSIS_SYSTEM_PROMPT
+from service.llm_cache import make_cache_key
+
+Message = Tuple[str, str]
+
+
+class ClauseSetNotFoundError(KeyError):
+    """clause_set_id 未注册"""
+
+
+def canonical_clauses(standard_clauses: List[StandardClauses]) -> List[StandardClauses]:
+    """去重并按 (类别, 条款项, 标准原文) 排序，内容相同、顺序不同的条款集得到相同的 ID 与提示词"""
+    unique = {
+        (clause.category, clause.item, clause.standard_text, clause.risk_level or ""): clause
+        for clause in standard_clauses
+    }
+    return [unique[key] for key in sorted(unique)]
+
+
+def clause_set_id_for(clauses: List[StandardClauses]) -> str:
+    return make_cache_key([clause.model_dump() for clause in clauses])[:32]
+
+
+def _render_clauses(clauses: List[StandardClauses]) -> str:
+    return json.dumps(
+        [{
+            "条款所属类别": clause.category,
+            "具体条款项": clause.item,
+            "标准约定原文": clause.standard_text,
+            "风险等级标准": clause.risk_level,
+        } for clause in clauses],
+        ensure_ascii=False,
+    )
+
+
+def _compile_prefix(clauses: List[StandardClauses]) -> Tuple[Message, ...]:
+    allowed_categories = sorted(set(clause.category for clause in clauses))
+    return (
+        ("system", NON_STANDARD_ANALYSIS_SYSTEM_PROMPT.format(allowed_categories=allowed_categories)),
+        ("system", NON_STANDARD_ANALYSIS_DEVELOPER_PROMPT),
+        ("user", f"标准条款：\n{_render_clauses(clauses)}"),
+    )
+
+
+class CompiledClauseSet:
+    """预编译的条款集：提示词前缀（系统提示、开发者提示、标准条款）只生成一次，逐字节稳定。
+
+    合同正文始终作为最后一条消息追加在前缀之后（text 方式的输出格式说明也插在合同之前），
+    同一条款集的所有请求共享完全相同的前缀，便于服务端前缀缓存/KV 缓存命中。
+    """
+
+    def __init__(self, clause_set_id: str, clauses: List[StandardClauses]) -> None:
+        self.id = clause_set_id
+        self.clauses = clauses
+        self.categories: List[str] = sorted(set(clause.category for clause in clauses))
+        self.prefix = _compile_prefix(clauses)
+        self._category_prefixes: Dict[str, Tuple[Message, ...]] = {}
+
+    def by_category(self) -> "OrderedDict[str, List[StandardClauses]]":
+        groups: "OrderedDict[str, List[StandardClauses]]" = OrderedDict()
+        for clause in self.clauses:
+            groups.setdefault(clause.category, []).append(clause)
+        return groups
+
+    def category_prefix(self, category: str) -> Tuple[Message, ...]:
+        prefix = self._category_prefixes.get(category)
+        if prefix is None:
+            prefix = _compile_prefix([clause for clause in self.clauses if clause.category == category])
+            self._category_prefixes[category] = prefix
+        return prefix
+
+    def messages(self, contract_content: str, category: Optional[str] = None) -> List[Message]:
+        prefix = self.prefix if category is None else self.category_prefix(category)
+        return [*prefix, ("user", f"合同文本：\n{contract_content}")]
+
+
+class ClauseSetRegistry:
+    """标准条款集注册表：sqlite 持久化条款内容，内存中保留最近使用的预编译结果"""
+
+    def __init__(self, path: str, memory_items: int = 64) -> None:
+        self.path = path
+        self.memory_items = memory_items
+        self._compiled: "OrderedDict[str, CompiledClauseSet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS clause_sets ("
+                "id TEXT PRIMARY KEY, name TEXT, version TEXT, clauses TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def _remember(self, compiled: CompiledClauseSet) -> CompiledClauseSet:
+        with self._lock:
+            self._compiled[compiled.id] = compiled
+            self._compiled.move_to_end(compiled.id)
+            while len(self._compiled) > self.memory_items:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def _cached(self, clause_set_id: str) -> Optional[CompiledClauseSet]:
+        with self._lock:
+            compiled = self._compiled.get(clause_set_id)
+            if compiled is not None:
+                self._compiled.move_to_end(clause_set_id)
+            return compiled
+
+    @staticmethod
+    def _info(row: tuple, created: bool = False) -> ClauseSetInfo:
+        clause_set_id, name, version, clauses, created_at = row
+        clauses = json.loads(clauses)
+        return ClauseSetInfo(
+            id=clause_set_id,
+            name=name,
+            version=version,
+            clause_count=len(clauses),
+            categories=sorted(set(clause["category"] for clause in clauses)),
+            created_at=created_at,
+            created=created,
+        )
+
+    def compile(self, standard_clauses: List[StandardClauses]) -> CompiledClauseSet:
+        """请求中直接携带的条款列表：按内容哈希复用预编译结果，不写入数据库"""
+        clauses = canonical_clauses(standard_clauses)
+        clause_set_id = clause_set_id_for(clauses)
+        return self._cached(clause_set_id) or self._remember(CompiledClauseSet(clause_set_id, clauses))
+
+    def register_sync(
+        self,
+        standard_clauses: List[StandardClauses],
+        name: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> ClauseSetInfo:
+        clauses = canonical_clauses(standard_clauses)
+        clause_set_id = clause_set_id_for(clauses)
+        payload = json.dumps([clause.model_dump() for clause in clauses], ensure_ascii=False)
+        with self._lock:
+            conn = self._connection()
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO clause_sets (id, name, version, clauses, created_at) VALUES (?, ?, ?, ?, ?)",
+                (clause_set_id, name, version, payload, time.time()),
+            ).rowcount
+            row = conn.execute(
+                "SELECT id, name, version, clauses, created_at FROM clause_sets WHERE id = ?", (clause_set_id,)
+            ).fetchone()
+        if self._cached(clause_set_id) is None:
+            self._remember(CompiledClauseSet(clause_set_id, clauses))
+        return self._info(row, created=bool(inserted))
+
+    def get_sync(self, clause_set_id: str) -> CompiledClauseSet:
+        compiled = self._cached(clause_set_id)
+        if compiled is not None:
+            return compiled
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT clauses FROM clause_sets WHERE id = ?", (clause_set_id,)
+            ).fetchone()
+        if row is None:
+            raise ClauseSetNotFoundError(clause_set_id)
+        clauses = [StandardClauses.model_validate(clause) for clause in json.loads(row[0])]
+        return self._remember(CompiledClauseSet(clause_set_id, clauses))
+
+    def info_sync(self, clause_set_id: str) -> ClauseSetInfo:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, name, version, clauses, created_at FROM clause_sets WHERE id = ?", (clause_set_id,)
+            ).fetchone()
+        if row is None:
+            raise ClauseSetNotFoundError(clause_set_id)
+        return self._info(row)
+
+    def list_sync(self) -> List[ClauseSetInfo]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, name, version, clauses, created_at FROM clause_sets ORDER BY created_at DESC"
+            ).fetchall()
+        return [self._info(row) for row in rows]
+
+    async def register(self, standard_clauses: List[StandardClauses], name: Optional[str] = None, version: Optional[str] = None) -> ClauseSetInfo:
+        return await asyncio.to_thread(self.register_sync, standard_clauses, name, version)
+
+    async def get(self, clause_set_id: str) -> CompiledClauseSet:
+        compiled = self._cached(clause_set_id)
+        if compiled is not None:
+            return compiled
+        return await asyncio.to_thread(self.get_sync, clause_set_id)
+
+    async def info(self, clause_set_id: str) -> ClauseSetInfo:
+        return await asyncio.to_thread(self.info_sync, clause_set_id)
+
+    async def list(self) -> List[ClauseSetInfo]:
+        return await asyncio.to_thread(self.list_sync)
+
+    async def resolve(
+        self,
+        standard_clauses: Optional[List[StandardClauses]] = None,
+        clause_set_id: Optional[str] = None,
+    ) -> Optional[CompiledClauseSet]:
+        """请求中的 clause_set_id 优先，其次是直接携带的条款列表；都没有时返回 None"""
+        if clause_set_id:
+            return await self.get(clause_set_id)
+        if standard_clauses:
+            return self.compile(standard_clauses)
+        return None
+
+
+clause_sets = ClauseSetRegistry(CLAUSE_SET_DB_PATH, memory_items=CLAUSE_SET_MEMORY_ITEMS)
+
+
+__all__ = [
+    "ClauseSetNotFoundError",
+    "ClauseSetRegistry",
+    "CompiledClauseSet",
+    "canonical_clauses",
+    "clause_set_id_for",
+    "clause_sets",
+]
@@ -1,4 +1,3 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import PydanticOutputParser
 from models.service_plan import (
     ResponseArrivalLLMOutput, 
@@ -22,7 +21,20 @@ from prompts import (
     GENERAL_SERVICE_INFO_EXTRACTION_SYSTEM_PROMPT
 )
 
-from config import LLM_MODEL, API_KEY, API_BASE_URL
+from config import (
+    CHUNKED_EXTRACTION_MAX_CHARS,
+    CHUNKED_EXTRACTION_OVERLAP_CHARS,
+    CHUNKED_EXTRACTION_MAX_PARALLEL,
+)
+from service.chunked_extraction import map_reduce_extract, split_into_chunks
+from service.llm_clients import LLM, llm_clients
+from service.llm_scheduler import llm_scheduler
+from service.section_index import section_router
+from service.snippet_locator import locate_snippets
+from service.structured_output import invoke_structured
+
+CHUNK_INSTRUCTION = "当前输入只是合同的一部分（分片），请仅抽取该部分中出现的信息，不要推测其他部分的内容；该部分没有相关信息时返回空列表。"
+
 
 class ContractInfoExtractionAgent:
     def __init__(self):
@@ -36,12 +48,7 @@ class ContractInfoExtractionAgent:
         self.remote_maintenance_output_parser = PydanticOutputParser(pydantic_object=RemoteMaintenanceLLMOutput)
         self.training_support_info_result_parser = PydanticOutputParser(pydantic_object=TrainingLLMOutput)
 
-        self.llm = ChatOpenAI(
-            model=LLM_MODEL, 
-            temperature=0,
-            api_key=API_KEY,
-            base_url=API_BASE_URL
-        )
+        self.llm = llm_clients.chat(LLM)
 
         self.basic_info_prompt = BASIC_INFO_EXTRACTION_SYSTEM_PROMPT
         self.maintenance_service_info_prompt = MAINTENANCE_SERVICE_INFO_EXTRACTION_SYSTEM_PROMPT
@@ -65,134 +72,81 @@ class ContractInfoExtractionAgent:
         请特别注意反斜杠(\)转译的处理，遇到反斜杠(\)时，需要将反斜杠转译为普通字符。
         请完整输出修复后的Json数据，不要添加任何其他内容和解释。
         """
-        response = await self.llm.ainvoke(prompt)
+        response = await llm_scheduler.ainvoke(self.llm, prompt)
         return response.content.strip().replace("```json", "").replace("```", "")
 
+    def _relevant_sections(self, extractor: str, contract_content: str) -> str:
+        # 只发送与该抽取类型相关的章节，路由不确定时返回全文
+        return section_router.route(extractor, contract_content).text
+
+    async def _extract(self, messages, parser: PydanticOutputParser):
+        # 输出格式说明或 JSON Schema 由 invoke_structured 按模型支持的结构化输出方式附加
+        return await invoke_structured(
+            self.llm,
+            messages,
+            parser,
+            lambda text: self.output_format_refine(text, parser.get_format_instructions()),
+        )
+
+    async def _extract_items(self, extractor: str, instructions, contract_content: str, parser: PydanticOutputParser):
+        """item_list 类抽取：内容超过单次调用上限时按章节切分，并行抽取后确定性合并；
+        原文片段统一在完整合同上定位（偏移相对于传入的 contract_content）"""
+        content = self._relevant_sections(extractor, contract_content)
+        chunks = split_into_chunks(content, CHUNKED_EXTRACTION_MAX_CHARS, CHUNKED_EXTRACTION_OVERLAP_CHARS)
+        if len(chunks) == 1:
+            result = await self._extract([*instructions, ("user", content)], parser)
+            return locate_snippets(result, contract_content)
+
+        print(f"Chunked extraction {extractor}: {len(content)} chars in {len(chunks)} chunks")
+        result = await map_reduce_extract(
+            chunks,
+            lambda chunk: self._extract([*instructions, ("system", CHUNK_INSTRUCTION), ("user", chunk)], parser),
+            parser.pydantic_object,
+            CHUNKED_EXTRACTION_MAX_PARALLEL,
+        )
+        return locate_snippets(result, contract_content)
+
     async def extract_basic_info(self, contract_content: str):
-        response = await self.llm.ainvoke([
+        return await self._extract([
             ("system", self.basic_info_prompt),
-            ("system", f"输出格式: {self.basic_info_result_parser.get_format_instructions()}"),
-            ("user", contract_content)
-        ])
-        ouput_text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.basic_info_result_parser.parse(ouput_text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {ouput_text}")
-            ouput_text = await self.output_format_refine(ouput_text, self.basic_info_result_parser.get_format_instructions())
-            parsed_result = self.basic_info_result_parser.parse(ouput_text)
-        return parsed_result
-    
+            ("user", self._relevant_sections("basic_info", contract_content))
+        ], self.basic_info_result_parser)
+
     async def extract_training_support_info(self, contract_content: str):
-        response = await self.llm.ainvoke([
+        return await self._extract_items("training_support", [
             ("system", self.training_support_info_prompt),
-            ("system", f"输出格式: {self.training_support_info_result_parser.get_format_instructions()}"),
-            ("user", contract_content)
-        ])
-        ouput_text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.training_support_info_result_parser.parse(ouput_text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {ouput_text}")
-            ouput_text = await self.output_format_refine(ouput_text, self.training_support_info_result_parser.get_format_instructions())
-            parsed_result = self.training_support_info_result_parser.parse(ouput_text)
-        return parsed_result
+        ], contract_content, self.training_support_info_result_parser)
 
     async def extract_contract_and_compliance_info(self, contract_content: str):
-        response = await self.llm.ainvoke([
+        return await self._extract([
             ("system", self.contract_and_compliance_info_prompt),
-            ("system", f"输出格式: {self.contract_and_compliance_info_result_parser.get_format_instructions()}"),
-            ("user", contract_content)
-        ])
-        ouput_text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.contract_and_compliance_info_result_parser.parse(ouput_text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {ouput_text}")
-            ouput_text = await self.output_format_refine(ouput_text, self.contract_and_compliance_info_result_parser.get_format_instructions())
-            parsed_result = self.contract_and_compliance_info_result_parser.parse(ouput_text)
-        return parsed_result
+            ("user", self._relevant_sections("contract_and_compliance", contract_content))
+        ], self.contract_and_compliance_info_result_parser)
 
     async def extract_after_sales_support_info(self, contract_content: str):
-        response = await self.llm.ainvoke([
+        return await self._extract([
             ("system", self.after_sales_support_info_prompt),
-            ("system", f"输出格式: {self.after_sales_support_info_result_parser.get_format_instructions()}"),
-            ("user", contract_content)
-        ])
-        ouput_text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.after_sales_support_info_result_parser.parse(ouput_text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {ouput_text}")
-            ouput_text = await self.output_format_refine(ouput_text, self.after_sales_support_info_result_parser.get_format_instructions())
-            parsed_result = self.after_sales_support_info_result_parser.parse(ouput_text)
-        return parsed_result
+            ("user", self._relevant_sections("after_sales_support", contract_content))
+        ], self.after_sales_support_info_result_parser)
 
     async def extract_key_spare_parts_info(self, contract_content: str):
-        response = await self.llm.ainvoke([
+        return await self._extract_items("key_spare_parts", [
             ("system", self.key_spare_parts_info_prompt),
-            ("system", f"输出格式: {self.key_spare_parts_info_result_parser.get_format_instructions()}"),
-            ("user", contract_content)
-        ])
-        ouput_text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.key_spare_parts_info_result_parser.parse(ouput_text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {ouput_text}")
-            ouput_text = await self.output_format_refine(ouput_text, self.key_spare_parts_info_result_parser.get_format_instructions())
-            parsed_result = self.key_spare_parts_info_result_parser.parse(ouput_text)
-        return parsed_result
+        ], contract_content, self.key_spare_parts_info_result_parser)
 
     async def extract_response_arrival_info(self, contract_content: str):
-        response = await self.llm.ainvoke([
+        return await self._extract_items("onsite_sla", [
             ("system", self.general_service_info_prompt),
-            ("system", f"请分析并拆解合同中关于设备保修SLA相关的信息，**注意不要将单个保修服务拆分成多个，一个设备往往只有一个保修服务**。\n输出格式: {self.response_arrival_output_parser.get_format_instructions()}"),
-            ("user", contract_content)
-        ])
-        ouput_text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.response_arrival_output_parser.parse(ouput_text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {ouput_text}")
-            ouput_text = await self.output_format_refine(ouput_text, self.response_arrival_output_parser.get_format_instructions())
-            parsed_result = self.response_arrival_output_parser.parse(ouput_text)
-        return parsed_result
-
+            ("system", "请分析并拆解合同中关于设备保修SLA相关的信息，**注意不要将单个保修服务拆分成多个，一个设备往往只有一个保修服务**。"),
+        ], contract_content, self.response_arrival_output_parser)
 
     async def extract_yearly_maintenance_info(self, contract_content: str):
-        response = await self.llm.ainvoke([
+        return await self._extract_items("yearly_maintenance", [
             ("system", self.general_service_info_prompt),
-            ("system", f"请分析并拆解合同中关于年度保养相关的信息，输出格式: {self.yearly_maintenance_output_parser.get_format_instructions()}"),
-            ("user", contract_content)
-        ])
-        ouput_text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.yearly_maintenance_output_parser.parse(ouput_text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {ouput_text}")
-            ouput_text = await self.output_format_refine(ouput_text, self.yearly_maintenance_output_parser.get_format_instructions())
-            parsed_result = self.yearly_maintenance_output_parser.parse(ouput_text)
-        return parsed_result
+            ("system", "请分析并拆解合同中关于年度保养相关的信息。"),
+        ], contract_content, self.yearly_maintenance_output_parser)
 
     async def extract_remote_maintenance_info(self, contract_content: str):
-        response = await self.llm.ainvoke([
+        return await self._extract_items("remote_maintenance", [
             ("system", self.general_service_info_prompt),
-            ("system", f"输出格式: {self.remote_maintenance_output_parser.get_format_instructions()}"),
-            ("user", contract_content)
-        ])
-        ouput_text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.remote_maintenance_output_parser.parse(ouput_text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {ouput_text}")
-            ouput_text = await self.output_format_refine(ouput_text, self.remote_maintenance_output_parser.get_format_instructions())
-            parsed_result = self.remote_maintenance_output_parser.parse(ouput_text)
-        return parsed_result
\ No newline at end of file
+        ], contract_content, self.remote_maintenance_output_parser)
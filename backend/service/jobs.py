@@ -0,0 +1,582 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from config import (
+    JOB_DATA_DIR,
+    JOB_DB_PATH,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_SECONDS,
+    JOB_WORKERS,
+)
+from models.analysis import ContractAnalysisRequest, ContractAnalysisResult
+from models.compliance import NonStandardDetectionReport, NonStandardDetectionRequest, StandardClauses
+from models.job import JobInfo, JobProgress
+from models.ocr import OcrDocumentResult, OcrPageResult
+from models.service_plan import ServicePlanRecommendationRequest
+from service.analysis_pipeline import NON_STANDARD_NODE, OCR_NODE
+from service.call_policy import is_retryable
+from service.clause_sets import clause_sets
+from service.token_usage import usage_scope
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+# 任务类型 -> 同步接口的请求体（PDF 输入的任务另见 PDF_JOB_KINDS）
+JOB_REQUEST_MODELS = {
+    "contract_analysis": ContractAnalysisRequest,
+    "non_standard_detection": NonStandardDetectionRequest,
+    "service_plan_recommendation": ServicePlanRecommendationRequest,
+}
+PDF_JOB_KINDS = ("pdf_to_markdown", "contract_analysis")
+_PAGE_STAGE = "page:"
+_JOB_COLUMNS = (
+    "id, kind, status, attempts, cancel_requested, created_at, started_at, finished_at, "
+    "page_count, progress, result, error"
+)
+
+
+class JobNotFoundError(KeyError):
+    """任务ID不存在"""
+
+
+@dataclass
+class JobRecord:
+    """工作进程领取到的任务"""
+    id: str
+    kind: str
+    request: Dict[str, Any]
+    input_path: Optional[str]
+    attempts: int
+
+
+def _progress(stages: List[str], page_count: Optional[int]) -> JobProgress:
+    return JobProgress(
+        stages_completed=sorted(stage for stage in stages if not stage.startswith(_PAGE_STAGE)),
+        pages_completed=sum(1 for stage in stages if stage.startswith(_PAGE_STAGE)),
+        page_count=page_count,
+    )
+
+
+class JobStore:
+    """sqlite 持久化的任务队列与检查点，可由多个进程共享（领取任务时加写锁，执行中的任务按租约续期）"""
+
+    def __init__(self, path: str, data_dir: str) -> None:
+        self.path = path
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, request TEXT NOT NULL, input_path TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "worker TEXT, lease_until REAL, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+                "page_count INTEGER, progress TEXT, result TEXT, error TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_checkpoints ("
+                "job_id TEXT NOT NULL, stage TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (job_id, stage))"
+            )
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connection()
+            # IMMEDIATE：开始事务时即取得写锁，多个进程同时领取任务时不会领到同一个
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _info(self, conn: sqlite3.Connection, row: tuple, include_result: bool = True) -> JobInfo:
+        (job_id, kind, status, attempts, cancel_requested, created_at, started_at, finished_at,
+         page_count, progress, result, error) = row
+        if progress is not None:
+            job_progress = JobProgress.model_validate_json(progress)
+        else:
+            stages = [stage for (stage,) in conn.execute("SELECT stage FROM job_checkpoints WHERE job_id = ?", (job_id,))]
+            job_progress = _progress(stages, page_count)
+        return JobInfo(
+            id=job_id,
+            kind=kind,
+            status=status,
+            attempts=attempts,
+            cancel_requested=bool(cancel_requested),
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at,
+            progress=job_progress,
+            result=json.loads(result) if include_result and result is not None else None,
+            error=error,
+        )
+
+    def _select(self, conn: sqlite3.Connection, job_id: str) -> tuple:
+        row = conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise JobNotFoundError(job_id)
+        return row
+
+    def _close_job(self, conn: sqlite3.Connection, job_id: str, status: str, result: Optional[str], error: Optional[str]) -> None:
+        """进入终态：记录最终进度，删除输入文件与检查点（终态任务不会再执行，检查点不再需要）"""
+        stages = [stage for (stage,) in conn.execute("SELECT stage FROM job_checkpoints WHERE job_id = ?", (job_id,))]
+        input_path, page_count = conn.execute("SELECT input_path, page_count FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, worker = NULL, lease_until = NULL, progress = ? "
+            "WHERE id = ?",
+            (status, result, error, time.time(), _progress(stages, page_count).model_dump_json(), job_id),
+        )
+        conn.execute("DELETE FROM job_checkpoints WHERE job_id = ?", (job_id,))
+        if input_path:
+            try:
+                os.remove(input_path)
+            except FileNotFoundError:
+                pass
+
+    def create_sync(self, kind: str, request: Dict[str, Any], source: Optional[BinaryIO] = None) -> JobInfo:
+        """source 为 PDF 文件对象时复制到 JOB_DATA_DIR，任务结束后删除"""
+        job_id = uuid.uuid4().hex
+        input_path = None
+        if source is not None:
+            os.makedirs(self.data_dir, exist_ok=True)
+            input_path = os.path.join(self.data_dir, f"{job_id}.pdf")
+            source.seek(0)
+            with open(input_path, "wb") as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, request, input_path, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(request, ensure_ascii=False), input_path, time.time()),
+            )
+            return self._info(conn, self._select(conn, job_id))
+
+    def claim_sync(self, worker: str, lease_seconds: float, max_attempts: int) -> Optional[JobRecord]:
+        """领取最早提交的排队任务；同时回收租约已过期（进程中断）的执行中任务"""
+        now = time.time()
+        with self._transaction() as conn:
+            expired = conn.execute(
+                "SELECT id, attempts, cancel_requested FROM jobs WHERE status = 'running' AND lease_until < ?", (now,)
+            ).fetchall()
+            for job_id, attempts, cancel_requested in expired:
+                if cancel_requested:
+                    self._close_job(conn, job_id, "cancelled", None, "已取消")
+                elif attempts >= max_attempts:
+                    self._close_job(conn, job_id, "failed", None, f"任务执行 {attempts} 次均被中断")
+                else:
+                    print(f"Job {job_id} lease expired, requeued (attempt {attempts})")
+                    conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL WHERE id = ?", (job_id,))
+
+            row = conn.execute(
+                "SELECT id, kind, request, input_path, attempts FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kind, request, input_path, attempts = row
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker, now + lease_seconds, now, job_id),
+            )
+        return JobRecord(id=job_id, kind=kind, request=json.loads(request), input_path=input_path, attempts=attempts + 1)
+
+    def heartbeat_sync(self, job_id: str, worker: str, lease_seconds: float) -> Optional[bool]:
+        """续租并返回是否已请求取消；任务已不属于该工作进程（租约过期被回收）时返回 None"""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, worker),
+            ).rowcount
+            if not updated:
+                return None
+            (cancel_requested,) = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(cancel_requested)
+
+    def finish_sync(self, job_id: str, worker: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        payload = json.dumps(result, ensure_ascii=False) if result is not None else None
+        with self._transaction() as conn:
+            owner = conn.execute("SELECT worker, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if owner is None or owner != (worker, "running"):
+                return False
+            self._close_job(conn, job_id, status, payload, error)
+        return True
+
+    def requeue_sync(self, job_id: str, worker: str, error: str) -> bool:
+        """可重试的失败（超时、限流等）放回队列，保留检查点与执行次数；已请求取消时直接取消"""
+        with self._transaction() as conn:
+            owner = conn.execute("SELECT worker, status, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if owner is None or owner[:2] != (worker, "running"):
+                return False
+            if owner[2]:
+                self._close_job(conn, job_id, "cancelled", None, "已取消")
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, error = ? WHERE id = ?",
+                    (error, job_id),
+                )
+        return True
+
+    def release_sync(self, job_id: str, worker: str) -> None:
+        """工作进程正常退出时把执行中的任务放回队列，不计入执行次数"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (job_id, worker),
+            )
+
+    def cancel_sync(self, job_id: str) -> JobInfo:
+        """排队中的任务直接取消；执行中的任务标记取消，由工作进程在下一次心跳时停止；已结束的任务不变"""
+        with self._transaction() as conn:
+            (status,) = self._select(conn, job_id)[2:3]
+            if status == "queued":
+                self._close_job(conn, job_id, "cancelled", None, "已取消")
+            elif status == "running":
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return self._info(conn, self._select(conn, job_id))
+
+    def set_page_count_sync(self, job_id: str, page_count: int) -> None:
+        with self._lock:
+            self._connection().execute("UPDATE jobs SET page_count = ? WHERE id = ?", (page_count, job_id))
+
+    def save_checkpoint_sync(self, job_id: str, stage: str, payload: str) -> None:
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO job_checkpoints (job_id, stage, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, stage, payload, time.time()),
+            )
+
+    def checkpoints_sync(self, job_id: str) -> Dict[str, str]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT stage, payload FROM job_checkpoints WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def info_sync(self, job_id: str, include_result: bool = True) -> JobInfo:
+        with self._lock:
+            conn = self._connection()
+            return self._info(conn, self._select(conn, job_id), include_result)
+
+    def list_sync(self, status: Optional[str] = None, limit: int = 50) -> List[JobInfo]:
+        with self._lock:
+            conn = self._connection()
+            if status:
+                rows = conn.execute(
+                    f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            return [self._info(conn, row, include_result=False) for row in rows]
+
+    def stats_sync(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict(rows)
+        return {status: counts.get(status, 0) for status in ("queued", "running", *TERMINAL_STATUSES)}
+
+    async def create(self, kind: str, request: Dict[str, Any], source: Optional[BinaryIO] = None) -> JobInfo:
+        return await asyncio.to_thread(self.create_sync, kind, request, source)
+
+    async def claim(self, worker: str, lease_seconds: float, max_attempts: int) -> Optional[JobRecord]:
+        return await asyncio.to_thread(self.claim_sync, worker, lease_seconds, max_attempts)
+
+    async def heartbeat(self, job_id: str, worker: str, lease_seconds: float) -> Optional[bool]:
+        return await asyncio.to_thread(self.heartbeat_sync, job_id, worker, lease_seconds)
+
+    async def finish(self, job_id: str, worker: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self.finish_sync, job_id, worker, status, result, error)
+
+    async def requeue(self, job_id: str, worker: str, error: str) -> bool:
+        return await asyncio.to_thread(self.requeue_sync, job_id, worker, error)
+
+    async def release(self, job_id: str, worker: str) -> None:
+        await asyncio.to_thread(self.release_sync, job_id, worker)
+
+    async def cancel(self, job_id: str) -> JobInfo:
+        return await asyncio.to_thread(self.cancel_sync, job_id)
+
+    async def set_page_count(self, job_id: str, page_count: int) -> None:
+        await asyncio.to_thread(self.set_page_count_sync, job_id, page_count)
+
+    async def save_checkpoint(self, job_id: str, stage: str, payload: str) -> None:
+        await asyncio.to_thread(self.save_checkpoint_sync, job_id, stage, payload)
+
+    async def checkpoints(self, job_id: str) -> Dict[str, str]:
+        return await asyncio.to_thread(self.checkpoints_sync, job_id)
+
+    async def info(self, job_id: str, include_result: bool = True) -> JobInfo:
+        return await asyncio.to_thread(self.info_sync, job_id, include_result)
+
+    async def list(self, status: Optional[str] = None, limit: int = 50) -> List[JobInfo]:
+        return await asyncio.to_thread(self.list_sync, status, limit)
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self.stats_sync)
+
+
+@lru_cache(maxsize=None)
+def _node_adapter(name: str) -> TypeAdapter:
+    if name == OCR_NODE:
+        return TypeAdapter(OcrDocumentResult)
+    if name == NON_STANDARD_NODE:
+        return TypeAdapter(NonStandardDetectionReport)
+    return TypeAdapter(ContractAnalysisResult.model_fields[name].annotation)
+
+
+class JobCheckpoint:
+    """单个任务的检查点，接口供 run_dag（load_node/save_node）与 OcrPdfParser.parse_document（pages/save_page）使用"""
+
+    def __init__(self, store: JobStore, job_id: str, saved: Dict[str, str]) -> None:
+        self.store = store
+        self.job_id = job_id
+        self._saved = saved
+
+    def __len__(self) -> int:
+        return len(self._saved)
+
+    async def load_node(self, name: str) -> Tuple[bool, Any]:
+        payload = self._saved.get(name)
+        if payload is None:
+            return False, None
+        try:
+            return True, _node_adapter(name).validate_json(payload)
+        except ValidationError as exc:
+            # 结果结构已变化（如升级后字段调整），重新执行该节点
+            print(f"Job {self.job_id} checkpoint {name} is stale: {exc}")
+            return False, None
+
+    async def save_node(self, name: str, result: Any) -> None:
+        payload = _node_adapter(name).dump_json(result).decode("utf-8")
+        self._saved[name] = payload
+        await self.store.save_checkpoint(self.job_id, name, payload)
+
+    async def set_page_count(self, page_count: int) -> None:
+        await self.store.set_page_count(self.job_id, page_count)
+
+    def pages(self) -> List[OcrPageResult]:
+        return [
+            OcrPageResult.model_validate_json(payload)
+            for stage, payload in self._saved.items()
+            if stage.startswith(_PAGE_STAGE)
+        ]
+
+    async def save_page(self, page: OcrPageResult) -> None:
+        stage = f"{_PAGE_STAGE}{page.page_number}"
+        payload = page.model_dump_json()
+        self._saved[stage] = payload
+        await self.store.save_checkpoint(self.job_id, stage, payload)
+
+
+class JobRunner:
+    """按任务类型调用与同步接口相同的服务，返回与同步接口响应相同、可 JSON 序列化的结果"""
+
+    def __init__(self, ocr_parser, pipeline, non_standard_detector, service_plan_recommender) -> None:
+        self.ocr_parser = ocr_parser
+        self.pipeline = pipeline
+        self.non_standard_detector = non_standard_detector
+        self.service_plan_recommender = service_plan_recommender
+
+    async def run(self, job: JobRecord, checkpoint: JobCheckpoint) -> Any:
+        # 异步任务的模型调用按任务类型汇总到 token 用量统计
+        with usage_scope(endpoint=f"jobs/{job.kind}"):
+            return await self._run(job, checkpoint)
+
+    async def _run(self, job: JobRecord, checkpoint: JobCheckpoint) -> Any:
+        request = job.request
+        if job.input_path is not None:
+            await checkpoint.set_page_count(await asyncio.to_thread(self.ocr_parser.page_count, job.input_path))
+
+        if job.kind == "pdf_to_markdown":
+            found, document = await checkpoint.load_node(OCR_NODE)
+            if not found:
+                document = await self.ocr_parser.parse_document(job.input_path, checkpoint=checkpoint)
+                await checkpoint.save_node(OCR_NODE, document)
+            return document.to_response().model_dump(mode="json")
+
+        if job.kind == "contract_analysis":
+            clauses = TypeAdapter(List[StandardClauses]).validate_python(request.get("standard_clauses") or [])
+            result = await self.pipeline.run(
+                markdown=request.get("content") if job.input_path is None else None,
+                pdf_path=job.input_path,
+                standard_clauses=await clause_sets.resolve(clauses, request.get("clause_set_id")),
+                extractors=request.get("extractors"),
+                checkpoint=checkpoint,
+            )
+            return result.model_dump(mode="json")
+
+        if job.kind == "non_standard_detection":
+            detection = NonStandardDetectionRequest.model_validate(request)
+            found, report = await checkpoint.load_node(NON_STANDARD_NODE)
+            if not found:
+                clause_set = await clause_sets.resolve(detection.standard_clauses, detection.clause_set_id)
+                if clause_set is None:
+                    raise ValueError("必须提供 standard_clauses 或 clause_set_id")
+                report = await self.non_standard_detector.process_with_timings(detection.content, clause_set, detection.mode)
+                await checkpoint.save_node(NON_STANDARD_NODE, report)
+            return report.model_dump(mode="json")
+
+        if job.kind == "service_plan_recommendation":
+            result = await self.service_plan_recommender.recommend(ServicePlanRecommendationRequest.model_validate(request))
+            return result.model_dump(mode="json", by_alias=True)
+
+        raise ValueError(f"未知的任务类型: {job.kind}")
+
+
+class JobWorkerPool:
+    """任务工作协程池：轮询领取任务并执行，执行期间按租约定期续期并检查取消请求"""
+
+    def __init__(
+        self,
+        store: JobStore,
+        runner: JobRunner,
+        workers: int = JOB_WORKERS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ) -> None:
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._tasks or self.workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._loop(f"{self.worker_id}#{index}"))
+            for index in range(self.workers)
+        ]
+        print(f"Job worker pool started: {self.workers} workers ({self.worker_id})")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run_forever(self) -> None:
+        self.start()
+        await asyncio.gather(*self._tasks)
+
+    def notify(self) -> None:
+        """有新任务提交时唤醒空闲的工作协程（其他进程提交的任务靠轮询发现）"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _loop(self, worker: str) -> None:
+        while True:
+            try:
+                job = await self.store.claim(worker, self.lease_seconds, self.max_attempts)
+            except sqlite3.Error as exc:
+                print(f"Job worker {worker} failed to claim a job: {exc}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._execute(job, worker)
+            except Exception as exc:
+                # 记录结果或清理输入文件失败（如数据库被锁、无权限）时工作协程继续运行，
+                # 任务租约过期后由其他工作协程重新执行
+                print(f"Job {job.id} could not be finalized by {worker}: {exc}")
+                traceback.print_exc()
+
+    async def _execute(self, job: JobRecord, worker: str) -> None:
+        checkpoint = JobCheckpoint(self.store, job.id, await self.store.checkpoints(job.id))
+        print(f"Job {job.id} ({job.kind}) started by {worker}, attempt {job.attempts}, {len(checkpoint)} checkpoints restored")
+        started = time.perf_counter()
+        task = asyncio.create_task(self.runner.run(job, checkpoint))
+        lease_lost = False
+        try:
+            while not task.done():
+                done, _ = await asyncio.wait({task}, timeout=max(1.0, self.lease_seconds / 3))
+                if done:
+                    break
+                try:
+                    state = await self.store.heartbeat(job.id, worker, self.lease_seconds)
+                except sqlite3.Error as exc:
+                    print(f"Job {job.id} heartbeat failed: {exc}")
+                    continue
+                if state is None or state:
+                    lease_lost = state is None
+                    task.cancel()
+                    await asyncio.wait({task})
+        except asyncio.CancelledError:
+            # 工作协程被关闭（进程退出）：停止任务并放回队列，下次启动时从检查点继续
+            task.cancel()
+            # 放回队列在线程中执行，不阻塞关闭过程中的事件循环；shield 避免再次取消时中断
+            await asyncio.shield(self.store.release(job.id, worker))
+            raise
+
+        elapsed = (time.perf_counter() - started) * 1000
+        if lease_lost:
+            print(f"Job {job.id} lease lost, abandoned by {worker}")
+        elif task.cancelled():
+            await self.store.finish(job.id, worker, "cancelled", error="已取消")
+            print(f"Job {job.id} cancelled after {elapsed:.0f}ms")
+        elif task.exception() is not None and is_retryable(task.exception()) and job.attempts < self.max_attempts:
+            # call_policy 的重试用尽后仍是暂时性错误：整个任务放回队列，从检查点继续
+            error = task.exception()
+            await self.store.requeue(job.id, worker, str(error) or type(error).__name__)
+            self.notify()
+            print(f"Job {job.id} requeued after {elapsed:.0f}ms (attempt {job.attempts}/{self.max_attempts}): {error}")
+        elif task.exception() is not None:
+            error = task.exception()
+            await self.store.finish(job.id, worker, "failed", error=str(error) or type(error).__name__)
+            print(f"Job {job.id} failed after {elapsed:.0f}ms: {error}")
+        else:
+            await self.store.finish(job.id, worker, "succeeded", result=task.result())
+            print(f"Job {job.id} succeeded in {elapsed:.0f}ms")
+
+
+job_store = JobStore(JOB_DB_PATH, JOB_DATA_DIR)
+
+
+__all__ = [
+    "JOB_REQUEST_MODELS",
+    "PDF_JOB_KINDS",
+    "JobCheckpoint",
+    "JobNotFoundError",
+    "JobRecord",
+    "JobRunner",
+    "JobStore",
+    "JobWorkerPool",
+    "job_store",
+]
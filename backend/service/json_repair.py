@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import re
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from service.token_usage import current_ledger, usage_scope
+
+T = TypeVar("T", bound=BaseModel)
+
+_FENCED_BLOCK = re.compile(r"(?:```|~~~)[\w-]*[ \t]*\n?(.*?)(?:```|~~~|$)", re.S)
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_HEX_DIGITS = set("0123456789abcdefABCDEF")
+_FULLWIDTH_PUNCTUATION = {"：": ":", "，": ",", "｛": "{", "｝": "}", "［": "[", "］": "]"}
+
+
+class JsonRepairError(ValueError):
+    """本地修复后仍无法通过模型校验"""
+
+
+def _strip_code_fence(text: str) -> str:
+    match = _FENCED_BLOCK.search(text)
+    return match.group(1) if match else text
+
+
+def _balanced_end(text: str, start: int) -> int:
+    """从 start 处的括号开始扫描（跳过字符串内容），返回与之配对的结尾括号位置，未闭合时返回 -1"""
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        ch = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return index
+    return -1
+
+
+def _strip_surrounding_text(text: str) -> str:
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return text
+    start = min(starts)
+    end = _balanced_end(text, start)
+    # 括号未闭合说明输出被截断，只去掉前面的说明文字，交给截断修复处理；
+    # 已闭合时其后的文字（即使含逗号、引号、括号）都是结尾说明
+    if end < 0:
+        return text[start:]
+    return text[start:end + 1]
+
+
+def _normalize_fullwidth(text: str) -> str:
+    """字符串外的中文引号、冒号、逗号替换为 JSON 语法字符；字符串内的内容保持原样"""
+    out: List[str] = []
+    closers: Optional[str] = None
+    escaped = False
+    for ch in text:
+        if closers is not None:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch in closers:
+                closers = None
+                ch = '"'
+            out.append(ch)
+            continue
+        if ch == '"':
+            closers = '"'
+        elif ch in "“”":
+            closers = '”"'
+            ch = '"'
+        else:
+            ch = _FULLWIDTH_PUNCTUATION.get(ch, ch)
+        out.append(ch)
+    return "".join(out)
+
+
+def _escape_control_characters(text: str) -> str:
+    out: List[str] = []
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            elif ch == "\r":
+                ch = "\\r"
+            elif ch == "\t":
+                ch = "\\t"
+            elif ord(ch) < 0x20:
+                ch = f"\\u{ord(ch):04x}"
+        elif ch == '"':
+            in_string = True
+        out.append(ch)
+    return "".join(out)
+
+
+def _escape_invalid_backslashes(text: str) -> str:
+    """字符串内不构成合法转义的反斜杠（如 Windows 路径、\\d）按普通字符转义"""
+    out: List[str] = []
+    in_string = False
+    index = 0
+    while index < len(text):
+        ch = text[index]
+        if in_string and ch == "\\":
+            following = text[index + 1:index + 2]
+            valid = following in _VALID_ESCAPES and following != ""
+            if following == "u":
+                valid = len(text) >= index + 6 and all(c in _HEX_DIGITS for c in text[index + 2:index + 6])
+            if valid:
+                out.append(text[index:index + 2])
+                index += 2
+                continue
+            out.append("\\\\")
+            index += 1
+            continue
+        if ch == '"':
+            in_string = not in_string
+        out.append(ch)
+        index += 1
+    return "".join(out)
+
+
+def _escape_inner_quotes(text: str) -> str:
+    """字符串内未转义的英文引号：其后不是 , } ] : 时视为内容并转义"""
+    out: List[str] = []
+    in_string = False
+    escaped = False
+    for index, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                rest = text[index + 1:].lstrip()
+                if rest and rest[0] not in ",}]:":
+                    out.append('\\"')
+                    continue
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        out.append(ch)
+    return "".join(out)
+
+
+def _remove_trailing_commas(text: str) -> str:
+    out: List[str] = []
+    in_string = False
+    escaped = False
+    for index, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ",":
+            rest = text[index + 1:].lstrip()
+            if rest[:1] in ("}", "]"):
+                continue
+        out.append(ch)
+    return "".join(out)
+
+
+def _close_truncated(text: str) -> str:
+    """输出被截断时回退到最外层未闭合数组的最后一个完整元素，并补齐未闭合的括号。
+
+    只在数组元素之间截断：写了一半的对象（包括其中已完整的键值对与嵌套数组元素）整体丢弃，
+    不会补齐成一个字段缺失却能通过校验的元素；最外层未闭合数组中没有完整元素时原样返回。
+    """
+    # 栈中每项为 (闭合括号, 开括号位置)
+    stack: List[Tuple[str, int]] = []
+    in_string = False
+    escaped = False
+    # 数组开括号位置 -> 该数组最后一个完整元素之后的 (截断位置, 截断后仍未闭合的括号)
+    boundaries: Dict[int, Tuple[int, Tuple[str, ...]]] = {}
+    for index, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(("}" if ch == "{" else "]", index))
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if stack and stack[-1][0] == "]":
+                boundaries[stack[-1][1]] = (index + 1, tuple(closer for closer, _ in stack))
+        elif ch == "," and stack and stack[-1][0] == "]":
+            boundaries[stack[-1][1]] = (index, tuple(closer for closer, _ in stack))
+    if not stack and not in_string:
+        return text
+    outermost = next((start for closer, start in stack if closer == "]"), None)
+    if outermost not in boundaries:
+        return text
+    cut, remaining = boundaries[outermost]
+    return text[:cut].rstrip().rstrip(",") + "".join(reversed(remaining))
+
+
+# 截断修复会丢弃未写完的元素，结果不完整
+TRUNCATED = "truncated"
+
+# 按顺序累积执行，每一步改变文本后立即尝试校验
+REPAIRS: List[Tuple[str, Callable[[str], str]]] = [
+    ("code_fence", _strip_code_fence),
+    ("surrounding_text", _strip_surrounding_text),
+    ("fullwidth_punctuation", _normalize_fullwidth),
+    ("control_characters", _escape_control_characters),
+    ("invalid_escape", _escape_invalid_backslashes),
+    ("unescaped_quote", _escape_inner_quotes),
+    ("trailing_comma", _remove_trailing_commas),
+    (TRUNCATED, _close_truncated),
+]
+
+
+class JsonRepairStats:
+    def __init__(self) -> None:
+        self.outcomes: Counter = Counter()
+        self.kinds: Counter = Counter()
+
+    def stats(self) -> dict:
+        return {
+            "outcomes": {
+                name: self.outcomes[name]
+                for name in ("direct", "repaired", TRUNCATED, "llm_refined", "failed")
+            },
+            "repairs": {name: self.kinds[name] for name, _ in REPAIRS},
+        }
+
+
+json_repair_stats = JsonRepairStats()
+
+
+def _validate(text: str, model: Type[T]) -> Tuple[Optional[T], Optional[ValidationError]]:
+    try:
+        return model.model_validate_json(text), None
+    except ValidationError as exc:
+        return None, exc
+
+
+def repair_and_validate(text: str, model: Type[T]) -> Tuple[T, List[str]]:
+    """本地确定性修复：返回 (校验后的结果, 实际生效的修复类型)，全部失败时抛出 JsonRepairError"""
+    result, error = _validate(text, model)
+    if result is not None:
+        return result, []
+    applied: List[str] = []
+    for kind, repair in REPAIRS:
+        repaired = repair(text)
+        if repaired == text:
+            continue
+        text = repaired
+        applied.append(kind)
+        result, error = _validate(text, model)
+        if result is not None:
+            return result, applied
+    raise JsonRepairError(f"本地修复失败（已尝试: {', '.join(applied) or '无'}）: {error}")
+
+
+async def parse_llm_json(
+    text: str,
+    model: Type[T],
+    refine: Callable[[str], Awaitable[str]],
+) -> Tuple[T, List[str]]:
+    """先本地修复并用 pydantic-core 校验，仍失败时才调用 refine（LLM 格式修复）再校验一次。
+
+    返回 (结果, 实际生效的修复类型)。含 TRUNCATED 时结果只保留了截断前的完整元素，
+    计为 truncated 而不是 repaired，调用方不应缓存。
+    """
+    try:
+        result, applied = repair_and_validate(text, model)
+    except JsonRepairError as exc:
+        print(f"Error parsing result: {exc}")
+        print(f"Raw text: {text}")
+    else:
+        if TRUNCATED in applied:
+            json_repair_stats.outcomes[TRUNCATED] += 1
+            json_repair_stats.kinds.update(applied)
+            print(f"JSON 输出被截断，只保留完整元素: {', '.join(applied)}")
+        elif applied:
+            json_repair_stats.outcomes["repaired"] += 1
+            json_repair_stats.kinds.update(applied)
+            print(f"JSON 本地修复成功: {', '.join(applied)}")
+        else:
+            json_repair_stats.outcomes["direct"] += 1
+        return result, applied
+
+    # 格式修复调用单独记入 "<阶段>/refine"，便于区分抽取本身与修复消耗的 token
+    ledger = current_ledger()
+    try:
+        with usage_scope(stage=f"{ledger.stage}/refine" if ledger is not None and ledger.stage else "refine"):
+            refined = await refine(text)
+        result, applied = repair_and_validate(refined, model)
+    except Exception:
+        # 修复调用本身失败（超时、录制中没有对应响应等）同样计为解析失败
+        json_repair_stats.outcomes["failed"] += 1
+        raise
+    json_repair_stats.outcomes[TRUNCATED if TRUNCATED in applied else "llm_refined"] += 1
+    json_repair_stats.kinds.update(applied)
+    return result, applied
+
+
+__all__ = [
+    "JsonRepairError",
+    "TRUNCATED",
+    "json_repair_stats",
+    "parse_llm_json",
+    "repair_and_validate",
+]
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import typing
+from typing import List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+
+def _decode_key(raw: str) -> str:
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
+
+
+def list_field(output_model: Type[BaseModel]) -> Optional[Tuple[str, Type[BaseModel]]]:
+    """输出模型中第一个元素为 Pydantic 模型的列表字段（如 item_list、extracted_clauses），没有时返回 None"""
+    for name, field in output_model.model_fields.items():
+        if typing.get_origin(field.annotation) in (list, List):
+            args = typing.get_args(field.annotation)
+            if args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+                return name, args[0]
+    return None
+
+
+class StreamingArrayParser:
+    """增量扫描模型输出的 JSON 文本：顶层对象中 field 数组的每个对象元素一闭合就返回其原文。
+
+    只跟踪括号深度与字符串/转义状态，不构建中间结果，每个字符只扫描一次；
+    顶层对象之前的内容（如 ```json 代码块标记、说明文字）与之后的内容都被忽略。
+    缓冲区只保留尚未闭合的元素（或顶层键名）起点之后的文本，长输出逐块追加时不会反复复制整段。
+    """
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._in_array = False
+        self._item_start = -1
+
+    def feed(self, text: str) -> List[str]:
+        """追加一段输出，返回本段内闭合的数组元素原文"""
+        if self.done or not text:
+            return []
+        self._text += text
+        buffer = self._text
+        items: List[str] = []
+        i = self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            if self._depth == 0:
+                # 顶层对象开始之前只找 "{"
+                if ch == "{":
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = buffer[self._string_start + 1:i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._key == self.field:
+                    self._in_array = True
+                elif ch == "{" and self._depth == 3 and self._in_array:
+                    self._item_start = i
+            elif ch in "}]":
+                if ch == "}" and self._depth == 3 and self._item_start >= 0:
+                    items.append(buffer[self._item_start:i + 1])
+                    self._item_start = -1
+                elif ch == "]" and self._depth == 2:
+                    self._in_array = False
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+                    i += 1
+                    break
+            elif self._depth == 1:
+                if ch == ":":
+                    self._key = _decode_key(self._last_string) if self._last_string is not None else None
+                elif ch == ",":
+                    self._key = None
+            i += 1
+        self._pos = i
+        self._trim()
+        return items
+
+    def _trim(self) -> None:
+        """丢弃已扫描且不再需要的前缀，位置下标同步平移"""
+        if self.done:
+            self._text = ""
+            return
+        keep = self._pos
+        if self._item_start >= 0:
+            keep = min(keep, self._item_start)
+        if self._in_string and self._depth == 1:
+            keep = min(keep, self._string_start)
+        if keep == 0:
+            return
+        self._text = self._text[keep:]
+        self._pos -= keep
+        if self._item_start >= 0:
+            self._item_start -= keep
+        self._string_start = self._string_start - keep if self._string_start >= keep else -1
+
+
+__all__ = [
+    "StreamingArrayParser",
+    "list_field",
+]
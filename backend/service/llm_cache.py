@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import zstandard
+
+from config import (
+    LLM_CACHE_DIR,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_MEMORY_ITEMS,
+    LLM_CACHE_TTL_SECONDS,
+)
+
+# 由请求中间件根据 LLM_CACHE_BYPASS_HEADER 设置，为 True 时跳过读缓存（仍会写入新结果）
+cache_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+def make_cache_key(*parts: Any) -> str:
+    """对任意可 JSON 序列化的内容计算稳定的 sha256 摘要"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            hasher.update(part)
+        else:
+            hasher.update(json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        hasher.update(b"\x00")
+    return hasher.hexdigest()
+
+
+class TieredCache:
+    """内存 LRU + sqlite(zstd 压缩) 两级缓存。
+
+    磁盘层按最近访问时间做 LRU 淘汰，总大小超过 max_bytes 时删除最旧条目；
+    超过 ttl_seconds 的条目视为失效。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        memory_items: int = 256,
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+        enabled: bool = True,
+    ) -> None:
+        self.path = path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._memory: "OrderedDict[str, tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._compressor = zstandard.ZstdCompressor(level=3)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+        return self._conn
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, value: bytes) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_sync(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            conn = self._connection()
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self._expired(row[1], now):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            value = self._decompressor.decompress(row[0])
+            self._remember(key, row[1], value)
+            self.hits += 1
+            return value
+
+    def set_sync(self, key: str, value: bytes) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        compressed = self._compressor.compress(value)
+        with self._lock:
+            self._remember(key, now, value)
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, compressed, len(compressed), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        if self.ttl_seconds is not None:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self.get_sync, key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.set_sync, key, value)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses, "memory_items": len(self._memory)}
+
+
+class LlmResponseCache:
+    """以 (消息内容, 模型, 温度, 输出模型) 为键缓存解析后的 Pydantic 结果"""
+
+    def __init__(self, store: TieredCache) -> None:
+        self.store = store
+
+    @staticmethod
+    def key_for(llm, messages: Any, output_model: type) -> str:
+        return make_cache_key(
+            output_model.__name__,
+            getattr(llm, "model_name", None),
+            getattr(llm, "temperature", None),
+            messages,
+        )
+
+    async def get(self, key: str, output_model: type):
+        if cache_bypass.get():
+            return None
+        cached = await self.store.get(key)
+        if cached is None:
+            return None
+        try:
+            return output_model.model_validate_json(cached)
+        except Exception as exc:
+            # 模型结构调整后旧缓存可能无法通过校验，直接当作未命中
+            print(f"Discarding stale cache entry {key}: {exc}")
+            return None
+
+    async def set(self, key: str, result) -> None:
+        await self.store.set(key, result.model_dump_json().encode("utf-8"))
+
+
+llm_response_cache = LlmResponseCache(
+    TieredCache(
+        os.path.join(LLM_CACHE_DIR, "llm_responses.sqlite3"),
+        memory_items=LLM_CACHE_MEMORY_ITEMS,
+        max_bytes=LLM_CACHE_MAX_BYTES,
+        ttl_seconds=LLM_CACHE_TTL_SECONDS,
+        enabled=LLM_CACHE_ENABLED,
+    )
+)
+
+
+__all__ = [
+    "LlmResponseCache",
+    "TieredCache",
+    "cache_bypass",
+    "llm_response_cache",
+    "make_cache_key",
+]
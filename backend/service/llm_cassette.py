@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+from config import LLM_CASSETTE_MODE, LLM_CASSETTE_PATH, LLM_CASSETTE_REPLAY_LATENCY
+from service.llm_cache import make_cache_key
+from service.token_usage import current_ledger
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+MODES = (OFF, RECORD, REPLAY)
+
+
+class CassetteMissError(RuntimeError):
+    """回放时找不到对应的录制响应（不重试，也不会退回真实调用）"""
+
+    def __init__(self, model: str, stage: Optional[str]) -> None:
+        super().__init__(f"录制中没有模型 {model}（阶段 {stage or '-'}）的对应请求，请重新录制")
+        self.model = model
+        self.stage = stage
+
+
+def _message_parts(messages: Any) -> List[Tuple[str, Any]]:
+    """把 str / (role, content) / dict / BaseMessage 形式的消息统一为 (role, content)"""
+    if isinstance(messages, str):
+        return [("user", messages)]
+    parts = []
+    for message in messages:
+        if isinstance(message, tuple):
+            parts.append((message[0], message[1]))
+        elif isinstance(message, dict):
+            parts.append((message.get("role", "user"), message.get("content", "")))
+        else:
+            parts.append((getattr(message, "type", "user"), getattr(message, "content", "")))
+    return parts
+
+
+def _scope() -> Tuple[Optional[str], Optional[str]]:
+    ledger = current_ledger()
+    return (ledger.endpoint, ledger.stage) if ledger is not None else (None, None)
+
+
+class Cassette:
+    """一份 JSONL 录制文件：每行是一次成功的模型调用（响应消息、token 用量、耗时）。
+
+    两种匹配键：request_key 覆盖模型、全部消息与请求参数，完全相同的请求精确命中；
+    content_key 只含接口、阶段与非系统消息（合同正文等），系统提示词、输出格式说明或 JSON Schema
+    改动后仍能回放原来的响应，用于评估提示词/Schema 改动对 token 数与解析成功率的影响。
+    """
+
+    def __init__(self, path: str, mode: str = REPLAY, replay_latency: bool = False) -> None:
+        if mode not in MODES:
+            raise ValueError(f"未知的录制模式: {mode}（{' / '.join(MODES)}）")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._by_request: Dict[str, Dict[str, Any]] = {}
+        self._by_content: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self._index(json.loads(line))
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        # 同一请求录制多次时以最后一次为准
+        self._by_request[entry["request_key"]] = entry
+        self._by_content[entry["content_key"]] = entry
+
+    @staticmethod
+    def keys(model: str, messages: Any, request_kwargs: Dict[str, Any]) -> Tuple[str, str]:
+        parts = _message_parts(messages)
+        endpoint, stage = _scope()
+        request_key = make_cache_key("cassette", model, parts, request_kwargs)
+        content_key = make_cache_key(
+            "cassette-content",
+            endpoint,
+            stage,
+            [content for role, content in parts if role != "system"],
+        )
+        return request_key, content_key
+
+    def __len__(self) -> int:
+        return len(self._by_request)
+
+    def record(self, model: str, messages: Any, request_kwargs: Dict[str, Any], response: Any, prompt_tokens: int, latency: float) -> None:
+        request_key, content_key = self.keys(model, messages, request_kwargs)
+        endpoint, stage = _scope()
+        entry = {
+            "request_key": request_key,
+            "content_key": content_key,
+            "endpoint": endpoint,
+            "stage": stage,
+            "model": model,
+            "estimated_prompt_tokens": prompt_tokens,
+            "latency_ms": round(latency * 1000, 1),
+            "response": message_to_dict(response),
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self._index(entry)
+            self.counts["recorded"] += 1
+
+    def lookup(self, model: str, messages: Any, request_kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        request_key, content_key = self.keys(model, messages, request_kwargs)
+        entry = self._by_request.get(request_key)
+        if entry is not None:
+            self.counts["exact_hits"] += 1
+            return entry
+        entry = self._by_content.get(content_key)
+        if entry is not None:
+            self.counts["content_hits"] += 1
+            return entry
+        self.counts["misses"] += 1
+        return None
+
+    async def replay(self, model: str, messages: Any, request_kwargs: Dict[str, Any]) -> Tuple[Any, float]:
+        """返回 (录制的响应消息, 录制时的耗时秒数)，找不到时抛出 CassetteMissError"""
+        entry = self.lookup(model, messages, request_kwargs)
+        if entry is None:
+            raise CassetteMissError(model, _scope()[1])
+        latency = entry["latency_ms"] / 1000
+        if self.replay_latency:
+            await asyncio.sleep(latency)
+        return messages_from_dict([entry["response"]])[0], latency
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "entries": len(self),
+            **{name: self.counts[name] for name in ("recorded", "exact_hits", "content_hits", "misses")},
+        }
+
+
+_default_cassette = Cassette(LLM_CASSETTE_PATH, LLM_CASSETTE_MODE, LLM_CASSETTE_REPLAY_LATENCY) if LLM_CASSETTE_MODE in (RECORD, REPLAY) else None
+_cassette: contextvars.ContextVar[Optional[Cassette]] = contextvars.ContextVar("llm_cassette", default=_default_cassette)
+
+
+@contextmanager
+def cassette_scope(cassette: Optional[Cassette]) -> Iterator[Optional[Cassette]]:
+    """在当前上下文中使用指定的录制文件（None 表示真实调用），用于回归测试逐个合同录制/回放"""
+    token = _cassette.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _cassette.reset(token)
+
+
+def current_cassette() -> Optional[Cassette]:
+    return _cassette.get()
+
+
+def cassette_stats() -> Optional[Dict[str, Any]]:
+    return _default_cassette.stats() if _default_cassette is not None else None
+
+
+__all__ = [
+    "Cassette",
+    "CassetteMissError",
+    "RECORD",
+    "REPLAY",
+    "cassette_scope",
+    "cassette_stats",
+    "current_cassette",
+]
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import importlib.util
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from config import (
+    API_BASE_URL,
+    API_KEY,
+    LLM_HTTP2,
+    LLM_HTTP_CONNECT_TIMEOUT,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE,
+    LLM_HTTP_POOL_TIMEOUT,
+    LLM_HTTP_READ_TIMEOUT,
+    LLM_LONG_CONTEXT_MODEL,
+    LLM_MODEL,
+    OCR_API_KEY,
+    OCR_BASE_URL,
+    OCR_MODEL,
+)
+
+LLM = "llm"
+OCR = "ocr"
+# 输入超出 LLM_MODEL 上下文窗口时改用的长上下文模型，仅在配置了 LLM_LONG_CONTEXT_MODEL 时存在
+LLM_LONG = "llm_long"
+
+# HTTP/2 依赖 h2，未安装时退回 HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass(frozen=True)
+class RoleConfig:
+    model: str
+    base_url: Optional[str]
+    api_key: Optional[str]
+
+
+class LlmClientRegistry:
+    """模型客户端注册表：按上游（base_url）共享 httpx 连接池，按角色（llm / ocr）提供 ChatOpenAI。
+
+    所有 Agent 都从这里取客户端，同一上游只有一组长连接，连接数上限与超时只在这里配置。
+    """
+
+    def __init__(
+        self,
+        roles: Dict[str, RoleConfig],
+        limits: httpx.Limits,
+        timeout: httpx.Timeout,
+        http2: bool = True,
+    ) -> None:
+        self.roles = roles
+        self.limits = limits
+        self.timeout = timeout
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._pools: Dict[str, Tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self._chats: Dict[str, ChatOpenAI] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _upstream(base_url: Optional[str]) -> str:
+        return (base_url or "https://api.openai.com/v1").rstrip("/")
+
+    def _pool(self, base_url: Optional[str]) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        upstream = self._upstream(base_url)
+        pool = self._pools.get(upstream)
+        if pool is None:
+            pool = (
+                httpx.Client(limits=self.limits, timeout=self.timeout, http2=self.http2),
+                httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2),
+            )
+            self._pools[upstream] = pool
+        return pool
+
+    def chat(self, role: str) -> ChatOpenAI:
+        """同一角色返回同一个实例；ChatOpenAI 本身无状态，可在多个 Agent 间共享"""
+        with self._lock:
+            chat = self._chats.get(role)
+            if chat is None:
+                config = self.roles[role]
+                http_client, http_async_client = self._pool(config.base_url)
+                chat = ChatOpenAI(
+                    model=config.model,
+                    temperature=0,
+                    api_key=config.api_key,
+                    base_url=config.base_url,
+                    timeout=self.timeout,
+                    # 重试统一由 call_policy 负责，避免与 SDK 内置重试叠加
+                    max_retries=0,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                )
+                self._chats[role] = chat
+            return chat
+
+    def long_context(self) -> Optional[ChatOpenAI]:
+        return self.chat(LLM_LONG) if LLM_LONG in self.roles else None
+
+    async def aclose(self) -> None:
+        pools, self._pools = self._pools, {}
+        self._chats = {}
+        for client, async_client in pools.values():
+            client.close()
+            await async_client.aclose()
+
+    @staticmethod
+    def _connections(client: httpx.AsyncClient) -> Dict[str, int]:
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        http2 = sum(1 for connection in connections if "HTTP/2" in connection.info())
+        return {"open": len(connections), "idle": idle, "http2": http2}
+
+    def stats(self) -> dict:
+        return {
+            "http2_enabled": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "roles": {role: config.model for role, config in self.roles.items()},
+            "upstreams": {
+                upstream: self._connections(async_client)
+                for upstream, (_, async_client) in self._pools.items()
+            },
+        }
+
+
+llm_clients = LlmClientRegistry(
+    roles={
+        LLM: RoleConfig(model=LLM_MODEL, base_url=API_BASE_URL, api_key=API_KEY),
+        OCR: RoleConfig(model=OCR_MODEL, base_url=OCR_BASE_URL, api_key=OCR_API_KEY),
+        **({LLM_LONG: RoleConfig(model=LLM_LONG_CONTEXT_MODEL, base_url=API_BASE_URL, api_key=API_KEY)} if LLM_LONG_CONTEXT_MODEL else {}),
+    },
+    limits=httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    ),
+    timeout=httpx.Timeout(
+        LLM_HTTP_READ_TIMEOUT,
+        connect=LLM_HTTP_CONNECT_TIMEOUT,
+        pool=LLM_HTTP_POOL_TIMEOUT,
+    ),
+    http2=LLM_HTTP2,
+)
+
+
+__all__ = [
+    "HTTP2_AVAILABLE",
+    "LLM",
+    "OCR",
+    "LlmClientRegistry",
+    "RoleConfig",
+    "llm_clients",
+]
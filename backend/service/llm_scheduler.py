@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import AIMessageChunk
+
+from config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_QUEUE_DEPTH,
+    LLM_MODEL,
+    LLM_TOKENS_PER_MINUTE,
+    OCR_MAX_CONCURRENCY,
+    OCR_MAX_QUEUE_DEPTH,
+    OCR_MODEL,
+    OCR_TOKENS_PER_MINUTE,
+    TOKENIZER_OFFLOAD_CHARS,
+)
+from service.call_policy import call_policies, within_deadline
+from service.llm_cassette import RECORD, REPLAY, current_cassette
+from service.llm_clients import llm_clients
+from service.token_usage import PromptTooLargeError, message_chars, token_budget, token_counter, token_usage
+
+
+class Priority(IntEnum):
+    """数值越小优先级越高"""
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class LlmOverloadedError(RuntimeError):
+    """准入检查时排队深度超过阈值抛出，由接口层转换为 503 + Retry-After"""
+
+    def __init__(self, model: str, retry_after: int) -> None:
+        super().__init__(f"模型 {model} 当前排队请求过多，请 {retry_after} 秒后重试")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def estimate_tokens(messages: Any, model: str = "", request_kwargs: Optional[Dict[str, Any]] = None) -> int:
+    """调用前计算输入 token 数，用于上下文窗口预检与限流记账"""
+    return token_counter.count_messages(messages, model, request_kwargs)
+
+
+async def estimate_tokens_async(messages: Any, model: str = "", request_kwargs: Optional[Dict[str, Any]] = None) -> int:
+    """同 estimate_tokens；长输入（如整份合同正文）在线程池中编码，避免阻塞事件循环"""
+    if message_chars(messages) < TOKENIZER_OFFLOAD_CHARS:
+        return estimate_tokens(messages, model, request_kwargs)
+    return await asyncio.to_thread(estimate_tokens, messages, model, request_kwargs)
+
+
+def response_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    return None
+
+
+def _as_chunk(message: Any) -> AIMessageChunk:
+    """把完整响应转换为单个流式块（回放录制时使用），工具调用参数还原为 JSON 文本"""
+    return AIMessageChunk(
+        content=message.content,
+        tool_call_chunks=[
+            {"name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False), "id": call.get("id"), "index": index}
+            for index, call in enumerate(getattr(message, "tool_calls", None) or [])
+        ],
+        usage_metadata=getattr(message, "usage_metadata", None),
+    )
+
+
+class ModelLimiter:
+    """单个模型的并发 + 每分钟 token 额度，按优先级排队"""
+
+    def __init__(self, model: str, max_concurrency: int, tokens_per_minute: int, max_queue_depth: int) -> None:
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue_depth = max_queue_depth
+        self.active = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._avg_latency = 5.0
+        self.admitted = 0
+        self.shed = 0
+
+    def _refill(self) -> None:
+        if self.tokens_per_minute <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60,
+        )
+        self._refilled_at = now
+
+    def queued(self, priority: Optional[Priority] = None) -> int:
+        """排在 priority 之前（含同级）的等待数量，priority 为空时返回全部"""
+        return sum(
+            1
+            for entry in self._waiters
+            if not entry[3].done() and (priority is None or entry[0] <= priority)
+        )
+
+    def retry_after(self, priority: Priority) -> int:
+        waves = self.queued(priority) / self.max_concurrency + 1
+        return max(1, math.ceil(waves * self._avg_latency))
+
+    def check_admission(self, priority: Priority) -> None:
+        if self.max_queue_depth > 0 and self.queued(priority) >= self.max_queue_depth:
+            self.shed += 1
+            raise LlmOverloadedError(self.model, self.retry_after(priority))
+
+    async def acquire(self, tokens: int, priority: Priority) -> int:
+        if self.tokens_per_minute > 0:
+            tokens = min(tokens, self.tokens_per_minute)
+        else:
+            tokens = 0
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已被分配但调用方取消，归还并发额度
+                self.release(tokens, None, 0.0)
+            raise
+        self.admitted += 1
+        return tokens
+
+    def release(self, reserved_tokens: int, used_tokens: Optional[int], latency: float) -> None:
+        self.active -= 1
+        if latency > 0:
+            self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+        if self.tokens_per_minute > 0 and used_tokens is not None:
+            # 用实际消耗修正预估值
+            self._tokens -= used_tokens - reserved_tokens
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        self._refill()
+        while self._waiters and self.active < self.max_concurrency:
+            priority, seq, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if tokens > self._tokens:
+                self._schedule_refill(tokens - self._tokens)
+                return
+            heapq.heappop(self._waiters)
+            self._tokens -= tokens
+            self.active += 1
+            future.set_result(None)
+
+    def _schedule_refill(self, deficit: float) -> None:
+        if self._timer is not None and not self._timer.cancelled():
+            return
+        delay = deficit * 60 / self.tokens_per_minute
+
+        def wake() -> None:
+            self._timer = None
+            self._dispatch()
+
+        self._timer = asyncio.get_running_loop().call_later(delay, wake)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued_interactive": self.queued(Priority.INTERACTIVE),
+            "queued_total": self.queued(),
+            "max_concurrency": self.max_concurrency,
+            "tokens_per_minute": self.tokens_per_minute,
+            "available_tokens": round(self._tokens) if self.tokens_per_minute > 0 else None,
+            "avg_latency_s": round(self._avg_latency, 2),
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+class LlmScheduler:
+    """进程级 LLM 调用准入控制，backend/service 中所有模型调用都经过这里"""
+
+    def __init__(self) -> None:
+        self._limiters: Dict[str, ModelLimiter] = {}
+
+    def configure(self, model: str, max_concurrency: int, tokens_per_minute: int, max_queue_depth: int) -> None:
+        # 同一个模型名只配置一次，LLM_MODEL 与 OCR_MODEL 相同时共享额度
+        if model not in self._limiters:
+            self._limiters[model] = ModelLimiter(model, max_concurrency, tokens_per_minute, max_queue_depth)
+
+    def limiter(self, model: str) -> ModelLimiter:
+        if model not in self._limiters:
+            self.configure(model, LLM_MAX_CONCURRENCY, LLM_TOKENS_PER_MINUTE, LLM_MAX_QUEUE_DEPTH)
+        return self._limiters[model]
+
+    def admit(self, model: str, priority: Priority) -> None:
+        """接口入口处调用：排队过深时直接拒绝新请求，已接收的请求不会中途被丢弃"""
+        self.limiter(model).check_admission(priority)
+
+    def fit(self, llm, prompt_tokens: int):
+        """输入放不下时改用长上下文模型（LLM_LONG_CONTEXT_MODEL），仍放不下则在排队前直接拒绝"""
+        if token_budget.fits(llm.model_name, prompt_tokens):
+            return llm, False
+        fallback = llm_clients.long_context()
+        if fallback is not None and fallback.model_name != llm.model_name and token_budget.fits(fallback.model_name, prompt_tokens):
+            print(f"Prompt of {prompt_tokens} tokens exceeds {llm.model_name}, rerouting to {fallback.model_name}")
+            return fallback, True
+        token_usage.reject()
+        raise PromptTooLargeError(llm.model_name, prompt_tokens, token_budget.limit(llm.model_name))
+
+    async def ainvoke(self, llm, messages, priority: Priority = Priority.INTERACTIVE, hedge: bool = False, **kwargs):
+        """kwargs 原样传给模型调用（如 response_format、tools 等请求参数）。
+
+        调用前计算输入 token 并检查上下文窗口；每次尝试重新排队，失败后按 call_policy 退避重试，
+        hedge 为 True 时允许对冲（仅 OCR 模型开启）。成功调用的用量记入当前请求的账本。
+        当前上下文处于录制回放模式时不排队、不访问模型，直接返回录制的响应。
+        """
+        tokens = await estimate_tokens_async(messages, llm.model_name, kwargs)
+        llm, rerouted = self.fit(llm, tokens)
+        cassette = current_cassette()
+        if cassette is not None and cassette.mode == REPLAY:
+            response, latency = await cassette.replay(llm.model_name, messages, kwargs)
+            token_usage.record(llm.model_name, tokens, response, latency, rerouted)
+            return response
+        limiter = self.limiter(llm.model_name)
+        policy = call_policies.policy(llm.model_name)
+
+        async def once():
+            reserved = await within_deadline(limiter.acquire(tokens, priority))
+            started = time.monotonic()
+            response = None
+            try:
+                # 单次超时只计模型调用本身，不含排队时间
+                response = await policy.timed(llm.ainvoke(messages, **kwargs))
+                latency = time.monotonic() - started
+                token_usage.record(llm.model_name, tokens, response, latency, rerouted)
+                if cassette is not None and cassette.mode == RECORD:
+                    cassette.record(llm.model_name, messages, kwargs, response, tokens, latency)
+                return response
+            finally:
+                limiter.release(reserved, response_tokens(response), time.monotonic() - started)
+
+        def can_hedge() -> bool:
+            # 只在有空闲并发且无人排队时对冲，不与其它请求争抢额度
+            return limiter.active < limiter.max_concurrency and limiter.queued() == 0
+
+        return await policy.run(once, hedge=hedge, can_hedge=can_hedge)
+
+    async def astream(self, llm, messages, priority: Priority = Priority.INTERACTIVE, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        """流式调用：与 ainvoke 相同的 token 预检、排队与用量记账，逐块返回模型输出。
+
+        已经返回过数据的流无法透明重试，因此这里不重试，由调用方决定是否退回 ainvoke；
+        每块之间的等待不超过单次调用超时与请求截止时间，结束（含中途放弃）时归还并发额度。
+        """
+        tokens = await estimate_tokens_async(messages, llm.model_name, kwargs)
+        llm, rerouted = self.fit(llm, tokens)
+        cassette = current_cassette()
+        if cassette is not None and cassette.mode == REPLAY:
+            response, latency = await cassette.replay(llm.model_name, messages, kwargs)
+            token_usage.record(llm.model_name, tokens, response, latency, rerouted)
+            yield _as_chunk(response)
+            return
+
+        limiter = self.limiter(llm.model_name)
+        policy = call_policies.policy(llm.model_name)
+        policy.calls += 1
+        reserved = await within_deadline(limiter.acquire(tokens, priority))
+        started = time.monotonic()
+        response = None
+        stream = llm.astream(messages, stream_usage=True, **kwargs)
+        try:
+            while True:
+                try:
+                    chunk = await policy.bounded(stream.__anext__())
+                except StopAsyncIteration:
+                    break
+                response = chunk if response is None else response + chunk
+                yield chunk
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            policy.observe(exc)
+            raise
+        else:
+            latency = time.monotonic() - started
+            policy.observe(None, latency)
+            token_usage.record(llm.model_name, tokens, response, latency, rerouted)
+            if cassette is not None and cassette.mode == RECORD and response is not None:
+                cassette.record(llm.model_name, messages, kwargs, response, tokens, latency)
+        finally:
+            await stream.aclose()
+            limiter.release(reserved, response_tokens(response), time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {model: limiter.stats() for model, limiter in self._limiters.items()}
+
+
+llm_scheduler = LlmScheduler()
+llm_scheduler.configure(LLM_MODEL, LLM_MAX_CONCURRENCY, LLM_TOKENS_PER_MINUTE, LLM_MAX_QUEUE_DEPTH)
+llm_scheduler.configure(OCR_MODEL, OCR_MAX_CONCURRENCY, OCR_TOKENS_PER_MINUTE, OCR_MAX_QUEUE_DEPTH)
+
+
+__all__ = [
+    "LlmOverloadedError",
+    "LlmScheduler",
+    "ModelLimiter",
+    "Priority",
+    "estimate_tokens",
+    "estimate_tokens_async",
+    "llm_scheduler",
+]
@@ -1,22 +1,45 @@
-from typing import List
-from langchain_openai import ChatOpenAI
+import asyncio
+import time
+from collections import OrderedDict
+from typing import List, Optional, Union
 from langchain_core.output_parsers import PydanticOutputParser
-from models.compliance import LlmAnalysisResult, StandardClauses
-from prompts import NON_STANDARD_ANALYSIS_DEVELOPER_PROMPT, NON_STANDARD_ANALYSIS_SYSTEM_PROMPT
-from config import LLM_MODEL, API_KEY, API_BASE_URL
+from models.compliance import (
+    CategoryTiming,
+    ExtractedClause,
+    LlmAnalysisResult,
+    NonStandardDetectionReport,
+    StandardClauses,
+)
+from config import (
+    NON_STANDARD_DETECTION_MODE,
+    NON_STANDARD_PER_CATEGORY_MIN_CLAUSES,
+    NON_STANDARD_CATEGORY_MAX_PARALLEL,
+)
+from service.clause_sets import CompiledClauseSet, clause_sets
+from service.llm_clients import LLM, llm_clients
+from service.llm_scheduler import llm_scheduler
+from service.snippet_locator import locate_snippets
+from service.structured_output import invoke_structured
+
+SINGLE = "single"
+PER_CATEGORY = "per_category"
+
+
+def merge_extracted_clauses(results: List[LlmAnalysisResult]) -> LlmAnalysisResult:
+    """合并各类别的结果：同一类别、条款项、原文摘录的条款只保留第一次出现的一条"""
+    merged: "OrderedDict[tuple, ExtractedClause]" = OrderedDict()
+    for result in results:
+        for clause in result.extracted_clauses:
+            key = (clause.clause_category.strip(), clause.clause_item.strip(), clause.contract_snippet.strip())
+            merged.setdefault(key, clause)
+    return LlmAnalysisResult(extracted_clauses=list(merged.values()))
+
 
 class NonStandardDetectionAgent:
     def __init__(self):
         self.result_parser = PydanticOutputParser(pydantic_object=LlmAnalysisResult)
 
-        self.llm = ChatOpenAI(
-            model=LLM_MODEL, 
-            temperature=0,
-            api_key=API_KEY,
-            base_url=API_BASE_URL
-        )
-        self.system_prompt = NON_STANDARD_ANALYSIS_SYSTEM_PROMPT
-        self.developer_prompt = NON_STANDARD_ANALYSIS_DEVELOPER_PROMPT
+        self.llm = llm_clients.chat(LLM)
 
     async def output_format_refine(self, text: str):
         prompt = f"""
@@ -30,31 +53,93 @@ class NonStandardDetectionAgent:
         请特别注意反斜杠(\)转译的处理，遇到反斜杠(\)时，需要将反斜杠转译为普通字符。
         请完整输出修复后的Json数据，不要添加任何其他内容和解释。
         """
-        response = await self.llm.ainvoke(prompt)
+        response = await llm_scheduler.ainvoke(self.llm, prompt)
         return response.content.strip().replace("```json", "").replace("```", "")
 
-    async def process(self, contract_content: str, standard_clauses: List[StandardClauses]):
-        standard_clauses = [{
-                "条款所属类别": clause.category,
-                "具体条款项": clause.item,
-                "标准约定原文": clause.standard_text,
-                "风险等级标准": clause.risk_level,
-            } for clause in standard_clauses]
-
-        allowed_categories = list(set([x["条款所属类别"] for x in standard_clauses]))
-        
-        response = await self.llm.ainvoke([
-            ("system", self.system_prompt.format(allowed_categories=allowed_categories)), 
-            ("system", self.developer_prompt),
-            ("system", f"输出格式: {self.result_parser.get_format_instructions()}"),
-            ("user", f"标准条款：\n{standard_clauses}\n\n合同文本：\n{contract_content}"),
-        ])
-        text = response.content.strip().replace("```json", "").replace("```", "")
-        try:
-            parsed_result = self.result_parser.parse(text)
-        except Exception as e:
-            print(f"Error parsing result: {e}")
-            print(f"Raw text: {text}")
-            text = await self.output_format_refine(text)
-            parsed_result = self.result_parser.parse(text)
-        return parsed_result
+    async def _detect(self, contract_content: str, clause_set: CompiledClauseSet, category: Optional[str] = None) -> LlmAnalysisResult:
+        # 条款集的提示词前缀已预编译，这里只追加合同正文
+        messages = clause_set.messages(contract_content, category)
+        return await invoke_structured(self.llm, messages, self.result_parser, self.output_format_refine)
+
+    def resolve_mode(self, clause_set: CompiledClauseSet, mode: Optional[str] = None) -> str:
+        mode = mode or NON_STANDARD_DETECTION_MODE
+        if mode in (SINGLE, PER_CATEGORY):
+            return mode
+        # auto：条款库较大且不止一个类别时才拆分
+        many = len(clause_set.clauses) >= NON_STANDARD_PER_CATEGORY_MIN_CLAUSES
+        return PER_CATEGORY if many and len(clause_set.categories) > 1 else SINGLE
+
+    async def _detect_by_category(self, contract_content: str, clause_set: CompiledClauseSet) -> NonStandardDetectionReport:
+        """每个类别单独调用一次（只携带该类别的标准条款与允许类别），并发数受 NON_STANDARD_CATEGORY_MAX_PARALLEL 限制。
+
+        各类别并发执行到结束，任一类别失败时抛出第一个异常：缺少某个类别的结果看起来与“该类别合规”无法区分，
+        不能作为完整报告返回或写入检查点。成功类别的结果已写入结果缓存，重试时不会重复调用模型。
+        """
+        groups = clause_set.by_category()
+        semaphore = asyncio.Semaphore(max(1, NON_STANDARD_CATEGORY_MAX_PARALLEL))
+        detection_start = time.perf_counter()
+
+        async def run(category: str, clauses: List[StandardClauses]):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    result, error = await self._detect(contract_content, clause_set, category), None
+                except Exception as exc:
+                    print(f"Non-standard detection for category {category} failed: {exc}")
+                    result, error = None, exc
+                finished = time.perf_counter()
+            timing = CategoryTiming(
+                category=category,
+                clause_count=len(clauses),
+                extracted_count=len(result.extracted_clauses) if result else 0,
+                status="success" if error is None else "failed",
+                error=str(error) if error is not None else None,
+                started_ms=round((started - detection_start) * 1000, 1),
+                duration_ms=round((finished - started) * 1000, 1),
+            )
+            return result, error, timing
+
+        outcomes = await asyncio.gather(*(run(category, clauses) for category, clauses in groups.items()))
+        results = [result for result, _, _ in outcomes if result is not None]
+        errors = [error for _, error, _ in outcomes if error is not None]
+
+        timings = [timing for _, _, timing in outcomes]
+        slowest = max(timings, key=lambda timing: timing.duration_ms)
+        print(
+            f"Non-standard detection by category: {len(groups)} categories, "
+            f"{(time.perf_counter() - detection_start) * 1000:.0f}ms total, "
+            f"slowest {slowest.category} {slowest.duration_ms:.0f}ms"
+        )
+        if errors:
+            failed = [timing.category for timing in timings if timing.status == "failed"]
+            print(f"Non-standard detection failed for {len(failed)}/{len(groups)} categories: {', '.join(failed)}")
+            raise errors[0]
+        return NonStandardDetectionReport(
+            mode=PER_CATEGORY,
+            result=merge_extracted_clauses(results),
+            category_timings=timings,
+        )
+
+    async def process_with_timings(
+        self,
+        contract_content: str,
+        standard_clauses: Union[List[StandardClauses], CompiledClauseSet],
+        mode: Optional[str] = None,
+    ) -> NonStandardDetectionReport:
+        """standard_clauses 可以是条款列表，也可以是已注册条款集的预编译结果"""
+        clause_set = standard_clauses if isinstance(standard_clauses, CompiledClauseSet) else clause_sets.compile(standard_clauses)
+        if self.resolve_mode(clause_set, mode) == PER_CATEGORY:
+            report = await self._detect_by_category(contract_content, clause_set)
+        else:
+            report = NonStandardDetectionReport(mode=SINGLE, result=await self._detect(contract_content, clause_set))
+        locate_snippets(report.result, contract_content)
+        return report
+
+    async def process(
+        self,
+        contract_content: str,
+        standard_clauses: Union[List[StandardClauses], CompiledClauseSet],
+        mode: Optional[str] = None,
+    ):
+        report = await self.process_with_timings(contract_content, standard_clauses, mode)
+        return report.result
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from io import BytesIO
+
+# 低分辨率探测图的 DPI，用于计算留白裁剪、彩色判断与墨迹密度
+_PROBE_DPI = 36
+_INK_THRESHOLD = 235
+_CROP_PADDING_PT = 12
+# 低分辨率下墨迹占比超过该值视为小字号密排页面，提高 DPI
+_DENSE_INK_RATIO = 0.45
+# 彩色像素占比超过该值时保留彩色（印章、批注通常只占很小面积）
+_COLOR_PIXEL_RATIO = 0.002
+
+
+@dataclass(frozen=True)
+class EncodingOptions:
+    """页面图片编码策略。
+
+    strategy:
+      - png_2x：固定 2 倍缩放的彩色 PNG（历史行为）
+      - adaptive：裁剪留白，按页面尺寸与墨迹密度选择 DPI，无彩色内容时转为灰度
+    image_format（仅 adaptive 生效）：auto / png / jpeg / webp；
+      auto 在 PNG 体积过大（扫描噪点）时改用 JPEG
+    """
+    strategy: str = "png_2x"
+    image_format: str = "auto"
+    base_dpi: int = 150
+    dense_dpi: int = 200
+    min_dpi: int = 96
+    max_side: int = 2000
+    jpeg_quality: int = 85
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    mime_type: str
+    dpi: float
+    width: int
+    height: int
+    grayscale: bool
+    cropped: bool
+
+
+def _encode(pix, image_format: str, quality: int) -> tuple:
+    if image_format == "jpeg":
+        return pix.tobytes("jpg", jpg_quality=quality), "image/jpeg"
+    if image_format == "webp":
+        from PIL import Image
+
+        mode = "L" if pix.n == 1 else "RGB"
+        image = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+        buffer = BytesIO()
+        image.save(buffer, format="WEBP", quality=quality)
+        return buffer.getvalue(), "image/webp"
+    return pix.tobytes("png"), "image/png"
+
+
+def _probe(page):
+    """返回 (内容区域, 是否包含彩色, 墨迹占比)"""
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    probe = page.get_pixmap(dpi=_PROBE_DPI, colorspace=fitz.csRGB, alpha=False)
+    pixels = np.frombuffer(probe.samples, dtype=np.uint8).reshape(probe.height, probe.width, probe.n)[..., :3]
+    gray = pixels.mean(axis=2)
+    # 扫描件底色偏灰且带噪点，墨迹阈值相对背景亮度计算；单个噪点不计为内容
+    background = float(np.percentile(gray, 75))
+    ink = gray < min(_INK_THRESHOLD, background - 30)
+    rows = np.flatnonzero(ink.sum(axis=1) >= max(2, probe.width * 0.005))
+    cols = np.flatnonzero(ink.sum(axis=0) >= max(2, probe.height * 0.005))
+    if not len(rows) or not len(cols):
+        return page.rect, False, 0.0
+
+    scale = 72 / _PROBE_DPI
+    content = fitz.Rect(
+        page.rect.x0 + cols[0] * scale - _CROP_PADDING_PT,
+        page.rect.y0 + rows[0] * scale - _CROP_PADDING_PT,
+        page.rect.x0 + (cols[-1] + 1) * scale + _CROP_PADDING_PT,
+        page.rect.y0 + (rows[-1] + 1) * scale + _CROP_PADDING_PT,
+    ) & page.rect
+
+    spread = pixels.max(axis=2).astype(np.int16) - pixels.min(axis=2)
+    colorful = float((spread > 40).mean()) > _COLOR_PIXEL_RATIO
+    ink_ratio = float(ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1].mean())
+    return content, colorful, ink_ratio
+
+
+def encode_page(page, options: EncodingOptions) -> EncodedImage:
+    import fitz  # PyMuPDF
+
+    if options.strategy != "adaptive":
+        pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
+        return EncodedImage(pix.tobytes("png"), "image/png", 144, pix.width, pix.height, False, False)
+
+    clip, colorful, ink_ratio = _probe(page)
+    # 文字密集的页面提高分辨率，同时限制最长边像素，避免大幅面图纸产生超大图片
+    dpi = options.dense_dpi if ink_ratio > _DENSE_INK_RATIO else options.base_dpi
+    dpi = min(dpi, options.max_side * 72 / max(clip.width, clip.height, 1))
+    dpi = max(dpi, options.min_dpi)
+
+    colorspace = fitz.csRGB if colorful else fitz.csGRAY
+    pix = page.get_pixmap(dpi=int(dpi), clip=clip, colorspace=colorspace, alpha=False)
+
+    image_format = options.image_format
+    if image_format == "auto":
+        data, mime_type = _encode(pix, "png", options.jpeg_quality)
+        # 扫描件噪点多，PNG 压缩率很差，此时 JPEG 体积更小且对 OCR 影响可忽略
+        if len(data) > pix.width * pix.height * 0.25:
+            jpeg, jpeg_mime = _encode(pix, "jpeg", options.jpeg_quality)
+            if len(jpeg) < len(data):
+                data, mime_type = jpeg, jpeg_mime
+    else:
+        data, mime_type = _encode(pix, image_format, options.jpeg_quality)
+
+    return EncodedImage(
+        data=data,
+        mime_type=mime_type,
+        dpi=round(dpi, 1),
+        width=pix.width,
+        height=pix.height,
+        grayscale=not colorful,
+        cropped=clip != page.rect,
+    )
+
+
+__all__ = [
+    "EncodedImage",
+    "EncodingOptions",
+    "encode_page",
+]
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from config import PDF_RENDER_WORKERS
+from service.page_encoding import EncodingOptions, encode_page
+from service.text_layer import classify_page, page_to_markdown
+
+
+@dataclass(frozen=True)
+class TextLayerOptions:
+    min_chars: int
+    max_image_ratio: float
+
+
+@dataclass
+class RenderedPage:
+    page_num: int
+    # "ocr"：已渲染为图片，需要调用OCR模型；"text_layer"：已从文本层直接转换为 markdown
+    source: str = "ocr"
+    digest: Optional[str] = None
+    image_base64: Optional[str] = None
+    mime_type: str = "image/png"
+    # 实际发送给OCR模型的 base64 负载字节数
+    payload_bytes: int = 0
+    dpi: Optional[float] = None
+    markdown: Optional[str] = None
+    classification: Optional[str] = None
+
+
+# 每个工作进程内缓存最近打开的文档，避免逐页重复解析 PDF 结构。
+# 上传文件以 /proc/<pid>/fd/<fd> 形式传入，描述符编号会被复用，因此以 (路径, inode) 为键；
+# 缓存中的文档保持文件打开，其 inode 不会被新文件复用
+_open_documents: "OrderedDict[tuple, object]" = OrderedDict()
+_MAX_OPEN_DOCUMENTS = 2
+
+
+def _document(pdf_path: str):
+    import fitz  # PyMuPDF
+
+    stat = os.stat(pdf_path)
+    key = (pdf_path, stat.st_dev, stat.st_ino)
+    document = _open_documents.get(key)
+    if document is None:
+        document = fitz.open(pdf_path, filetype="pdf")
+        _open_documents[key] = document
+        while len(_open_documents) > _MAX_OPEN_DOCUMENTS:
+            _, stale = _open_documents.popitem(last=False)
+            stale.close()
+    else:
+        _open_documents.move_to_end(key)
+    return document
+
+
+def render_page(
+    pdf_path: str,
+    page_num: int,
+    encoding: Optional[EncodingOptions] = None,
+    text_layer: Optional[TextLayerOptions] = None,
+) -> RenderedPage:
+    """按编码策略渲染单页图片并完成 base64 编码，可在工作进程中执行。
+
+    传入 text_layer 时先判断页面是否为原生文本页面，是则直接从文本层生成 markdown，跳过渲染。
+    """
+    page = _document(pdf_path).load_page(page_num)
+    classification = None
+    if text_layer is not None:
+        result = classify_page(page, text_layer.min_chars, text_layer.max_image_ratio)
+        classification = result.reason
+        if result.native:
+            return RenderedPage(
+                page_num=page_num,
+                source="text_layer",
+                markdown=page_to_markdown(page),
+                classification=classification,
+            )
+
+    image = encode_page(page, encoding or EncodingOptions())
+    image_base64 = base64.b64encode(image.data).decode("utf-8")
+    return RenderedPage(
+        page_num=page_num,
+        digest=hashlib.sha256(image.data).hexdigest(),
+        image_base64=image_base64,
+        mime_type=image.mime_type,
+        payload_bytes=len(image_base64),
+        dpi=image.dpi,
+        classification=classification,
+    )
+
+
+class PageRenderer:
+    """在有界进程池中渲染 PDF 页面，避免 PyMuPDF 渲染阻塞事件循环。
+
+    workers 为 0 时退回到在事件循环中同步渲染（仅用于调试与基准对比）。
+    """
+
+    def __init__(self, workers: int = PDF_RENDER_WORKERS) -> None:
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # 使用 spawn，避免在已有线程（sqlite/to_thread）的进程中 fork
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def render(
+        self,
+        pdf_path: str,
+        page_num: int,
+        encoding: Optional[EncodingOptions] = None,
+        text_layer: Optional[TextLayerOptions] = None,
+    ) -> RenderedPage:
+        if self.workers <= 0:
+            return render_page(pdf_path, page_num, encoding, text_layer)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), render_page, pdf_path, page_num, encoding, text_layer)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+__all__ = [
+    "PageRenderer",
+    "RenderedPage",
+    "TextLayerOptions",
+    "render_page",
+]
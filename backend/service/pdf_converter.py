@@ -1,76 +1,170 @@
-from langchain_openai import ChatOpenAI
 import asyncio
+import os
+import time
+from typing import AsyncIterator, Collection
 
-from config import OCR_MODEL, API_KEY, API_BASE_URL
+from config import (
+    OCR_MODEL,
+    LLM_CACHE_DIR,
+    OCR_CACHE_ENABLED,
+    OCR_CACHE_MAX_BYTES,
+    PDF_RENDER_PREFETCH_PAGES,
+    OCR_TEXT_LAYER_ENABLED,
+    OCR_TEXT_LAYER_MIN_CHARS,
+    OCR_TEXT_LAYER_MAX_IMAGE_RATIO,
+    OCR_IMAGE_STRATEGY,
+    OCR_IMAGE_FORMAT,
+    OCR_IMAGE_MAX_SIDE,
+    OCR_IMAGE_JPEG_QUALITY,
+)
+from models.ocr import OcrDocumentResult, OcrPageResult
+from service.llm_cache import TieredCache, make_cache_key
+from service.llm_clients import OCR, llm_clients
+from service.llm_scheduler import Priority, llm_scheduler
+from service.page_encoding import EncodingOptions
+from service.page_renderer import PageRenderer, RenderedPage, TextLayerOptions
 
 class OcrPdfParser:
     def __init__(self):
 
-        self.llm = ChatOpenAI(
-            model=OCR_MODEL, 
-            temperature=0,
-            api_key=API_KEY,
-            base_url=API_BASE_URL
-        )
+        # OCR 角色的客户端，与其他 Agent 共用同一上游的连接池
+        self.llm = llm_clients.chat(OCR)
 
         self.prompt = f"请将图片中的内容提取出来，使用markdown格式输出，不要添加任何其他内容和解释。"
 
+        # 页面OCR结果缓存：键为渲染后页面图片摘要 + OCR模型 + 提示词
+        self.page_cache = TieredCache(
+            os.path.join(LLM_CACHE_DIR, "ocr_pages.sqlite3"),
+            memory_items=512,
+            max_bytes=OCR_CACHE_MAX_BYTES,
+            enabled=OCR_CACHE_ENABLED,
+        )
+        # 页面渲染与 base64 编码在进程池中完成，不占用事件循环
+        self.renderer = PageRenderer()
+        self.prefetch_pages = max(1, PDF_RENDER_PREFETCH_PAGES)
+        # 原生文本页面（如由Word导出的合同）直接读取文本层，只有扫描/图片页才调用OCR模型
+        self.text_layer = (
+            TextLayerOptions(OCR_TEXT_LAYER_MIN_CHARS, OCR_TEXT_LAYER_MAX_IMAGE_RATIO)
+            if OCR_TEXT_LAYER_ENABLED
+            else None
+        )
+        # 页面图片编码策略；不同策略产生的图片摘要不同，页面缓存条目自然隔离
+        self.encoding = EncodingOptions(
+            strategy=OCR_IMAGE_STRATEGY,
+            image_format=OCR_IMAGE_FORMAT,
+            max_side=OCR_IMAGE_MAX_SIDE,
+            jpeg_quality=OCR_IMAGE_JPEG_QUALITY,
+        )
+
 
     async def _call_llm(self, order, messages):
-        response = await self.llm.ainvoke(messages)
+        # 逐页OCR属于批量任务，优先级低于交互式抽取；单页长尾时允许对冲（OCR_HEDGE_ENABLED）
+        response = await llm_scheduler.ainvoke(self.llm, messages, priority=Priority.BULK, hedge=True)
         return order, response.content.strip()
-        
 
-    async def parse(self, pdf_path: str):
-        import fitz  # PyMuPDF
-        import base64
-        from io import BytesIO
-        from PIL import Image
-        
-        # 打开PDF文件
-        pdf_document = fitz.open(pdf_path)
-        
-        tasks = []
-        for page_num in range(len(pdf_document)):
-            # 获取页面
-            page = pdf_document.load_page(page_num)
-            
-            # 将页面转换为图片
-            mat = fitz.Matrix(2.0, 2.0)  # 提高分辨率
-            pix = page.get_pixmap(matrix=mat)
-            img_data = pix.tobytes("png")
-            
-            # 将图片转换为base64编码
-            img_base64 = base64.b64encode(img_data).decode('utf-8')
-            
-            # 构建消息内容
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": self.prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{img_base64}"
-                            }
+    def _page_cache_key(self, image_digest: str) -> str:
+        return make_cache_key(OCR_MODEL, self.prompt, image_digest)
+
+    async def _ocr_page(self, pdf_path: str, page_num: int, prefetch: asyncio.Semaphore, inflight: dict) -> OcrPageResult:
+        # 限制“已渲染、未完成OCR”的页数，避免大文件一次性把所有页面图片驻留在内存
+        async with prefetch:
+            started = time.perf_counter()
+            rendered = await self.renderer.render(pdf_path, page_num, self.encoding, self.text_layer)
+            if rendered.source == "text_layer":
+                return OcrPageResult(
+                    page_number=page_num + 1,
+                    markdown=rendered.markdown,
+                    source="text_layer",
+                    latency_ms=(time.perf_counter() - started) * 1000,
+                )
+
+            cache_key = self._page_cache_key(rendered.digest)
+            cached = await self.page_cache.get(cache_key)
+            if cached is not None:
+                return OcrPageResult(
+                    page_number=page_num + 1,
+                    markdown=cached.decode("utf-8"),
+                    cache_hit=True,
+                    latency_ms=(time.perf_counter() - started) * 1000,
+                )
+
+            # 同一文档内完全相同的页面（如通用条款、签字页）只调用一次模型
+            if cache_key not in inflight:
+                inflight[cache_key] = asyncio.ensure_future(self._recognize(rendered, cache_key))
+            markdown = await inflight[cache_key]
+            return OcrPageResult(
+                page_number=page_num + 1,
+                markdown=markdown,
+                cache_hit=False,
+                payload_bytes=rendered.payload_bytes,
+                latency_ms=(time.perf_counter() - started) * 1000,
+            )
+
+    async def _recognize(self, rendered: RenderedPage, cache_key: str) -> str:
+        # 构建消息内容
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": self.prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{rendered.mime_type};base64,{rendered.image_base64}"
                         }
-                    ]
-                }
-            ]
-            
-            # 调用模型
-            tasks.append(self._call_llm(page_num, messages))
-
-        results = await asyncio.gather(*tasks)
-        results.sort(key=lambda x: x[0])
-        markdown_content = "\n".join([result[1].replace("```markdown", "").replace("```", "") for result in results])
-        pdf_document.close()
-        return markdown_content
+                    }
+                ]
+            }
+        ]
+
+        # 调用模型
+        _, content = await self._call_llm(None, messages)
+        markdown = content.replace("```markdown", "").replace("```", "")
+        await self.page_cache.set(cache_key, markdown.encode("utf-8"))
+        return markdown
+
+    def page_count(self, pdf_path: str) -> int:
+        import fitz  # PyMuPDF
+
+        with fitz.open(pdf_path, filetype="pdf") as pdf_document:
+            return len(pdf_document)
+
+    async def stream_pages(self, pdf_path: str, skip_pages: Collection[int] = ()) -> AsyncIterator[OcrPageResult]:
+        """按完成先后逐页产出OCR结果；调用方提前退出时取消剩余页面。skip_pages 为不需要处理的页码（从1开始）"""
+        prefetch = asyncio.Semaphore(self.prefetch_pages)
+        inflight: dict = {}
+        # 按页码顺序提交，进程池按提交顺序渲染，渲染完成的页面立即进入OCR
+        tasks = [
+            asyncio.ensure_future(self._ocr_page(pdf_path, page_num, prefetch, inflight))
+            for page_num in range(self.page_count(pdf_path))
+            if page_num + 1 not in skip_pages
+        ]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                yield await next_page
+        finally:
+            for task in [*tasks, *inflight.values()]:
+                task.cancel()
+
+    async def parse_document(self, pdf_path: str, checkpoint=None) -> OcrDocumentResult:
+        """checkpoint（可选）提供 pages() 与 save_page(page)：已保存的页面直接复用，新完成的页面逐页保存"""
+        pages = list(checkpoint.pages()) if checkpoint is not None else []
+        async for page in self.stream_pages(pdf_path, skip_pages={page.page_number for page in pages}):
+            if checkpoint is not None:
+                await checkpoint.save_page(page)
+            pages.append(page)
+        pages.sort(key=lambda page: page.page_number)
+        return OcrDocumentResult(pages=pages)
+
+    async def parse(self, pdf_path: str):
+        result = await self.parse_document(pdf_path)
+        return result.markdown
 
+    def close(self) -> None:
+        self.renderer.shutdown()
 
 if __name__ == "__main__":
     analyzer = OcrPdfParser()
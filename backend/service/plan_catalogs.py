@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from config import PLAN_CATALOG_DB_PATH, PLAN_CATALOG_MEMORY_ITEMS
+from models.service_plan import PlanCatalogInfo, ServicePlanCandidate
+from service.llm_cache import make_cache_key
+from service.plan_scoring import Value, parse_plan_requirements
+
+
+class PlanCatalogNotFoundError(KeyError):
+    """catalog_id 未注册"""
+
+
+def catalog_id_for(candidates: List[ServicePlanCandidate]) -> str:
+    # 候选计划的顺序影响同分排序与提示词编号，按原顺序计算哈希
+    return make_cache_key([plan.model_dump() for plan in candidates])[:32]
+
+
+def render_plan(plan: ServicePlanCandidate) -> str:
+    """单个候选计划在提示词中的文本（不含编号）"""
+    lines = [f"{plan.plan_name} (ID: {plan.plan_id})"]
+    if plan.description:
+        lines.append(f"   描述: {plan.description}")
+    lines.append("   关键条款：")
+    for clause in plan.clauses:
+        category_label = clause.category or "未分类"
+        lines.append(f"   - [{category_label}] {clause.clause_item}: {clause.requirement}")
+        if clause.notes:
+            lines.append(f"     备注: {clause.notes}")
+    return "\n".join(lines)
+
+
+class CompiledPlanCatalog:
+    """预处理的服务计划目录：关键字段解析与每个计划的提示词文本只生成一次。
+
+    每次推荐只把入围的部分计划发送给模型，因此按计划缓存渲染结果，拼接时再加编号。
+    """
+
+    def __init__(self, catalog_id: str, candidates: List[ServicePlanCandidate]) -> None:
+        self.id = catalog_id
+        self.candidates = candidates
+        self.profiles: Dict[str, Dict[str, Value]] = {plan.plan_id: parse_plan_requirements(plan) for plan in candidates}
+        self._rendered: Dict[str, str] = {plan.plan_id: render_plan(plan) for plan in candidates}
+
+    def render(self, plans: Iterable[ServicePlanCandidate]) -> str:
+        lines = ["候选服务计划一览："]
+        for index, plan in enumerate(plans, start=1):
+            lines.append(f"{index}. {self._rendered.get(plan.plan_id) or render_plan(plan)}")
+        return "\n".join(lines)
+
+
+class PlanCatalogRegistry:
+    """服务计划目录注册表：sqlite 持久化候选计划，内存中保留最近使用的预处理结果"""
+
+    def __init__(self, path: str, memory_items: int = 16) -> None:
+        self.path = path
+        self.memory_items = memory_items
+        self._compiled: "OrderedDict[str, CompiledPlanCatalog]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plan_catalogs ("
+                "id TEXT PRIMARY KEY, name TEXT, version TEXT, candidates TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def _remember(self, compiled: CompiledPlanCatalog) -> CompiledPlanCatalog:
+        with self._lock:
+            self._compiled[compiled.id] = compiled
+            self._compiled.move_to_end(compiled.id)
+            while len(self._compiled) > self.memory_items:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def _cached(self, catalog_id: str) -> Optional[CompiledPlanCatalog]:
+        with self._lock:
+            compiled = self._compiled.get(catalog_id)
+            if compiled is not None:
+                self._compiled.move_to_end(catalog_id)
+            return compiled
+
+    @staticmethod
+    def _info(row: tuple, created: bool = False) -> PlanCatalogInfo:
+        catalog_id, name, version, candidates, created_at = row
+        plan_ids = [plan["plan_id"] for plan in json.loads(candidates)]
+        return PlanCatalogInfo(
+            id=catalog_id,
+            name=name,
+            version=version,
+            plan_count=len(plan_ids),
+            plan_ids=plan_ids,
+            created_at=created_at,
+            created=created,
+        )
+
+    def compile(self, candidates: List[ServicePlanCandidate]) -> CompiledPlanCatalog:
+        """请求中直接携带的候选计划：按内容哈希复用预处理结果，不写入数据库"""
+        catalog_id = catalog_id_for(candidates)
+        return self._cached(catalog_id) or self._remember(CompiledPlanCatalog(catalog_id, list(candidates)))
+
+    def register_sync(
+        self,
+        candidates: List[ServicePlanCandidate],
+        name: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> PlanCatalogInfo:
+        catalog_id = catalog_id_for(candidates)
+        payload = json.dumps([plan.model_dump() for plan in candidates], ensure_ascii=False)
+        with self._lock:
+            conn = self._connection()
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO plan_catalogs (id, name, version, candidates, created_at) VALUES (?, ?, ?, ?, ?)",
+                (catalog_id, name, version, payload, time.time()),
+            ).rowcount
+            row = conn.execute(
+                "SELECT id, name, version, candidates, created_at FROM plan_catalogs WHERE id = ?", (catalog_id,)
+            ).fetchone()
+        if self._cached(catalog_id) is None:
+            self._remember(CompiledPlanCatalog(catalog_id, list(candidates)))
+        return self._info(row, created=bool(inserted))
+
+    def get_sync(self, catalog_id: str) -> CompiledPlanCatalog:
+        compiled = self._cached(catalog_id)
+        if compiled is not None:
+            return compiled
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT candidates FROM plan_catalogs WHERE id = ?", (catalog_id,)
+            ).fetchone()
+        if row is None:
+            raise PlanCatalogNotFoundError(catalog_id)
+        candidates = [ServicePlanCandidate.model_validate(plan) for plan in json.loads(row[0])]
+        return self._remember(CompiledPlanCatalog(catalog_id, candidates))
+
+    def info_sync(self, catalog_id: str) -> PlanCatalogInfo:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, name, version, candidates, created_at FROM plan_catalogs WHERE id = ?", (catalog_id,)
+            ).fetchone()
+        if row is None:
+            raise PlanCatalogNotFoundError(catalog_id)
+        return self._info(row)
+
+    def list_sync(self) -> List[PlanCatalogInfo]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, name, version, candidates, created_at FROM plan_catalogs ORDER BY created_at DESC"
+            ).fetchall()
+        return [self._info(row) for row in rows]
+
+    async def register(self, candidates: List[ServicePlanCandidate], name: Optional[str] = None, version: Optional[str] = None) -> PlanCatalogInfo:
+        return await asyncio.to_thread(self.register_sync, candidates, name, version)
+
+    async def get(self, catalog_id: str) -> CompiledPlanCatalog:
+        compiled = self._cached(catalog_id)
+        if compiled is not None:
+            return compiled
+        return await asyncio.to_thread(self.get_sync, catalog_id)
+
+    async def info(self, catalog_id: str) -> PlanCatalogInfo:
+        return await asyncio.to_thread(self.info_sync, catalog_id)
+
+    async def list(self) -> List[PlanCatalogInfo]:
+        return await asyncio.to_thread(self.list_sync)
+
+    async def resolve(
+        self,
+        candidates: Optional[List[ServicePlanCandidate]] = None,
+        catalog_id: Optional[str] = None,
+    ) -> Optional[CompiledPlanCatalog]:
+        """请求中的 catalog_id 优先，其次是直接携带的候选计划；都没有时返回 None"""
+        if catalog_id:
+            return await self.get(catalog_id)
+        if candidates:
+            return self.compile(candidates)
+        return None
+
+
+plan_catalogs = PlanCatalogRegistry(PLAN_CATALOG_DB_PATH, memory_items=PLAN_CATALOG_MEMORY_ITEMS)
+
+
+__all__ = [
+    "CompiledPlanCatalog",
+    "PlanCatalogNotFoundError",
+    "PlanCatalogRegistry",
+    "catalog_id_for",
+    "plan_catalogs",
+    "render_plan",
+]
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from models.service_plan import (
+    ClausePlanRecommendation,
+    PlanScore,
+    ServiceClauseForMatching,
+    ServicePlanCandidate,
+)
+
+Value = Union[float, str]
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_CN_DIGITS = {"一": 1, "两": 2, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6}
+_PERIODS_PER_YEAR = {"月": 12, "季度": 4, "半年": 2, "年": 1}
+
+# 候选计划条款要求（自由文本）中的关键字段
+_RESPONSE = re.compile(_NUMBER + r"\s*(小时|分钟)\s*内?[^，。；;,、]{0,8}?响应")
+_ON_SITE = re.compile(_NUMBER + r"\s*(小时|分钟)\s*内?[^，。；;,、]{0,8}?(?:到场|到达)")
+_STANDARD_PM = re.compile(_NUMBER + r"\s*次\s*标准")
+_SMART_PM = re.compile(_NUMBER + r"\s*次\s*(?:精智|深度)")
+_PERIODIC = re.compile(r"每(月|季度|半年|年)[^，。；;]{0,10}?(\d+|[一两二三四五六])\s*次")
+_SEATS = re.compile(r"(?:覆盖|名额)\s*" + _NUMBER + r"\s*(?:名|人)|" + _NUMBER + r"\s*名学员")
+_TRAINING_SESSIONS = re.compile(_NUMBER + r"\s*(?:次|场)[^，。；;+＋]{0,12}?(?:培训|班|课)")
+_COVERAGE = re.compile(r"(\d+)\s*[xX×*]\s*(\d+)")
+_WORKDAY = re.compile(r"(?:工作日|周一至周五)[^，。；;]{0,4}?(\d{1,2})[:：](\d{2})\s*(?:-|至|~|～)\s*(\d{1,2})[:：](\d{2})")
+# 远程平台：与 RemotePlatform 取值对应，只提到平台但无法判断归属时记为 generic
+_PLATFORM_KEYWORDS: List[Tuple[str, str]] = [("insite", "InSite"), ("第三方", "ThirdParty"), ("厂家", "Vendor"), ("原厂", "Vendor")]
+_PLATFORM_HINTS = ("平台", "运营中心", "远程监测")
+_GENERIC_PLATFORM = "generic"
+
+# 合同条款 structured_attributes 的键（由前端生成）按关键词映射到字段
+_ATTRIBUTE_KEYS: List[Tuple[str, str]] = [
+    ("响应", "response_hours"),
+    ("到场", "on_site_hours"),
+    ("覆盖时段", "coverage"),
+    ("标准保养", "standard_pm_per_year"),
+    ("精智保养", "smart_pm_per_year"),
+    ("远程保养", "remote_pm_per_year"),
+    ("平台", "platform"),
+    ("名额", "training_seats"),
+    ("培训次数", "training_times"),
+]
+_TEXT_ATTRIBUTES = {"coverage", "platform"}
+# 视为未填写的属性值，不影响规则匹配
+_EMPTY_VALUES = {"", "未提供", "未约定", "未明确", "不适用", "无", "-", "—", "/", "n/a", "none"}
+
+
+def _hours(number: str, unit: str) -> float:
+    return float(number) / 60 if unit == "分钟" else float(number)
+
+
+def _count(token: str) -> float:
+    return float(_CN_DIGITS.get(token, token))
+
+
+def normalize_coverage(text: str) -> Optional[str]:
+    """服务时段统一为 天数x小时数：24x7 / 7x24 → 7x24，工作日 8:30-17:30 → 5x9"""
+    match = _COVERAGE.search(text)
+    if match:
+        a, b = sorted((int(match.group(1)), int(match.group(2))))
+        return f"{a}x{b}"
+    match = _WORKDAY.search(text)
+    if match:
+        start = int(match.group(1)) + int(match.group(2)) / 60
+        end = int(match.group(3)) + int(match.group(4)) / 60
+        return f"5x{round(end - start)}"
+    return None
+
+
+def parse_plan_requirements(plan: ServicePlanCandidate) -> Dict[str, Value]:
+    """从候选计划各条款的要求文本中解析关键字段，同一字段以先出现的为准"""
+    profile: Dict[str, Value] = {}
+    for clause in plan.clauses:
+        text = f"{clause.requirement} {clause.notes or ''}"
+        category = f"{clause.category or ''}{clause.clause_item}"
+        found: Dict[str, Value] = {}
+        if (match := _RESPONSE.search(text)):
+            found["response_hours"] = _hours(*match.groups())
+        if (match := _ON_SITE.search(text)):
+            found["on_site_hours"] = _hours(*match.groups())
+        if (coverage := normalize_coverage(text)):
+            found["coverage"] = coverage
+        if (match := _STANDARD_PM.search(text)):
+            found["standard_pm_per_year"] = float(match.group(1))
+        if (match := _SMART_PM.search(text)):
+            found["smart_pm_per_year"] = float(match.group(1))
+        if "远程" in category or "远程" in text:
+            if (match := _PERIODIC.search(text)):
+                found["remote_pm_per_year"] = _count(match.group(2)) * _PERIODS_PER_YEAR[match.group(1)]
+            platform = next((name for keyword, name in _PLATFORM_KEYWORDS if keyword in text.lower()), None)
+            if platform is None and any(hint in text for hint in _PLATFORM_HINTS):
+                platform = _GENERIC_PLATFORM
+            if platform:
+                found["platform"] = platform
+        if "培训" in category or "培训" in text:
+            if (match := _SEATS.search(text)):
+                found["training_seats"] = float(match.group(1) or match.group(2))
+            sessions = _TRAINING_SESSIONS.findall(text)
+            if sessions:
+                found["training_times"] = sum(float(value) for value in sessions)
+        for name, value in found.items():
+            profile.setdefault(name, value)
+    return profile
+
+
+def _parse_clause_attributes(clause: ServiceClauseForMatching) -> Tuple[Dict[str, Value], List[str]]:
+    """返回 (可比较的字段, 已填写但无法映射或解析的属性键)"""
+    attributes: Dict[str, Value] = {}
+    unparsed: List[str] = []
+    for key, raw in (clause.structured_attributes or {}).items():
+        if raw is None or str(raw).strip().lower() in _EMPTY_VALUES:
+            continue
+        raw = str(raw).strip()
+        name = next((name for keyword, name in _ATTRIBUTE_KEYS if keyword in key), None)
+        if name is None:
+            unparsed.append(key)
+        elif name == "coverage":
+            coverage = normalize_coverage(raw)
+            if coverage:
+                attributes[name] = coverage
+            else:
+                unparsed.append(key)
+        elif name == "platform":
+            attributes[name] = raw
+        else:
+            match = re.search(_NUMBER, raw)
+            if match:
+                # 多个设备类型的远程保养次数取最大值
+                attributes[name] = max(float(match.group(1)), float(attributes.get(name, 0.0)))
+            else:
+                unparsed.append(key)
+    return attributes, unparsed
+
+
+def parse_clause_attributes(clause: ServiceClauseForMatching) -> Dict[str, Value]:
+    """合同条款 structured_attributes 转为可比较的字段；“未提供”等未填写的值与无法解析的值忽略"""
+    return _parse_clause_attributes(clause)[0]
+
+
+def _similarity(name: str, wanted: Value, offered: Value) -> float:
+    if name == "platform":
+        if str(wanted).lower() == str(offered).lower():
+            return 1.0
+        return 0.5 if offered == _GENERIC_PLATFORM else 0.0
+    if name in _TEXT_ATTRIBUTES:
+        return 1.0 if wanted == offered else 0.0
+    wanted, offered = float(wanted), float(offered)
+    if wanted == offered:
+        return 1.0
+    return max(0.0, 1.0 - abs(wanted - offered) / max(abs(wanted), abs(offered)))
+
+
+@dataclass
+class ClauseScores:
+    clause: ServiceClauseForMatching
+    attributes: Dict[str, Value]
+    scores: List[PlanScore] = field(default_factory=list)
+    # 已填写但无法映射或解析的属性键（如备件、球管保障），规则无法比较
+    unparsed: List[str] = field(default_factory=list)
+
+    def exact_match(self, min_attributes: int) -> Optional[PlanScore]:
+        """有且只有一个计划在全部（至少 min_attributes 个）关键字段上完全一致时返回该计划。
+
+        条款中有任何已填写的属性未能解析比较时不按规则确定，交给模型判断。
+        """
+        if self.unparsed or len(self.attributes) < max(1, min_attributes):
+            return None
+        perfect = [score for score in self.scores if score.score == 1.0]
+        return perfect[0] if len(perfect) == 1 else None
+
+
+def score_clause(
+    clause: ServiceClauseForMatching,
+    candidates: Sequence[ServicePlanCandidate],
+    profiles: Dict[str, Dict[str, Value]],
+) -> ClauseScores:
+    attributes, unparsed = _parse_clause_attributes(clause)
+    result = ClauseScores(clause=clause, attributes=attributes, unparsed=unparsed)
+    for plan in candidates:
+        profile = profiles[plan.plan_id]
+        attribute_scores = {
+            name: round(_similarity(name, wanted, profile[name]), 3)
+            for name, wanted in attributes.items()
+            if name in profile
+        }
+        score = sum(attribute_scores.values()) / len(attributes) if attributes else 0.0
+        result.scores.append(PlanScore(
+            plan_id=plan.plan_id,
+            plan_name=plan.plan_name,
+            score=round(score, 3),
+            attribute_scores=attribute_scores,
+        ))
+    # 稳定排序：同分时保持候选计划的原始顺序
+    result.scores.sort(key=lambda score: -score.score)
+    return result
+
+
+@dataclass
+class PlanShortlist:
+    clause_scores: List[ClauseScores]
+    plan_scores: List[PlanScore]
+    shortlist: List[ServicePlanCandidate]
+    resolved: List[ClausePlanRecommendation]
+    pending: List[ServiceClauseForMatching]
+
+
+def shortlist_plans(
+    candidates: Sequence[ServicePlanCandidate],
+    clauses: Sequence[ServiceClauseForMatching],
+    top_k: int,
+    exact_min_attributes: int,
+    profiles: Optional[Dict[str, Dict[str, Value]]] = None,
+) -> PlanShortlist:
+    """为每个合同条款给候选计划打分；完全一致且唯一的条款直接确定匹配，其余条款只保留总分最高的 top_k 个计划。
+
+    profiles 为预先解析的候选计划关键字段（按 plan_id），未提供时现场解析。
+    """
+    if profiles is None:
+        profiles = {plan.plan_id: parse_plan_requirements(plan) for plan in candidates}
+    clause_scores = [score_clause(clause, candidates, profiles) for clause in clauses]
+
+    totals: Dict[str, float] = {plan.plan_id: 0.0 for plan in candidates}
+    scored = [scores for scores in clause_scores if scores.attributes]
+    for scores in scored:
+        for score in scores.scores:
+            totals[score.plan_id] += score.score / len(scored)
+    plan_scores = sorted(
+        (PlanScore(plan_id=plan.plan_id, plan_name=plan.plan_name, score=round(totals[plan.plan_id], 3)) for plan in candidates),
+        key=lambda score: -score.score,
+    )
+
+    resolved: List[ClausePlanRecommendation] = []
+    pending: List[ServiceClauseForMatching] = []
+    for scores in clause_scores:
+        exact = scores.exact_match(exact_min_attributes)
+        if exact is None:
+            pending.append(scores.clause)
+            continue
+        resolved.append(ClausePlanRecommendation(
+            clause_id=scores.clause.clause_id,
+            clause_type=scores.clause.clause_type,
+            recommended_plan_id=exact.plan_id,
+            recommended_plan_name=exact.plan_name,
+            rationale=f"{len(scores.attributes)}项关键字段与{exact.plan_name}完全一致"[:30],
+            resolved_by="rule",
+            candidate_scores=scores.scores,
+        ))
+
+    # 没有任何可比较字段时无法排序，保留全部计划交给模型判断
+    if not scored or len(candidates) <= top_k:
+        shortlist = list(candidates)
+    else:
+        # 已按规则确定的计划也保留，便于模型给出整体推荐
+        keep = {score.plan_id for score in plan_scores[:max(1, top_k)]}
+        keep.update(match.recommended_plan_id for match in resolved)
+        shortlist = [plan for plan in candidates if plan.plan_id in keep]
+    return PlanShortlist(
+        clause_scores=clause_scores,
+        plan_scores=plan_scores,
+        shortlist=shortlist,
+        resolved=resolved,
+        pending=pending,
+    )
+
+
+__all__ = [
+    "ClauseScores",
+    "PlanShortlist",
+    "normalize_coverage",
+    "parse_clause_attributes",
+    "parse_plan_requirements",
+    "score_clause",
+    "shortlist_plans",
+]
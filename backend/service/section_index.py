@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    SECTION_ROUTING_ENABLED,
+    SECTION_ROUTING_MAX_RATIO,
+    SECTION_ROUTING_MIN_SECTIONS,
+    SECTION_ROUTING_RULES_FILE,
+)
+
+_MD_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# 第X章/节/条 后须紧跟空白、标点或行尾，排除“第五条约定的……”这类正文引用
+_ARTICLE = re.compile(r"^\s*(?:\*\*)?\s*第[一二三四五六七八九十百零〇两\d]+([章节条])(?=[\s、:：.．*]|$)")
+_CN_ENUM = re.compile(r"^\s*(?:\*\*)?\s*[一二三四五六七八九十]+、")
+_ARTICLE_LEVELS = {"章": 1, "节": 2, "条": 3}
+_TABLE_LEVEL = 99
+_OMITTED = "\n\n……\n\n"
+
+
+@dataclass
+class Section:
+    id: int
+    kind: str  # preamble / heading / article / table
+    title: str
+    level: int
+    start: int
+    end: int = 0
+    # 标题行结束位置；正文从这里开始
+    title_end: int = 0
+    parent: Optional[int] = None
+    children: List[int] = field(default_factory=list)
+
+
+class SectionIndex:
+    """合同 markdown 的章节树：markdown 标题、第X章/节/条编号、“一、”序号与表格，均记录字符偏移"""
+
+    def __init__(self, markdown: str, sections: List[Section]) -> None:
+        self.markdown = markdown
+        self.sections = sections
+
+    @property
+    def heading_count(self) -> int:
+        return sum(1 for section in self.sections if section.kind in ("heading", "article"))
+
+    @property
+    def front_matter_end(self) -> int:
+        """首个不含下级标题的章节之前的文本（合同名称、编号、当事人、设备清单通常在此）"""
+        for section in self.sections[1:]:
+            if section.kind == "table":
+                continue
+            if not any(self.sections[child].kind != "table" for child in section.children):
+                return section.start
+        return self.sections[0].end
+
+    def own_ranges(self, section: Section) -> List[Tuple[int, int]]:
+        """章节自身的文本区间（不含子章节，表格之后的正文仍归属本章节）"""
+        ranges, cursor = [], section.start
+        for child_id in section.children:
+            child = self.sections[child_id]
+            if child.start > cursor:
+                ranges.append((cursor, child.start))
+            cursor = max(cursor, child.end)
+        if section.end > cursor:
+            ranges.append((cursor, section.end))
+        return ranges
+
+    def own_text(self, section: Section) -> str:
+        return "".join(self.markdown[start:end] for start, end in self.own_ranges(section))
+
+    def ancestors(self, section: Section) -> List[Section]:
+        chain = []
+        while section.parent is not None:
+            section = self.sections[section.parent]
+            chain.append(section)
+        return chain
+
+    def render(self, ranges: List[Tuple[int, int]]) -> str:
+        """按文档顺序合并区间并拼接，不相邻的片段之间用省略号分隔"""
+        merged: List[List[int]] = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return _OMITTED.join(self.markdown[start:end].strip("\n") for start, end in merged)
+
+
+def _heading_level(line: str) -> Optional[Tuple[str, int, str]]:
+    match = _MD_HEADING.match(line)
+    if match:
+        return "heading", len(match.group(1)), match.group(2).replace("**", "").strip()
+    match = _ARTICLE.match(line)
+    if match:
+        return "article", _ARTICLE_LEVELS[match.group(1)], line.replace("**", "").strip()
+    if _CN_ENUM.match(line) and len(line.strip()) <= 40:
+        return "heading", 2, line.replace("**", "").strip()
+    return None
+
+
+@lru_cache(maxsize=16)
+def build_section_index(markdown: str) -> SectionIndex:
+    sections: List[Section] = [Section(id=0, kind="preamble", title="", level=0, start=0)]
+    stack: List[int] = []
+    offset = 0
+    table: Optional[Section] = None
+    lines = markdown.splitlines(keepends=True)
+    for line in lines:
+        line_start, offset = offset, offset + len(line)
+        stripped = line.strip()
+
+        if stripped.startswith("|"):
+            if table is None:
+                table = Section(
+                    id=len(sections), kind="table", title=stripped, level=_TABLE_LEVEL,
+                    start=line_start, title_end=offset, parent=stack[-1] if stack else 0,
+                )
+                sections.append(table)
+                sections[table.parent].children.append(table.id)
+            table.end = offset
+            continue
+        table = None
+
+        heading = _heading_level(line)
+        if heading is None:
+            continue
+        kind, level, title = heading
+        while stack and sections[stack[-1]].level >= level:
+            sections[stack.pop()].end = line_start
+        section = Section(
+            id=len(sections), kind=kind, title=title, level=level,
+            start=line_start, title_end=offset, parent=stack[-1] if stack else None,
+        )
+        if section.parent is not None:
+            sections[section.parent].children.append(section.id)
+        sections.append(section)
+        stack.append(section.id)
+
+    for section_id in stack:
+        sections[section_id].end = len(markdown)
+    first_heading = next((section.start for section in sections[1:] if section.kind != "table"), len(markdown))
+    preamble = sections[0]
+    preamble.end = first_heading
+    preamble.title_end = 0
+    return SectionIndex(markdown, sections)
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    keywords: Tuple[str, ...]
+    # 是否附带前言（首个具体条款之前的合同名称、编号、甲乙方等）
+    include_preamble: bool = False
+    # 是否附带设备清单类表格（表头含下列任一关键词）
+    include_device_tables: bool = False
+    # 正文至少命中多少个不同关键词才选中该章节（标题命中任一关键词即选中）
+    min_body_keywords: int = 2
+
+
+DEVICE_TABLE_KEYWORDS = ("型号", "设备", "系统编号", "系统号", "注册证", "序列号", "SN", "System ID")
+
+DEFAULT_ROUTES: Dict[str, RouteRule] = {
+    "basic_info": RouteRule(
+        # 甲方/乙方几乎出现在每一条中，不作为关键词；当事人信息由前言提供
+        keywords=("合同编号", "合同号", "合同金额", "总金额", "总价", "价款", "付款", "支付", "币种",
+                  "有效期", "合同期限", "服务期限", "生效"),
+        include_preamble=True,
+    ),
+    "training_support": RouteRule(
+        keywords=("培训", "操作人员", "应用培训", "培训名额", "学员", "进修"),
+        include_device_tables=True,
+        min_body_keywords=1,
+    ),
+    "contract_and_compliance": RouteRule(
+        keywords=("违约", "争议", "仲裁", "诉讼", "合规", "保密", "知识产权", "反腐败", "廉洁", "适用法律",
+                  "终止", "解除", "不可抗力", "责任限制", "赔偿", "转让"),
+    ),
+    "after_sales_support": RouteRule(
+        keywords=("开机率", "开机保证", "停机", "售后", "服务报告", "保修期", "顺延", "维修记录", "服务方式"),
+    ),
+    "key_spare_parts": RouteRule(
+        keywords=("备件", "配件", "零部件", "探测器", "球管", "CT管", "心电", "ECG", "线圈", "更换", "旧件",
+                  "物流", "部件"),
+        include_device_tables=True,
+    ),
+    "onsite_sla": RouteRule(
+        keywords=("响应", "到场", "到达现场", "小时", "现场服务", "SLA", "工作日", "保修", "维修服务", "故障"),
+        include_device_tables=True,
+    ),
+    "yearly_maintenance": RouteRule(
+        keywords=("保养", "预防性维护", "预防性维修", "PM", "巡检", "定期维护", "校准", "质控"),
+        include_device_tables=True,
+        min_body_keywords=1,
+    ),
+    "remote_maintenance": RouteRule(
+        keywords=("远程", "在线监测", "监测", "InSite", "iLinq", "网络连接", "数字化", "远程诊断", "账号"),
+        include_device_tables=True,
+        min_body_keywords=1,
+    ),
+}
+
+
+def _load_routes(path: str) -> Dict[str, RouteRule]:
+    routes = dict(DEFAULT_ROUTES)
+    if not path:
+        return routes
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as exc:
+        print(f"Failed to load section routing rules from {path}: {exc}")
+        return routes
+    for name, rule in overrides.items():
+        base = routes.get(name, RouteRule(keywords=()))
+        routes[name] = RouteRule(
+            keywords=tuple(rule.get("keywords", base.keywords)),
+            include_preamble=rule.get("include_preamble", base.include_preamble),
+            include_device_tables=rule.get("include_device_tables", base.include_device_tables),
+            min_body_keywords=rule.get("min_body_keywords", base.min_body_keywords),
+        )
+    return routes
+
+
+@dataclass
+class RoutedContent:
+    text: str
+    routed: bool
+    sections: List[str] = field(default_factory=list)
+    reason: str = ""
+
+
+class SectionRouter:
+    """按抽取类型的关键词规则挑选相关章节；章节结构不足或命中不充分时退回全文"""
+
+    def __init__(
+        self,
+        routes: Dict[str, RouteRule],
+        enabled: bool = True,
+        max_ratio: float = 0.8,
+        min_sections: int = 3,
+    ) -> None:
+        self.routes = routes
+        self.enabled = enabled
+        self.max_ratio = max_ratio
+        self.min_sections = min_sections
+        self.counters: Counter = Counter()
+
+    def _select(self, index: SectionIndex, rule: RouteRule) -> Tuple[List[Tuple[int, int]], List[str]]:
+        ranges: List[Tuple[int, int]] = []
+        titles: List[str] = []
+        for section in index.sections:
+            if section.kind == "preamble":
+                if rule.include_preamble and index.front_matter_end > 0:
+                    ranges.append((0, index.front_matter_end))
+                    titles.append("前言")
+                continue
+            if section.kind == "table" and rule.include_device_tables and any(
+                keyword in section.title for keyword in DEVICE_TABLE_KEYWORDS
+            ):
+                ranges.append((section.start, section.end))
+                titles.append("设备表格")
+                continue
+
+            title_hit = section.kind != "table" and any(keyword in section.title for keyword in rule.keywords)
+            body = index.own_text(section)
+            body_hits = sum(1 for keyword in rule.keywords if keyword in body)
+            if not title_hit and body_hits < rule.min_body_keywords:
+                continue
+            # 标题命中时整棵子树都相关；仅正文命中、或命中的是覆盖大半文档的标题（如合同名称）时只取本章节自身文本
+            if title_hit and section.end - section.start <= len(index.markdown) / 2:
+                ranges.append((section.start, section.end))
+            else:
+                ranges.extend(index.own_ranges(section))
+            # 附带上级标题行，保留“第几章/哪一部分”的上下文
+            for ancestor in index.ancestors(section):
+                ranges.append((ancestor.start, ancestor.title_end))
+            titles.append(section.title[:30])
+        return ranges, titles
+
+    def route(self, extractor: str, markdown: str) -> RoutedContent:
+        rule = self.routes.get(extractor)
+        if not self.enabled or rule is None or not markdown:
+            return RoutedContent(markdown, routed=False, reason="未启用")
+
+        index = build_section_index(markdown)
+        if index.heading_count < self.min_sections:
+            result = RoutedContent(markdown, routed=False, reason="章节结构不足")
+        else:
+            ranges, titles = self._select(index, rule)
+            text = index.render(ranges) if ranges else ""
+            if not text.strip() or not titles or titles in (["前言"], ["设备表格"], ["前言", "设备表格"]):
+                result = RoutedContent(markdown, routed=False, reason="未命中相关章节")
+            elif len(text) > len(markdown) * self.max_ratio:
+                result = RoutedContent(markdown, routed=False, sections=titles, reason="相关章节占比过高")
+            else:
+                result = RoutedContent(text, routed=True, sections=titles)
+
+        self.counters[f"{extractor}.{'routed' if result.routed else 'fallback'}"] += 1
+        self.counters[f"{extractor}.chars_in"] += len(markdown)
+        self.counters[f"{extractor}.chars_out"] += len(result.text)
+        if result.routed:
+            print(f"Section router {extractor}: {len(result.text)}/{len(markdown)} chars, {len(result.sections)} sections")
+        else:
+            print(f"Section router {extractor}: full text ({result.reason})")
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        summary: Dict[str, Dict[str, int]] = {}
+        for key, value in self.counters.items():
+            extractor, metric = key.rsplit(".", 1)
+            summary.setdefault(extractor, {})[metric] = value
+        return summary
+
+
+section_router = SectionRouter(
+    _load_routes(SECTION_ROUTING_RULES_FILE),
+    enabled=SECTION_ROUTING_ENABLED,
+    max_ratio=SECTION_ROUTING_MAX_RATIO,
+    min_sections=SECTION_ROUTING_MIN_SECTIONS,
+)
+
+
+__all__ = [
+    "DEFAULT_ROUTES",
+    "RouteRule",
+    "RoutedContent",
+    "Section",
+    "SectionIndex",
+    "SectionRouter",
+    "build_section_index",
+    "section_router",
+]
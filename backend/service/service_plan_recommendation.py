@@ -1,72 +1,179 @@
 from __future__ import annotations
 
-from typing import Iterable
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence
 
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import PydanticOutputParser
 
-from config import API_BASE_URL, API_KEY, LLM_MODEL
+from config import (
+    SERVICE_PLAN_EXACT_MIN_ATTRIBUTES,
+    SERVICE_PLAN_SHORTLIST_SIZE,
+)
 from models.service_plan import (
     ClausePlanRecommendation,
     ServiceClauseForMatching,
-    ServicePlanCandidate,
+    ServicePlanBatchContract,
     ServicePlanRecommendationLLMOutput,
     ServicePlanRecommendationRequest,
 )
+from models.usage import TokenUsage
 from prompts import SERVICE_PLAN_RECOMMENDATION_SYSTEM_PROMPT
+from service.json_repair import JsonRepairError
+from service.llm_clients import LLM, llm_clients
+from service.llm_scheduler import Priority, llm_scheduler
+from service.plan_catalogs import CompiledPlanCatalog, plan_catalogs
+from service.plan_scoring import PlanShortlist, shortlist_plans
+from service.structured_output import invoke_structured
+from service.token_usage import usage_scope
+
+
+@dataclass
+class BatchOutcome:
+    contract_id: str
+    result: Optional[ServicePlanRecommendationLLMOutput]
+    error: Optional[Exception]
+    duration_ms: float
+    usage: Optional[TokenUsage] = None
 
 
 class ServicePlanRecommendationAgent:
     def __init__(self) -> None:
         self.output_parser = PydanticOutputParser(pydantic_object=ServicePlanRecommendationLLMOutput)
-        self.llm = ChatOpenAI(
-            model=LLM_MODEL,
-            temperature=0,
-            api_key=API_KEY,
-            base_url=API_BASE_URL,
-        )
+        self.llm = llm_clients.chat(LLM)
         self.system_prompt = SERVICE_PLAN_RECOMMENDATION_SYSTEM_PROMPT
 
     async def recommend(self, request: ServicePlanRecommendationRequest) -> ServicePlanRecommendationLLMOutput:
-        if not request.candidates:
+        catalog = await plan_catalogs.resolve(request.candidates, request.catalog_id)
+        if catalog is None or not catalog.candidates:
             raise ValueError("候选服务计划列表为空，无法进行匹配")
-        if not request.clauses:
+        return await self.recommend_clauses(request.clauses, catalog)
+
+    async def recommend_clauses(
+        self,
+        clauses: Sequence[ServiceClauseForMatching],
+        catalog: CompiledPlanCatalog,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> ServicePlanRecommendationLLMOutput:
+        if not clauses:
             raise ValueError("合同条款列表为空，无法进行匹配")
 
-        user_prompt = self._build_user_prompt(request.candidates, request.clauses)
-        response = await self.llm.ainvoke(
-            [
-                ("system", self.system_prompt),
-                ("system", f"输出格式: {self.output_parser.get_format_instructions()}"),
-                ("user", user_prompt),
-            ]
+        # 本地打分：关键字段完全一致的条款直接确定，其余条款只与得分最高的候选计划一起发送给模型
+        scoring = shortlist_plans(
+            catalog.candidates,
+            clauses,
+            SERVICE_PLAN_SHORTLIST_SIZE,
+            SERVICE_PLAN_EXACT_MIN_ATTRIBUTES,
+            profiles=catalog.profiles,
+        )
+        print(
+            f"Service plan shortlist: {len(scoring.shortlist)}/{len(catalog.candidates)} plans, "
+            f"{len(scoring.resolved)}/{len(clauses)} clauses resolved by rule"
         )
-        output_text = response.content.strip().replace("```json", "").replace("```", "")
+        if not scoring.pending:
+            return self._rule_only_result(scoring)
+
+        user_prompt = self._build_user_prompt(catalog.render(scoring.shortlist), scoring.pending, scoring.resolved)
+        messages = [
+            ("system", self.system_prompt),
+            ("user", user_prompt),
+        ]
+        try:
+            result = await invoke_structured(self.llm, messages, self.output_parser, self._output_format_refine, priority)
+        except JsonRepairError as exc:
+            raise RuntimeError(f"无法解析服务计划匹配结果: {exc}") from exc
+        return self._merge_result(result, scoring)
+
+    async def recommend_batch(
+        self,
+        contracts: Sequence[ServicePlanBatchContract],
+        catalog: CompiledPlanCatalog,
+        max_parallel: int,
+    ) -> AsyncIterator[BatchOutcome]:
+        """多份合同共用同一目录，最多 max_parallel 份并行，按完成先后逐份返回；单份失败只记录在该份结果中。
+
+        批量调用使用 BULK 优先级，不挤占交互请求；迭代提前结束（如客户端断开）时取消未完成的合同。
+        """
+        semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+        async def run(contract: ServicePlanBatchContract) -> BatchOutcome:
+            async with semaphore:
+                started = time.perf_counter()
+                # 每份合同单独记账，同时计入整个批量请求
+                with usage_scope() as ledger:
+                    try:
+                        result, error = await self.recommend_clauses(contract.clauses, catalog, Priority.BULK), None
+                    except Exception as exc:
+                        print(f"Service plan recommendation for contract {contract.contract_id} failed: {exc}")
+                        result, error = None, exc
+                return BatchOutcome(
+                    contract_id=contract.contract_id,
+                    result=result,
+                    error=error,
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                    usage=ledger.summary(),
+                )
+
+        tasks = [asyncio.create_task(run(contract)) for contract in contracts]
         try:
-            return self.output_parser.parse(output_text)
-        except Exception as exc:
-            refined = await self._output_format_refine(output_text)
-            try:
-                return self.output_parser.parse(refined)
-            except Exception:
-                raise RuntimeError(f"无法解析服务计划匹配结果: {exc}") from exc
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _merge_result(result: ServicePlanRecommendationLLMOutput, scoring: PlanShortlist) -> ServicePlanRecommendationLLMOutput:
+        """按请求中的条款顺序合并规则匹配与模型匹配结果，并附上本地打分"""
+        by_clause: Dict[str, ClausePlanRecommendation] = {match.clause_id: match for match in result.matches}
+        by_clause.update({match.clause_id: match for match in scoring.resolved})
+        matches: List[ClausePlanRecommendation] = []
+        for scores in scoring.clause_scores:
+            match = by_clause.pop(scores.clause.clause_id, None)
+            if match is None:
+                continue
+            match.candidate_scores = scores.scores
+            matches.append(match)
+        # 模型返回了请求中不存在的条款ID时原样保留在末尾
+        matches.extend(by_clause.values())
+        result.matches = matches
+        result.plan_scores = scoring.plan_scores
+        result.shortlisted_plan_ids = [plan.plan_id for plan in scoring.shortlist]
+        return result
+
+    @staticmethod
+    def _rule_only_result(scoring: PlanShortlist) -> ServicePlanRecommendationLLMOutput:
+        """全部条款都按规则确定时不调用模型：整体推荐取匹配条款最多的计划（同数量时取总分更高者）"""
+        counts: Dict[str, int] = {}
+        for match in scoring.resolved:
+            counts[match.recommended_plan_id] = counts.get(match.recommended_plan_id, 0) + 1
+        rank = {score.plan_id: index for index, score in enumerate(scoring.plan_scores)}
+        overall_id = min(counts, key=lambda plan_id: (-counts[plan_id], rank.get(plan_id, len(rank))))
+        overall_name: Optional[str] = next(
+            match.recommended_plan_name for match in scoring.resolved if match.recommended_plan_id == overall_id
+        )
+        deviations = [
+            f"条款 {match.clause_id} 对应 {match.recommended_plan_name}"
+            for match in scoring.resolved
+            if match.recommended_plan_id != overall_id
+        ]
+        return ServicePlanRecommendationLLMOutput(
+            summary=f"{len(scoring.resolved)} 条合同条款的关键字段均与候选计划完全一致，已按规则直接匹配，整体推荐 {overall_name}。",
+            overall_plan_id=overall_id,
+            overall_plan_name=overall_name,
+            overall_adjustment_notes="；".join(deviations) or None,
+            matches=list(scoring.resolved),
+            plan_scores=scoring.plan_scores,
+        )
 
     def _build_user_prompt(
         self,
-        candidates: Iterable[ServicePlanCandidate],
+        candidate_block: str,
         clause_matches: Iterable[ServiceClauseForMatching],
+        resolved: Iterable[ClausePlanRecommendation] = (),
     ) -> str:
-        candidate_lines = ["候选服务计划一览："]
-        for index, plan in enumerate(candidates, start=1):
-            candidate_lines.append(f"{index}. {plan.plan_name} (ID: {plan.plan_id})")
-            if plan.description:
-                candidate_lines.append(f"   描述: {plan.description}")
-            candidate_lines.append("   关键条款：")
-            for clause in plan.clauses:
-                category_label = clause.category or "未分类"
-                candidate_lines.append(f"   - [{category_label}] {clause.clause_item}: {clause.requirement}")
-                if clause.notes:
-                    candidate_lines.append(f"     备注: {clause.notes}")
+        """candidate_block 为目录预先渲染的入围计划文本"""
         clause_lines = ["\n待匹配的合同条款："]
         for index, clause in enumerate(clause_matches, start=1):
             clause_lines.append(f"{index}. 条款ID {clause.clause_id} | 类型 {clause.clause_type}")
@@ -76,10 +183,18 @@ class ServicePlanRecommendationAgent:
                 clause_lines.append(f"   关键字段：{attr_pairs}")
             if clause.original_snippet:
                 clause_lines.append(f"   合同原文片段：{clause.original_snippet}")
+        resolved_lines = [
+            f"- 条款ID {match.clause_id} | 类型 {match.clause_type} → {match.recommended_plan_name} (ID: {match.recommended_plan_id})"
+            for match in resolved
+        ]
+        if resolved_lines:
+            # 已按关键字段确定的条款只作为整体推荐的参考，不需要模型再次输出
+            clause_lines.append("\n以下条款已按关键字段确定匹配，无需输出，仅供整体推荐参考：")
+            clause_lines.extend(resolved_lines)
         clause_lines.append(
             "\n请综合考虑 SLA、保养频次、远程监测、培训与备件等因素，为每条合同条款挑选最匹配的服务计划。"
         )
-        return "\n".join(candidate_lines + clause_lines)
+        return "\n".join([candidate_block, *clause_lines])
 
     async def _output_format_refine(self, text: str) -> str:
         prompt = f"""
@@ -91,11 +206,12 @@ class ServicePlanRecommendationAgent:
 
 请仅返回符合要求的纯JSON，不要添加其他说明。
 """
-        response = await self.llm.ainvoke(prompt)
+        response = await llm_scheduler.ainvoke(self.llm, prompt)
         return response.content.strip().replace("```json", "").replace("```", "")
 
 
 __all__ = [
+    "BatchOutcome",
     "ServicePlanRecommendationAgent",
     "ClausePlanRecommendation",
 ]
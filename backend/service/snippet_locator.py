@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from config import SNIPPET_LOCATOR_ENABLED, SNIPPET_MIN_SIMILARITY
+from models.snippet import SnippetLocation
+
+# 需要定位的片段字段，以及写入定位结果的字段
+SNIPPET_FIELDS = ("original_contract_snippet", "contract_snippet")
+LOCATION_FIELD = "snippet_location"
+
+# k-gram 长度与采样模数：只索引哈希值能被模数整除的 k-gram（按内容采样，查询端用同样规则取种子）
+_GRAM = 6
+_SAMPLE = 4
+_HASH_BASE = np.uint64(1000003)
+# 近似匹配投票时忽略出现次数过多的种子（如表格分隔符、固定套话）；逐字校验的候选数超过上限时退回线性查找
+_MAX_CANDIDATES = 64
+_MAX_EXACT_CANDIDATES = 4096
+# 近似匹配遇到不一致时尝试跳过的字符数组合（片段侧, 原文侧），越小越优先；跳过后须有 _RESYNC 个字符逐字一致
+_MAX_SKIP = 4
+_RESYNC = 2
+_SKIPS = sorted(
+    ((dq, dt) for dq in range(_MAX_SKIP + 1) for dt in range(_MAX_SKIP + 1) if dq or dt),
+    key=lambda skip: (skip[0] + skip[1], abs(skip[0] - skip[1])),
+)
+# 每次批量定位中近似匹配最多比对的片段字符数，超出后其余片段记为未找到
+_FUZZY_BUDGET = 200000
+_ENCODING = "utf-32-le"
+
+
+def _build_drop_table() -> np.ndarray:
+    """归一化时删除的字符：空白、ASCII 标点与 Markdown 符号、通用标点、中文标点、全角标点"""
+    drop = np.zeros(0x10000, dtype=bool)
+    for code in range(0x80):
+        drop[code] = not chr(code).isalnum()
+    for start, end in ((0x0080, 0x00BF), (0x2000, 0x206F), (0x2190, 0x22FF), (0x2460, 0x27BF),
+                       (0x3000, 0x303F), (0xFE10, 0xFE1F), (0xFE30, 0xFE4F), (0xFF00, 0xFF0F),
+                       (0xFF1A, 0xFF20), (0xFF3B, 0xFF40), (0xFF5B, 0xFF65)):
+        drop[start:end + 1] = True
+    # 圈号（①②）与 ² 等保留为内容
+    drop[0x00B2:0x00B4] = False
+    drop[0x00B9] = False
+    drop[0x2460:0x24FF + 1] = False
+    return drop
+
+
+_DROP = _build_drop_table()
+
+
+def _codepoints(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode(_ENCODING, "surrogatepass"), dtype=np.uint32)
+
+
+def _normalize(codepoints: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """删除空白与标点、全角字母数字转半角、大写转小写；返回 (归一化码点, 每个码点在原文中的位置)"""
+    bmp = codepoints < 0x10000
+    drop = _DROP[np.where(bmp, codepoints, 0)] & bmp
+    positions = np.nonzero(~drop)[0]
+    normalized = codepoints[positions].copy()
+    fullwidth = (normalized >= 0xFF01) & (normalized <= 0xFF5E)
+    normalized[fullwidth] -= 0xFEE0
+    upper = (normalized >= 0x41) & (normalized <= 0x5A)
+    normalized[upper] += 0x20
+    return normalized, positions
+
+
+def _walk(query: str, text: str) -> Tuple[int, int, int]:
+    """从两段文本的开头逐字对齐：遇到不一致时按 _SKIPS 跳过少量字符（替换、增删）后重新对齐，无法对齐时停止。
+
+    返回 (一致的字符数, 片段侧最后一个一致字符之后的位置, 原文侧最后一个一致字符之后的位置)；
+    每个字符最多尝试 len(_SKIPS) 次跳过，耗时与片段长度成正比。
+    """
+    i = j = matched = 0
+    query_end = text_end = 0
+    while i < len(query) and j < len(text):
+        # 先按 8 个字符一段比较，跳过大段一致的内容
+        while query[i:i + 8] == text[j:j + 8] and i + 8 <= len(query):
+            i += 8
+            j += 8
+            matched += 8
+            query_end, text_end = i, j
+        if i < len(query) and j < len(text) and query[i] == text[j]:
+            i += 1
+            j += 1
+            matched += 1
+            query_end, text_end = i, j
+            continue
+        for dq, dt in _SKIPS:
+            probe = query[i + dq:i + dq + _RESYNC]
+            if probe and text.startswith(probe, j + dt):
+                i += dq
+                j += dt
+                break
+        else:
+            break
+    return matched, query_end, text_end
+
+
+def _gram_hashes(codepoints: np.ndarray) -> np.ndarray:
+    count = len(codepoints) - _GRAM + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    values = codepoints.astype(np.uint64)
+    hashes = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(_GRAM):
+            hashes = hashes * _HASH_BASE + values[offset:offset + count]
+    return hashes
+
+
+class SnippetIndex:
+    """合同 Markdown 的片段定位索引（每份合同构建一次）。
+
+    原文归一化（去空白/标点、全角转半角、忽略大小写）后保留到原文的位置映射；
+    对归一化文本中按哈希采样的 k-gram 建立有序索引，查询时用片段中同样被采样的 k-gram 作为种子定位候选位置，
+    逐字校验命中后映射回原文偏移；都不一致时从得票最多的对角线上的种子向两侧逐字对齐（跳过少量不一致的字符），
+    得到近似匹配的原文范围，耗时与片段长度成正比。
+    """
+
+    def __init__(self, markdown: str) -> None:
+        self.markdown = markdown
+        normalized, self.positions = _normalize(_codepoints(markdown))
+        self.text = normalized.tobytes().decode(_ENCODING, "surrogatepass")
+        hashes = _gram_hashes(normalized)
+        sampled = np.nonzero(hashes % _SAMPLE == 0)[0]
+        order = np.argsort(hashes[sampled], kind="stable")
+        self._hashes = hashes[sampled][order]
+        self._gram_positions = sampled[order]
+
+    def _span(self, start: int, end: int) -> Tuple[int, int]:
+        """归一化文本 [start, end) 映射为原文 [start, end)"""
+        return int(self.positions[start]), int(self.positions[end - 1]) + 1
+
+    def _find(self, query_text: str, seeds: List[Tuple[int, int, int]]) -> int:
+        """seeds 为片段中被采样的 k-gram：(片段内偏移, 索引区间起点, 索引区间终点)"""
+        if not seeds:
+            # 片段太短或没有被采样的 k-gram，退回线性查找
+            return self.text.find(query_text)
+
+        if all(high > low for _, low, high in seeds):
+            # 片段的每一次出现都必然包含所有种子，只需校验出现次数最少的种子
+            offset, low, high = min(seeds, key=lambda seed: seed[2] - seed[1])
+            if high - low > _MAX_EXACT_CANDIDATES:
+                return self.text.find(query_text)
+            for position in self._gram_positions[low:high].tolist():
+                candidate = position - offset
+                if candidate >= 0 and self.text.startswith(query_text, candidate):
+                    return candidate
+        return -1
+
+    def _anchors(self, offsets: np.ndarray, owners: np.ndarray, lows: np.ndarray, highs: np.ndarray) -> Dict[int, Tuple[int, int]]:
+        """为未逐字命中的片段批量选出近似匹配的锚点：{片段序号: (片段内偏移, 归一化文本位置)}。
+
+        出现次数不多的种子在原文中的每次出现按对角线（原文位置 - 片段内偏移）投票，
+        取得票最多的对角线（票数相同时取靠前的）上片段中最靠前的种子。
+        """
+        counts = highs - lows
+        keep = (counts > 0) & (counts <= _MAX_CANDIDATES)
+        offsets, owners, lows, counts = offsets[keep], owners[keep], lows[keep], counts[keep]
+        if not len(counts):
+            return {}
+        # 展开为每次出现一行
+        ends = np.cumsum(counts)
+        within = np.arange(ends[-1]) - np.repeat(ends - counts, counts)
+        positions = self._gram_positions[np.repeat(lows, counts) + within].astype(np.int64)
+        offsets = np.repeat(offsets, counts)
+        owners = np.repeat(owners, counts)
+        # (片段, 对角线) 合成一个排序键；种子按片段内偏移递增，稳定排序后每组第一行即最靠前的种子
+        keys = (owners.astype(np.int64) << 32) + (positions - offsets + (1 << 31))
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        group_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        votes = np.diff(np.r_[group_starts, len(keys)])
+        group_keys = keys[group_starts]
+        group_owners = group_keys >> 32
+        best = np.lexsort((group_keys, -votes, group_owners))
+        best = best[np.r_[True, group_owners[best][1:] != group_owners[best][:-1]]]
+        firsts = order[group_starts[best]]
+        return {
+            owner: (offset, position)
+            for owner, offset, position in zip(owners[firsts].tolist(), offsets[firsts].tolist(), positions[firsts].tolist())
+        }
+
+    def _fuzzy(
+        self, query_text: str, anchor: Optional[Tuple[int, int]], min_similarity: float, budget: List[int]
+    ) -> Optional[SnippetLocation]:
+        """从锚点向两侧逐字对齐（跳过少量替换、增删的字符），一致字符数占片段长度之比为相似度。
+
+        budget 为本批剩余可比对的片段字符数（原地扣减），不足时不再做近似匹配。
+        """
+        if anchor is None or budget[0] < len(query_text):
+            return None
+        budget[0] -= len(query_text)
+        offset, position = anchor
+        text = self.text
+        after, _, text_after = _walk(query_text[offset:], text[position:position + len(query_text) - offset + _MAX_SKIP * 4])
+        window_start = max(0, position - offset - _MAX_SKIP * 4)
+        before, _, text_before = _walk(query_text[:offset][::-1], text[window_start:position][::-1])
+        score = (before + after) / len(query_text)
+        if score < min_similarity:
+            return None
+        start, end = self._span(position - text_before, position + text_after)
+        return SnippetLocation(start=start, end=end, match="fuzzy", score=round(score, 3))
+
+    def locate_many(self, snippets: List[str], min_similarity: float = SNIPPET_MIN_SIMILARITY) -> List[SnippetLocation]:
+        """批量定位：所有片段一次完成归一化、k-gram 哈希与索引查找，避免逐个调用 numpy 的固定开销"""
+        if not snippets:
+            return []
+        # 拼接后归一化，再按原始位置把归一化字符划回各自的片段
+        joined = "\n".join(snippets)
+        bounds = np.cumsum([len(snippet) + 1 for snippet in snippets])
+        normalized, positions = _normalize(_codepoints(joined))
+        owners = np.searchsorted(bounds, positions, side="right")
+        edges = np.searchsorted(owners, np.arange(len(snippets) + 1), side="left").tolist()
+
+        hashes = _gram_hashes(normalized)
+        valid = owners[:len(hashes)] == owners[_GRAM - 1:_GRAM - 1 + len(hashes)] if len(hashes) else np.zeros(0, dtype=bool)
+        sampled = np.nonzero(valid & (hashes % _SAMPLE == 0))[0]
+        lows = np.searchsorted(self._hashes, hashes[sampled], side="left")
+        highs = np.searchsorted(self._hashes, hashes[sampled], side="right")
+        seed_owners = owners[sampled]
+        seed_offsets = sampled - np.asarray(edges)[seed_owners]
+        seeds: List[List[Tuple[int, int, int]]] = [[] for _ in snippets]
+        for offset, owner, low, high in zip(seed_offsets.tolist(), seed_owners.tolist(), lows.tolist(), highs.tolist()):
+            seeds[owner].append((offset, low, high))
+
+        text = normalized.tobytes().decode(_ENCODING, "surrogatepass")
+        locations: List[SnippetLocation] = []
+        missed: List[int] = []
+        for number, snippet in enumerate(snippets):
+            query_text = text[edges[number]:edges[number + 1]]
+            found = self._find(query_text, seeds[number]) if query_text else -1
+            if found < 0:
+                locations.append(SnippetLocation(match="not_found", score=0.0))
+                if query_text:
+                    missed.append(number)
+                continue
+            start, end = self._span(found, found + len(query_text))
+            # 归一化命中后在附近查找逐字一致的原文（片段首尾可能带有标点）
+            exact = self.markdown.find(snippet, max(0, start - len(snippet)), end + len(snippet))
+            if exact >= 0:
+                locations.append(SnippetLocation(start=exact, end=exact + len(snippet), match="exact", score=1.0))
+            else:
+                locations.append(SnippetLocation(start=start, end=end, match="normalized", score=1.0))
+
+        if missed:
+            # 未逐字命中的片段一次性选出锚点，再逐个近似匹配，整批的比对量受 _FUZZY_BUDGET 限制
+            selected = np.isin(seed_owners, missed)
+            anchors = self._anchors(seed_offsets[selected], seed_owners[selected], lows[selected], highs[selected])
+            budget = [_FUZZY_BUDGET]
+            for number in missed:
+                location = self._fuzzy(text[edges[number]:edges[number + 1]], anchors.get(number), min_similarity, budget)
+                if location is not None:
+                    locations[number] = location
+        return locations
+
+    def locate(self, snippet: str, min_similarity: float = SNIPPET_MIN_SIMILARITY) -> SnippetLocation:
+        return self.locate_many([snippet], min_similarity)[0]
+
+
+@lru_cache(maxsize=8)
+def snippet_index(markdown: str) -> SnippetIndex:
+    return SnippetIndex(markdown)
+
+
+class SnippetLocatorStats:
+    def __init__(self) -> None:
+        self.matches: Counter = Counter()
+        self.total_ms = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "matches": {name: self.matches[name] for name in ("exact", "normalized", "fuzzy", "not_found")},
+            "total_ms": round(self.total_ms, 1),
+        }
+
+
+snippet_locator_stats = SnippetLocatorStats()
+
+
+def _collect(value: Any, targets: List[Tuple[BaseModel, str]]) -> None:
+    if isinstance(value, list):
+        for item in value:
+            _collect(item, targets)
+        return
+    if not isinstance(value, BaseModel):
+        return
+    for name in type(value).model_fields:
+        child = getattr(value, name)
+        if name in SNIPPET_FIELDS and isinstance(child, str):
+            if child.strip():
+                targets.append((value, name))
+        elif isinstance(child, (BaseModel, list)):
+            _collect(child, targets)
+
+
+def locate_snippets(result: Any, markdown: str) -> Any:
+    """为结果中所有原文片段字段补充 snippet_location，并把近似片段替换为原文；原地修改并返回 result"""
+    if not SNIPPET_LOCATOR_ENABLED or result is None or not markdown:
+        return result
+    started = time.perf_counter()
+    index = snippet_index(markdown)
+    targets: List[Tuple[BaseModel, str]] = []
+    _collect(result, targets)
+    locations = index.locate_many([getattr(model, name) for model, name in targets])
+    for (model, name), location in zip(targets, locations):
+        snippet_locator_stats.matches[location.match] += 1
+        if location.match in ("normalized", "fuzzy"):
+            # 近似片段替换为合同原文，前端可直接按偏移高亮
+            location.llm_snippet = getattr(model, name)
+            setattr(model, name, index.markdown[location.start:location.end])
+        if LOCATION_FIELD in type(model).model_fields:
+            setattr(model, LOCATION_FIELD, location)
+    snippet_locator_stats.total_ms += (time.perf_counter() - started) * 1000
+    return result
+
+
+__all__ = [
+    "SNIPPET_FIELDS",
+    "SnippetIndex",
+    "locate_snippets",
+    "snippet_index",
+    "snippet_locator_stats",
+]
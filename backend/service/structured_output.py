@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import contextvars
+import json
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import openai
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel
+
+from config import LLM_STRUCTURED_OUTPUT, LLM_STRUCTURED_OUTPUT_MODELS
+from service.call_policy import is_retryable
+from service.json_repair import TRUNCATED, JsonRepairError, parse_llm_json, repair_and_validate
+from service.json_stream import StreamingArrayParser, list_field
+from service.llm_cache import llm_response_cache
+from service.llm_scheduler import Priority, llm_scheduler
+
+TEXT = "text"
+JSON_SCHEMA = "json_schema"
+FUNCTION_CALLING = "function_calling"
+MODES = (TEXT, JSON_SCHEMA, FUNCTION_CALLING)
+
+# 流式接口设置的逐条回调：列表字段中的元素校验通过后立即调用，参数为元素（Pydantic 模型）
+_item_callback: contextvars.ContextVar[Optional[Callable[[BaseModel], None]]] = contextvars.ContextVar(
+    "structured_item_callback", default=None
+)
+
+# 400 错误信息中出现这些关键词时，认为是模型/服务端不支持结构化输出参数
+_UNSUPPORTED_HINTS = ("response_format", "json_schema", "tool", "function")
+
+
+def _parse_overrides(spec: str) -> Dict[str, str]:
+    overrides: Dict[str, str] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        model, mode = (part.strip() for part in item.split("=", 1))
+        if mode not in MODES:
+            print(f"Ignoring unknown structured output mode for {model}: {mode}")
+            continue
+        overrides[model] = mode
+    return overrides
+
+
+@lru_cache(maxsize=None)
+def _tool_schema(output_model: type) -> Dict[str, Any]:
+    return convert_to_openai_tool(output_model)
+
+
+@lru_cache(maxsize=None)
+def _format_instructions(output_model: type) -> str:
+    return PydanticOutputParser(pydantic_object=output_model).get_format_instructions()
+
+
+class StructuredOutputRegistry:
+    """记录每个模型使用的结构化输出方式，以及运行中发现不支持而退回 text 的模型"""
+
+    def __init__(self, default_mode: str, overrides: Dict[str, str]) -> None:
+        self.default_mode = default_mode if default_mode in MODES else TEXT
+        self.overrides = overrides
+        self.unsupported: Set[str] = set()
+        self.calls: Counter = Counter()
+
+    def mode_for(self, model_name: str) -> str:
+        if model_name in self.unsupported:
+            return TEXT
+        return self.overrides.get(model_name, self.default_mode)
+
+    def mark_unsupported(self, model_name: str, mode: str, exc: Exception) -> None:
+        print(f"Model {model_name} rejected structured output mode {mode}, falling back to text: {exc}")
+        self.unsupported.add(model_name)
+        self.calls["fallback"] += 1
+
+    @staticmethod
+    def request_kwargs(mode: str, output_model: type) -> Dict[str, Any]:
+        if mode == TEXT:
+            return {}
+        function = _tool_schema(output_model)["function"]
+        if mode == JSON_SCHEMA:
+            return {
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": function["name"],
+                        "description": function.get("description", ""),
+                        "schema": function["parameters"],
+                        "strict": False,
+                    },
+                }
+            }
+        return {
+            "tools": [_tool_schema(output_model)],
+            "tool_choice": {"type": "function", "function": {"name": function["name"]}},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default_mode": self.default_mode,
+            "overrides": dict(self.overrides),
+            "unsupported_models": sorted(self.unsupported),
+            "calls": dict(self.calls),
+        }
+
+
+structured_output = StructuredOutputRegistry(
+    LLM_STRUCTURED_OUTPUT,
+    _parse_overrides(LLM_STRUCTURED_OUTPUT_MODELS),
+)
+
+
+@contextmanager
+def item_stream(on_item: Callable[[BaseModel], None]) -> Iterator[None]:
+    """在当前上下文中的 invoke_structured 改为流式调用，列表字段（item_list / extracted_clauses 等）中
+    每个元素闭合并通过校验后立即调用 on_item；并发的分片、类别调用复制上下文，共用同一个回调"""
+    token = _item_callback.set(on_item)
+    try:
+        yield
+    finally:
+        _item_callback.reset(token)
+
+
+def _response_text(response, mode: str) -> str:
+    if mode == FUNCTION_CALLING:
+        if response.tool_calls:
+            return json.dumps(response.tool_calls[0]["args"], ensure_ascii=False)
+        # 参数不是合法 JSON 时 langchain 放入 invalid_tool_calls，交给本地修复处理
+        if response.invalid_tool_calls:
+            return response.invalid_tool_calls[0].get("args") or ""
+    return response.content.strip() if isinstance(response.content, str) else ""
+
+
+def _chunk_text(chunk, mode: str) -> str:
+    if mode == FUNCTION_CALLING:
+        return "".join(part.get("args") or "" for part in chunk.tool_call_chunks)
+    return chunk.content if isinstance(chunk.content, str) else ""
+
+
+async def _stream_response(
+    llm,
+    messages: List[Any],
+    priority: Priority,
+    mode: str,
+    request_kwargs: Dict[str, Any],
+    field: Tuple[str, type],
+    on_item: Callable[[BaseModel], None],
+):
+    """流式调用并逐条回调列表元素，返回拼接后的完整响应；元素本地修复后仍不合法时跳过，以完整结果为准。
+
+    流中途出现可重试的错误时退回非流式调用（带退避重试），已回调的元素不撤回，最终结果以完整响应为准。
+    """
+    name, item_model = field
+    parser = StreamingArrayParser(name)
+    response = None
+    try:
+        async for chunk in llm_scheduler.astream(llm, messages, priority, **request_kwargs):
+            response = chunk if response is None else response + chunk
+            for raw in parser.feed(_chunk_text(chunk, mode)):
+                try:
+                    item, _ = repair_and_validate(raw, item_model)
+                except JsonRepairError:
+                    continue
+                structured_output.calls["streamed_items"] += 1
+                on_item(item)
+    except Exception as exc:
+        if not is_retryable(exc):
+            raise
+        print(f"Streaming call to {llm.model_name} failed ({exc}), retrying without streaming")
+        return await llm_scheduler.ainvoke(llm, messages, priority, **request_kwargs)
+    if response is None:
+        # 流中没有任何数据块，按非流式重新请求
+        return await llm_scheduler.ainvoke(llm, messages, priority, **request_kwargs)
+    return response
+
+
+async def invoke_structured(
+    llm,
+    messages: List[Any],
+    parser: PydanticOutputParser,
+    refine: Callable[[str], Awaitable[str]],
+    priority: Priority = Priority.INTERACTIVE,
+):
+    """调用模型并返回解析后的 Pydantic 结果，带结果缓存。
+
+    messages 不包含输出格式说明：text 方式下在最后一条用户消息前插入格式说明，
+    json_schema / function_calling 方式下改为把 JSON Schema 作为请求参数发送，节省提示词 token。
+    处于 item_stream 上下文且输出模型含列表字段时改为流式调用，元素逐条回调，返回值不变。
+    """
+    output_model = parser.pydantic_object
+    mode = structured_output.mode_for(llm.model_name)
+    if mode == TEXT:
+        request_messages = [*messages[:-1], ("system", f"输出格式: {_format_instructions(output_model)}"), messages[-1]]
+        cache_key = llm_response_cache.key_for(llm, request_messages, output_model)
+    else:
+        request_messages = list(messages)
+        cache_key = llm_response_cache.key_for(llm, {"mode": mode, "messages": request_messages}, output_model)
+
+    on_item = _item_callback.get()
+    field = list_field(output_model) if on_item is not None else None
+
+    cached = await llm_response_cache.get(cache_key, output_model)
+    if cached is not None:
+        if field is not None:
+            for item in getattr(cached, field[0]):
+                on_item(item)
+        return cached
+
+    request_kwargs = structured_output.request_kwargs(mode, output_model)
+    try:
+        if field is not None:
+            structured_output.calls["streamed"] += 1
+            response = await _stream_response(llm, request_messages, priority, mode, request_kwargs, field, on_item)
+        else:
+            response = await llm_scheduler.ainvoke(llm, request_messages, priority, **request_kwargs)
+    except openai.BadRequestError as exc:
+        if mode == TEXT or not any(hint in str(exc).lower() for hint in _UNSUPPORTED_HINTS):
+            raise
+        structured_output.mark_unsupported(llm.model_name, mode, exc)
+        return await invoke_structured(llm, messages, parser, refine, priority)
+
+    structured_output.calls[mode] += 1
+    text = _response_text(response, mode)
+    if not text and mode != TEXT:
+        # 服务端忽略了结构化参数且没有返回内容，按 text 方式重新请求
+        structured_output.mark_unsupported(llm.model_name, mode, ValueError("empty structured response"))
+        return await invoke_structured(llm, messages, parser, refine, priority)
+
+    result, applied = await parse_llm_json(text, output_model, refine)
+    if TRUNCATED in applied:
+        # 截断后只保留了部分元素，缓存会让同一请求在有效期内一直返回不完整的结果
+        structured_output.calls["truncated"] += 1
+    else:
+        await llm_response_cache.set(cache_key, result)
+    return result
+
+
+__all__ = [
+    "FUNCTION_CALLING",
+    "JSON_SCHEMA",
+    "StructuredOutputRegistry",
+    "TEXT",
+    "invoke_structured",
+    "item_stream",
+    "structured_output",
+]
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# 加粗字体的 span flag（PyMuPDF: bit 4）
+_BOLD_FLAG = 16
+_CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_NUMBERED_HEADING = re.compile(r"^(第[一二三四五六七八九十百零〇\d]+[条章节部分]|[一二三四五六七八九十]+、|\d+(\.\d+)*[\s、．.])")
+
+
+@dataclass
+class PageClassification:
+    native: bool
+    char_count: int
+    image_ratio: float
+    text_coverage: float
+    garbled_ratio: float
+    reason: str
+
+
+def _garbled_ratio(text: str) -> float:
+    if not text:
+        return 0.0
+    # U+FFFD 替换字符与私有区字符通常意味着字体缺少 ToUnicode 映射
+    garbled = sum(1 for ch in text if ch == "\ufffd" or "\ue000" <= ch <= "\uf8ff")
+    return garbled / len(text)
+
+
+def _area_ratio(rects, page_rect) -> float:
+    page_area = page_rect.get_area() or 1.0
+    covered = sum((rect & page_rect).get_area() for rect in rects if rect.intersects(page_rect))
+    return min(1.0, covered / page_area)
+
+
+def classify_page(page, min_chars: int, max_image_ratio: float, max_garbled_ratio: float = 0.05) -> PageClassification:
+    """根据文本层字符数、图片面积占比与乱码比例判断页面是否为可直接提取文字的原生页面"""
+    import fitz  # PyMuPDF
+
+    text = page.get_text("text")
+    visible = "".join(text.split())
+    blocks = [fitz.Rect(block[:4]) for block in page.get_text("blocks") if block[6] == 0 and block[4].strip()]
+    images = [fitz.Rect(info["bbox"]) for info in page.get_image_info()]
+
+    char_count = len(visible)
+    image_ratio = _area_ratio(images, page.rect)
+    text_coverage = _area_ratio(blocks, page.rect)
+    garbled_ratio = _garbled_ratio(visible)
+
+    if char_count < min_chars:
+        native, reason = False, "文本层字符过少"
+    elif garbled_ratio > max_garbled_ratio:
+        native, reason = False, "文本层存在乱码（字体缺少Unicode映射）"
+    elif image_ratio > max_image_ratio:
+        native, reason = False, "图片面积占比过高"
+    else:
+        native, reason = True, "原生文本页面"
+    return PageClassification(
+        native=native,
+        char_count=char_count,
+        image_ratio=round(image_ratio, 3),
+        text_coverage=round(text_coverage, 3),
+        garbled_ratio=round(garbled_ratio, 3),
+        reason=reason,
+    )
+
+
+def _body_font_size(blocks) -> float:
+    sizes: Counter = Counter()
+    for block in blocks:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                sizes[round(span["size"], 1)] += len(span["text"].strip())
+    return sizes.most_common(1)[0][0] if sizes else 10.0
+
+
+def _join_lines(lines: List[str]) -> str:
+    text = lines[0]
+    for line in lines[1:]:
+        # 中文换行直接拼接，西文换行补空格
+        if _CJK.search(text[-1]) and _CJK.search(line[0]):
+            text += line
+        else:
+            text += " " + line
+    return text
+
+
+def _heading_prefix(text: str, size: float, bold: bool, body_size: float) -> str:
+    ratio = size / body_size if body_size else 1.0
+    if ratio >= 1.6:
+        return "# "
+    if ratio >= 1.3:
+        return "## "
+    if len(text) <= 40 and (ratio >= 1.15 or (bold and _NUMBERED_HEADING.match(text))):
+        return "### "
+    return ""
+
+
+def page_to_markdown(page) -> str:
+    """将原生文本页面转换为 markdown：按字号/加粗识别标题，使用 find_tables 还原简单表格"""
+    import fitz  # PyMuPDF
+
+    items: List[Tuple[float, float, str]] = []
+    table_rects = []
+    try:
+        tables = page.find_tables().tables
+    except Exception as exc:
+        print(f"Table detection failed on page {page.number + 1}: {exc}")
+        tables = []
+    for table in tables:
+        markdown = table.to_markdown(clean=False).strip()
+        if markdown:
+            table_rects.append(fitz.Rect(table.bbox))
+            items.append((table.bbox[1], table.bbox[0], markdown))
+
+    blocks = [block for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"] if block.get("type") == 0]
+    body_size = _body_font_size(blocks)
+    for block in blocks:
+        rect = fitz.Rect(block["bbox"])
+        if any((rect & table_rect).get_area() > 0.5 * rect.get_area() for table_rect in table_rects):
+            continue
+        lines: List[Tuple[str, float, bool]] = []
+        for line in block["lines"]:
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if not spans or not text:
+                continue
+            size = max(span["size"] for span in spans)
+            bold = all(span["flags"] & _BOLD_FLAG for span in spans)
+            lines.append((text, size, bold))
+        if not lines:
+            continue
+        if len(lines) == 1:
+            text, size, bold = lines[0]
+            items.append((rect.y0, rect.x0, _heading_prefix(text, size, bold, body_size) + text))
+        else:
+            items.append((rect.y0, rect.x0, _join_lines([line[0] for line in lines])))
+
+    items.sort(key=lambda item: (round(item[0], 1), item[1]))
+    return "\n\n".join(item[2] for item in items)
+
+
+__all__ = [
+    "PageClassification",
+    "classify_page",
+    "page_to_markdown",
+]
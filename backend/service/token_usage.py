@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import base64
+import contextvars
+import hashlib
+import io
+import json
+import math
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from PIL import Image
+
+from config import (
+    LLM_CONTEXT_TOKENS,
+    LLM_LONG_CONTEXT_MODEL,
+    LLM_LONG_CONTEXT_TOKENS,
+    LLM_MODEL,
+    LLM_OUTPUT_TOKEN_RESERVE,
+    OCR_CONTEXT_TOKENS,
+    OCR_MODEL,
+    TOKENIZER_CACHE_ITEMS,
+    TOKENIZER_ENCODING,
+)
+from models.usage import TokenUsage
+
+# 无法读取图片尺寸时一张页面图片按固定 token 数估计
+IMAGE_TOKEN_ESTIMATE = 1000
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+# 编码名为该值时不加载 tiktoken，始终按字符数估算（离线且各环境结果一致）
+HEURISTIC = "heuristic"
+# 短于该长度的文本直接计数，计算哈希与直接编码的开销相当
+_CACHE_MIN_CHARS = 1024
+
+
+def image_tokens(url: str, detail: str = "auto") -> int:
+    """按 OpenAI 视觉模型的计费方式估计：缩放到 2048 以内、短边 768 后按 512 像素分块，每块 170，另加 85"""
+    if detail == "low":
+        return 85
+    if not url.startswith("data:"):
+        return IMAGE_TOKEN_ESTIMATE
+    try:
+        # 只解码开头部分即可读出图片头中的尺寸
+        head = url.split(",", 1)[1][:65536]
+        head = head[: len(head) - len(head) % 4]
+        width, height = Image.open(io.BytesIO(base64.b64decode(head))).size
+    except Exception:
+        return IMAGE_TOKEN_ESTIMATE
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _message_contents(messages: Any) -> Iterator[Any]:
+    """依次返回每条消息的内容：字符串，或多模态消息的分段列表"""
+    if isinstance(messages, str):
+        yield messages
+        return
+    for message in messages:
+        if isinstance(message, tuple):
+            yield message[1]
+        elif isinstance(message, dict):
+            yield message.get("content", "")
+        else:
+            yield getattr(message, "content", "")
+
+
+def message_chars(messages: Any) -> int:
+    """消息中文本的总字符数（不含图片），用于决定是否把计数放到线程池"""
+    total = 0
+    for content in _message_contents(messages):
+        if isinstance(content, str):
+            total += len(content)
+        else:
+            total += sum(len(part.get("text", "")) for part in content if part.get("type") != "image_url")
+    return total
+
+
+def estimate_text_tokens(text: str) -> int:
+    """没有 tokenizer 时的估算：中文等非 ASCII 字符每个至少 1 个 token，其余按约 4 个字符 1 个 token"""
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return len(text) - ascii_chars + (ascii_chars + 3) // 4
+
+
+class TokenCounter:
+    """调用前计算输入 token 数：系统提示词、输出格式说明、合同正文与页面图片。
+
+    长文本的计数按 (编码, 内容哈希) 缓存在进程内 LRU 中，同一份合同正文在多次抽取调用中只编码一次。
+    """
+
+    def __init__(self, encoding_name: str = "", cache_items: int = TOKENIZER_CACHE_ITEMS) -> None:
+        self.encoding_name = encoding_name
+        self.cache_items = cache_items
+        self._encodings: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._counts: "OrderedDict[tuple, int]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _encoding(self, model: str):
+        with self._lock:
+            if model not in self._encodings:
+                self._encodings[model] = self._load(model)
+            return self._encodings[model]
+
+    def _load(self, model: str):
+        if self.encoding_name == HEURISTIC:
+            return None
+        import tiktoken
+
+        try:
+            if self.encoding_name:
+                return tiktoken.get_encoding(self.encoding_name)
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                # 非 OpenAI 模型没有对应编码，用 o200k_base 近似
+                return tiktoken.get_encoding("o200k_base")
+        except Exception as exc:
+            # 离线环境无法下载编码文件时退回按字符数估算
+            print(f"Tokenizer for {model} unavailable, falling back to character estimate: {exc}")
+            return None
+
+    def tokenizer(self, model: str) -> str:
+        encoding = self._encoding(model)
+        return encoding.name if encoding is not None else HEURISTIC
+
+    def count_text(self, text: str, model: str) -> int:
+        if not text:
+            return 0
+        encoding = self._encoding(model)
+        if len(text) < _CACHE_MIN_CHARS or self.cache_items <= 0:
+            return self._count(text, encoding)
+        key = (
+            encoding.name if encoding is not None else HEURISTIC,
+            hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest(),
+        )
+        with self._cache_lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return count
+            self.misses += 1
+        count = self._count(text, encoding)
+        with self._cache_lock:
+            self._counts[key] = count
+            while len(self._counts) > self.cache_items:
+                self._counts.popitem(last=False)
+        return count
+
+    @staticmethod
+    def _count(text: str, encoding) -> int:
+        if encoding is None:
+            return estimate_text_tokens(text)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count_messages(self, messages: Any, model: str, request_kwargs: Optional[Dict[str, Any]] = None) -> int:
+        if isinstance(messages, str):
+            total = self.count_text(messages, model) + MESSAGE_OVERHEAD_TOKENS
+        else:
+            total = 0
+            for content in _message_contents(messages):
+                total += MESSAGE_OVERHEAD_TOKENS
+                if isinstance(content, str):
+                    total += self.count_text(content, model)
+                    continue
+                for part in content:
+                    if part.get("type") == "image_url":
+                        image = part.get("image_url") or {}
+                        total += image_tokens(image.get("url", ""), image.get("detail", "auto"))
+                    else:
+                        total += self.count_text(part.get("text", ""), model)
+        # response_format 中的 JSON Schema、tools 定义同样计入输入
+        for key in ("response_format", "tools"):
+            value = (request_kwargs or {}).get(key)
+            if value is not None:
+                total += self.count_text(json.dumps(value, ensure_ascii=False, default=str), model)
+        return total
+
+    def stats(self) -> Dict[str, int]:
+        with self._cache_lock:
+            return {"cached": len(self._counts), "hits": self.hits, "misses": self.misses}
+
+
+class PromptTooLargeError(RuntimeError):
+    """预检时输入加预留输出超过模型上下文窗口，由接口层转换为 413"""
+
+    def __init__(self, model: str, prompt_tokens: int, limit: int) -> None:
+        super().__init__(
+            f"输入约 {prompt_tokens} tokens，加上预留输出 {LLM_OUTPUT_TOKEN_RESERVE} tokens 超过模型 {model} 的上下文窗口 {limit} tokens"
+        )
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.limit = limit
+
+
+class TokenBudget:
+    """按模型的上下文窗口检查输入是否放得下"""
+
+    def __init__(self, context_tokens: Dict[str, int], output_reserve: int, default_context_tokens: int) -> None:
+        self.context_tokens = context_tokens
+        self.output_reserve = output_reserve
+        self.default_context_tokens = default_context_tokens
+
+    def limit(self, model: str) -> int:
+        return self.context_tokens.get(model, self.default_context_tokens)
+
+    def fits(self, model: str, prompt_tokens: int) -> bool:
+        return prompt_tokens + self.output_reserve <= self.limit(model)
+
+
+def _accumulate(total: TokenUsage, usage: TokenUsage) -> None:
+    total.calls += usage.calls
+    total.prompt_tokens += usage.prompt_tokens
+    total.completion_tokens += usage.completion_tokens
+    total.estimated_prompt_tokens += usage.estimated_prompt_tokens
+    total.rerouted += usage.rerouted
+    total.latency_ms = round(total.latency_ms + usage.latency_ms, 1)
+
+
+class UsageLedger:
+    """一个请求（或其中一个阶段）的 token 用量，记录时同时累加到所有上级账本"""
+
+    def __init__(self, endpoint: Optional[str] = None, stage: Optional[str] = None, parent: Optional["UsageLedger"] = None) -> None:
+        self.parent = parent
+        self.endpoint = endpoint or (parent.endpoint if parent else None)
+        self.stage = stage or (parent.stage if parent else None)
+        self.usage = TokenUsage()
+
+    def add(self, usage: TokenUsage) -> None:
+        ledger: Optional[UsageLedger] = self
+        while ledger is not None:
+            _accumulate(ledger.usage, usage)
+            ledger = ledger.parent
+
+    def summary(self) -> TokenUsage:
+        return self.usage.model_copy()
+
+
+_ledger: contextvars.ContextVar[Optional[UsageLedger]] = contextvars.ContextVar("token_usage_ledger", default=None)
+
+
+@contextmanager
+def usage_scope(endpoint: Optional[str] = None, stage: Optional[str] = None) -> Iterator[UsageLedger]:
+    """在当前账本下开一个子账本；并发任务各自复制上下文，互不影响"""
+    ledger = UsageLedger(endpoint, stage, _ledger.get())
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+
+
+def current_ledger() -> Optional[UsageLedger]:
+    return _ledger.get()
+
+
+def _usage_counts(usage: TokenUsage) -> Dict[str, Any]:
+    return {
+        "calls": usage.calls,
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "estimated_prompt_tokens": usage.estimated_prompt_tokens,
+        "avg_latency_ms": round(usage.latency_ms / usage.calls, 1) if usage.calls else None,
+    }
+
+
+class TokenUsageStats:
+    """进程级 token 用量：按接口、阶段（分析节点/抽取类型）与模型汇总"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, TokenUsage] = defaultdict(TokenUsage)
+        self._stages: Dict[str, TokenUsage] = defaultdict(TokenUsage)
+        self._models: Dict[str, TokenUsage] = defaultdict(TokenUsage)
+        self.rejected = 0
+        self.rerouted = 0
+
+    def record(
+        self,
+        model: str,
+        estimated_prompt_tokens: int,
+        response: Any,
+        latency: float,
+        rerouted: bool = False,
+    ) -> TokenUsage:
+        """记录一次成功的模型调用；响应中没有 usage 时输入按预估值计"""
+        metadata = getattr(response, "usage_metadata", None) or {}
+        usage = TokenUsage(
+            calls=1,
+            prompt_tokens=metadata.get("input_tokens", estimated_prompt_tokens),
+            completion_tokens=metadata.get("output_tokens", 0),
+            estimated_prompt_tokens=estimated_prompt_tokens,
+            rerouted=int(rerouted),
+            latency_ms=round(latency * 1000, 1),
+        )
+        ledger = _ledger.get()
+        if ledger is not None:
+            ledger.add(usage)
+        endpoint = (ledger.endpoint if ledger else None) or "-"
+        stage = (ledger.stage if ledger else None) or "-"
+        with self._lock:
+            for bucket in (self._endpoints[endpoint], self._stages[stage], self._models[model]):
+                _accumulate(bucket, usage)
+            self.rerouted += int(rerouted)
+        return usage
+
+    def reject(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tokenizer": {model: token_counter.tokenizer(model) for model in self._models},
+                "count_cache": token_counter.stats(),
+                "rejected": self.rejected,
+                "rerouted": self.rerouted,
+                "endpoints": {name: _usage_counts(usage) for name, usage in self._endpoints.items()},
+                "stages": {name: _usage_counts(usage) for name, usage in self._stages.items()},
+                "models": {name: _usage_counts(usage) for name, usage in self._models.items()},
+            }
+
+
+token_counter = TokenCounter(TOKENIZER_ENCODING)
+token_budget = TokenBudget(
+    context_tokens={
+        # LLM_MODEL 与 OCR_MODEL 相同时以 LLM_CONTEXT_TOKENS 为准
+        OCR_MODEL: OCR_CONTEXT_TOKENS,
+        LLM_MODEL: LLM_CONTEXT_TOKENS,
+        **({LLM_LONG_CONTEXT_MODEL: LLM_LONG_CONTEXT_TOKENS} if LLM_LONG_CONTEXT_MODEL else {}),
+    },
+    output_reserve=LLM_OUTPUT_TOKEN_RESERVE,
+    default_context_tokens=LLM_CONTEXT_TOKENS,
+)
+token_usage = TokenUsageStats()
+
+
+__all__ = [
+    "HEURISTIC",
+    "IMAGE_TOKEN_ESTIMATE",
+    "PromptTooLargeError",
+    "TokenBudget",
+    "TokenCounter",
+    "TokenUsageStats",
+    "UsageLedger",
+    "current_ledger",
+    "estimate_text_tokens",
+    "image_tokens",
+    "message_chars",
+    "token_budget",
+    "token_counter",
+    "token_usage",
+    "usage_scope",
+]
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from fastapi import UploadFile
+
+from config import PDF_UPLOAD_MAX_BYTES
+
+_COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class SpooledPdf:
+    """已上传 PDF 的只读句柄，path 可直接交给 PyMuPDF 与渲染工作进程打开。
+
+    starlette 解析 multipart 时已把文件流式写入 SpooledTemporaryFile（超过1MB落盘），
+    这里复制该文件描述符并通过 /proc/<pid>/fd/<fd> 暴露路径，不再额外写临时文件；
+    不支持 /proc 的平台退回为复制到系统临时目录。close() 释放描述符或删除临时文件，可重复调用。
+    """
+
+    def __init__(self, path: str, fd: Optional[int] = None, owned_path: Optional[str] = None) -> None:
+        self.path = path
+        self._fd = fd
+        self._owned_path = owned_path
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._owned_path is not None:
+            try:
+                os.remove(self._owned_path)
+            except FileNotFoundError:
+                pass
+            self._owned_path = None
+
+    def __enter__(self) -> "SpooledPdf":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _copy_to_tempfile(source) -> str:
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="upload_", suffix=".pdf", delete=False) as target:
+        shutil.copyfileobj(source, target, _COPY_CHUNK_BYTES)
+    return target.name
+
+
+async def open_pdf_upload(upload: UploadFile) -> SpooledPdf:
+    spooled = upload.file
+    # 小文件仍在内存中，fileno() 会先将其落盘；之后 FastAPI 关闭 UploadFile 也不影响复制出的描述符
+    fd = os.dup(await asyncio.to_thread(spooled.fileno))
+    path = f"/proc/{os.getpid()}/fd/{fd}"
+    if os.path.exists(path):
+        return SpooledPdf(path, fd=fd)
+    os.close(fd)
+    copied = await asyncio.to_thread(_copy_to_tempfile, spooled)
+    return SpooledPdf(copied, owned_path=copied)
+
+
+class UploadSizeLimitMiddleware:
+    """在读取请求体的过程中限制 multipart 上传大小，超限立即返回 413，不等待整个文件上传完成"""
+
+    def __init__(self, app, max_bytes: int = PDF_UPLOAD_MAX_BYTES) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send) -> None:
+        body = json.dumps(
+            {"detail": f"Upload exceeds the maximum size of {self.max_bytes} bytes"}
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            return await self.app(scope, receive, send)
+
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            return await self._reject(send)
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    # 以断开连接的方式终止 multipart 解析，已落盘的部分由 starlette 负责关闭
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # 超限后丢弃应用自身产生的错误响应，统一返回 413
+            if exceeded and not response_started:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._reject(send)
+
+
+__all__ = [
+    "SpooledPdf",
+    "UploadSizeLimitMiddleware",
+    "open_pdf_upload",
+]
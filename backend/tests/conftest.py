@@ -0,0 +1,8 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "test")
+os.environ.setdefault("OCR_MODEL", "test-ocr")
+os.environ.setdefault("LLM_MODEL", "test-llm")
+os.environ["LLM_CACHE_ENABLED"] = "false"
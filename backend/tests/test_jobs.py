@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+
+from service.jobs import JobStore, JobWorkerPool
+
+
+class _FlakyRunner:
+    """前 failures 次执行抛出 error，之后返回结果"""
+
+    def __init__(self, error: BaseException, failures: int) -> None:
+        self.error = error
+        self.failures = failures
+        self.calls = 0
+
+    async def run(self, job, checkpoint):
+        self.calls += 1
+        await checkpoint.store.save_checkpoint(job.id, f"stage{self.calls}", "{}")
+        if self.calls <= self.failures:
+            raise self.error
+        return {"ok": True}
+
+
+def _run_once(pool: JobWorkerPool, store: JobStore) -> None:
+    async def once():
+        job = await store.claim("w", pool.lease_seconds, pool.max_attempts)
+        await pool._execute(job, "w")
+    asyncio.run(once())
+
+
+def _checkpoint_count(store: JobStore, job_id: str) -> int:
+    return len(store.checkpoints_sync(job_id))
+
+
+def test_retryable_error_requeues_until_max_attempts(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "inputs"))
+    runner = _FlakyRunner(httpx.ConnectTimeout("timeout"), failures=5)
+    pool = JobWorkerPool(store, runner, workers=0, max_attempts=2)
+    job = store.create_sync("service_plan_recommendation", {})
+
+    _run_once(pool, store)
+    info = store.info_sync(job.id)
+    assert info.status == "queued"
+    assert _checkpoint_count(store, job.id) == 1
+
+    _run_once(pool, store)
+    info = store.info_sync(job.id)
+    assert info.status == "failed"
+    assert info.attempts == 2
+    # 终态任务不保留检查点
+    assert _checkpoint_count(store, job.id) == 0
+
+
+def test_non_retryable_error_fails_immediately(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "inputs"))
+    pool = JobWorkerPool(store, _FlakyRunner(ValueError("bad request"), failures=1), workers=0, max_attempts=3)
+    job = store.create_sync("service_plan_recommendation", {})
+
+    _run_once(pool, store)
+    assert store.info_sync(job.id).status == "failed"
+    assert _checkpoint_count(store, job.id) == 0
+
+
+def test_cancel_deletes_checkpoints(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "inputs"))
+    job = store.create_sync("service_plan_recommendation", {})
+    store.save_checkpoint_sync(job.id, "ocr", "{}")
+    assert store.cancel_sync(job.id).status == "cancelled"
+    assert _checkpoint_count(store, job.id) == 0
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import PydanticOutputParser
+
+from models.service_plan import DetectorEcgWarrantyLLMOutput
+from service import structured_output
+from service.json_repair import TRUNCATED, JsonRepairError, parse_llm_json, repair_and_validate
+
+CANNED = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "benchmarks", "golden", "canned", "DetectorEcgWarrantyLLMOutput.json",
+)
+
+
+def _canned_text() -> str:
+    with open(CANNED, encoding="utf-8") as f:
+        return json.dumps(json.load(f), ensure_ascii=False)
+
+
+def test_truncated_inside_nested_array_is_not_repaired():
+    # 截断在 coils 的元素中：不能补齐成 coils 缺失元素却能通过校验的结果
+    text = _canned_text()
+    cut = text.index('"coil_name"')
+    with pytest.raises(JsonRepairError):
+        repair_and_validate(text[:cut], DetectorEcgWarrantyLLMOutput)
+
+
+def test_truncated_keeps_only_complete_items():
+    data = json.loads(_canned_text())
+    first = data["item_list"][0]
+    data["item_list"].append({**first, "covered_items": ["心电导联"]})
+    text = json.dumps(data, ensure_ascii=False)
+    cut = text.rindex('"tubes"')
+
+    result, applied = repair_and_validate(text[:cut], DetectorEcgWarrantyLLMOutput)
+
+    assert TRUNCATED in applied
+    assert len(result.item_list) == 1
+    assert len(result.item_list[0].coils) == len(first["coils"])
+
+
+def test_parse_llm_json_reports_truncation():
+    data = json.loads(_canned_text())
+    data["item_list"].append(data["item_list"][0])
+    text = json.dumps(data, ensure_ascii=False)
+
+    async def refine(_: str) -> str:
+        raise AssertionError("截断时不应调用格式修复")
+
+    result, applied = asyncio.run(parse_llm_json(text[:-40], DetectorEcgWarrantyLLMOutput, refine))
+
+    assert TRUNCATED in applied
+    assert len(result.item_list) == 1
+
+
+class _FakeLLM:
+    model_name = "test-llm"
+
+    def __init__(self, content: str) -> None:
+        self.content = content
+
+    async def ainvoke(self, messages, **kwargs):
+        return AIMessage(content=self.content)
+
+
+def test_truncated_result_is_not_cached(monkeypatch):
+    data = json.loads(_canned_text())
+    data["item_list"].append(data["item_list"][0])
+    text = json.dumps(data, ensure_ascii=False)
+    cached = []
+
+    async def cache_set(key, value):
+        cached.append(key)
+
+    async def refine(_: str) -> str:
+        raise AssertionError("截断时不应调用格式修复")
+
+    monkeypatch.setattr(structured_output.llm_response_cache, "set", cache_set)
+    parser = PydanticOutputParser(pydantic_object=DetectorEcgWarrantyLLMOutput)
+
+    truncated = asyncio.run(structured_output.invoke_structured(_FakeLLM(text[:-40]), [("user", "合同")], parser, refine))
+    assert len(truncated.item_list) == 1
+    assert cached == []
+
+    complete = asyncio.run(structured_output.invoke_structured(_FakeLLM(text), [("user", "合同")], parser, refine))
+    assert len(complete.item_list) == 2
+    assert len(cached) == 1
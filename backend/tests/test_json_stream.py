@@ -0,0 +1,41 @@
+import json
+import os
+
+from service.json_stream import StreamingArrayParser
+
+CANNED = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "benchmarks", "golden", "canned", "TrainingLLMOutput.json",
+)
+
+
+def _canned() -> dict:
+    with open(CANNED, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_items_match_whole_parse_for_any_chunking():
+    data = _canned()
+    data["note"] = '说明 "item_list": [{"x": 1}]'
+    text = "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```"
+    for size in (1, 3, 17, len(text)):
+        parser = StreamingArrayParser("item_list")
+        items = []
+        for start in range(0, len(text), size):
+            items.extend(parser.feed(text[start:start + size]))
+        assert [json.loads(item) for item in items] == data["item_list"]
+        assert parser.done
+
+
+def test_buffer_keeps_only_open_item():
+    item = _canned()["item_list"][0]
+    parser = StreamingArrayParser("item_list")
+    parser.feed('{"item_list": [')
+    longest = 0
+    for _ in range(200):
+        chunk = json.dumps(item, ensure_ascii=False) + ","
+        for start in range(0, len(chunk), 8):
+            parser.feed(chunk[start:start + 8])
+            longest = max(longest, len(parser._text))
+    # 缓冲区不随已输出的元素数增长
+    assert longest <= len(chunk) + 8
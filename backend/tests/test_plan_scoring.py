@@ -0,0 +1,38 @@
+from models.service_plan import ServiceClauseForMatching, ServicePlanCandidate, ServicePlanCandidateClause
+from service.plan_scoring import shortlist_plans
+
+PLANS = [
+    ServicePlanCandidate(plan_id="gold", plan_name="金牌", clauses=[
+        ServicePlanCandidateClause(clause_item="现场响应", requirement="2小时内响应，4小时内到场"),
+        ServicePlanCandidateClause(clause_item="球管保障", requirement="含球管"),
+    ]),
+    ServicePlanCandidate(plan_id="silver", plan_name="银牌", clauses=[
+        ServicePlanCandidateClause(clause_item="现场响应", requirement="4小时内响应，8小时内到场"),
+    ]),
+]
+
+
+def _clause(attributes):
+    return ServiceClauseForMatching(
+        clause_id="c1", clause_type="onsite_sla", clause_text="现场服务", structured_attributes=attributes,
+    )
+
+
+def test_all_attributes_parsed_resolves_by_rule():
+    result = shortlist_plans(PLANS, [_clause({"响应时间": "2小时", "到场时间": "4小时", "备注": "未提供"})], 3, 2)
+    assert [match.recommended_plan_id for match in result.resolved] == ["gold"]
+    assert result.pending == []
+
+
+def test_unmapped_attribute_keeps_clause_pending():
+    # 球管保障无法按规则比较，即使响应与到场完全一致也交给模型判断
+    clause = _clause({"响应时间": "2小时", "到场时间": "4小时", "球管保障": "不含球管"})
+    result = shortlist_plans(PLANS, [clause], 3, 2)
+    assert result.resolved == []
+    assert [pending.clause_id for pending in result.pending] == ["c1"]
+    assert result.clause_scores[0].unparsed == ["球管保障"]
+
+
+def test_unparsable_value_keeps_clause_pending():
+    clause = _clause({"响应时间": "2小时", "到场时间": "4小时", "覆盖时段": "全天候"})
+    assert shortlist_plans(PLANS, [clause], 3, 2).resolved == []
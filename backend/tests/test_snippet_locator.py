@@ -0,0 +1,35 @@
+from service.snippet_locator import SnippetIndex
+
+CONTRACT = (
+    "# 医学影像设备全保维修服务合同\n\n"
+    "## 第三条 维修服务SLA\n\n"
+    "3.2 CT、MR及IGS设备：乙方在接到报修后4小时内响应，24小时内工程师到达现场；如需更换备件，备件应在48小时内到达现场。\n"
+    "3.3 DR、超声及乳腺设备：乙方在接到报修后8小时内响应，48小时内工程师到达现场。\n"
+) * 3
+
+
+def test_exact_and_normalized():
+    index = SnippetIndex(CONTRACT)
+    snippet = "乙方在接到报修后8小时内响应，48小时内工程师到达现场。"
+    exact, normalized = index.locate_many([snippet, snippet.replace("，", ", ")])
+    assert exact.match == "exact"
+    assert CONTRACT[exact.start:exact.end] == snippet
+    assert normalized.match in ("exact", "normalized")
+    assert normalized.start == exact.start
+
+
+def test_fuzzy_with_substitution_insertion_and_deletion():
+    index = SnippetIndex(CONTRACT)
+    original = "CT、MR及IGS设备：乙方在接到报修后4小时内响应，24小时内工程师到达现场；如需更换备件，备件应在48小时内到达现场。"
+    # 替换“报修”为“保修”，删除“工程师”的“师”，插入“尽快”
+    snippet = original.replace("报修", "保修").replace("工程师", "工程").replace("如需", "如需尽快")
+    location = index.locate(snippet)
+    assert location.match == "fuzzy"
+    assert location.score >= 0.8
+    located = CONTRACT[location.start:location.end]
+    assert located.startswith("CT、MR及IGS设备") and located.endswith("到达现场")
+
+
+def test_unrelated_text_is_not_found():
+    index = SnippetIndex(CONTRACT)
+    assert index.locate("本合同一式四份，甲乙双方各执两份，自双方签字盖章之日起生效。").match == "not_found"
@@ -0,0 +1,28 @@
+import asyncio
+
+from service.llm_scheduler import estimate_tokens_async
+from service.token_usage import HEURISTIC, TokenCounter, estimate_text_tokens
+
+
+def test_heuristic_counts_each_cjk_character():
+    text = "乙方应在接到报修后4小时内响应"
+    # 中文字符每个至少 1 个 token，不能按 len // 2 低估
+    assert estimate_text_tokens(text) >= sum(1 for ch in text if ord(ch) > 127)
+    assert estimate_text_tokens("a" * 40) == 10
+
+
+def test_long_text_counted_once_per_content():
+    counter = TokenCounter(HEURISTIC, cache_items=2)
+    contract = "第一条 保修期内免费维修。" * 200
+    first = counter.count_text(contract, "m")
+    assert counter.count_text(contract, "m") == first
+    assert counter.stats() == {"cached": 1, "hits": 1, "misses": 1}
+    # 短文本不进入缓存
+    counter.count_text("短文本", "m")
+    assert counter.stats()["cached"] == 1
+
+
+def test_async_estimate_matches_sync_for_large_prompt():
+    messages = [("system", "抽取保修条款"), ("user", "设备保修三年。" * 5000)]
+    tokens = asyncio.run(estimate_tokens_async(messages, "m"))
+    assert tokens > 5000 * 7
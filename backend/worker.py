@@ -0,0 +1,29 @@
+"""独立的任务工作进程：与 API 进程共用 JOB_DB_PATH / JOB_DATA_DIR，可启动多个。
+
+    JOB_WORKERS=4 python worker.py
+
+API 进程设置 JOB_WORKERS=0 时只负责接收任务，全部由这里执行。
+"""
+import asyncio
+
+from config import JOB_WORKERS
+from server import job_workers, ocr_parser
+from service.llm_clients import llm_clients
+
+
+async def main() -> None:
+    if JOB_WORKERS <= 0:
+        raise SystemExit("JOB_WORKERS 必须大于0")
+    try:
+        await job_workers.run_forever()
+    finally:
+        await job_workers.stop()
+        ocr_parser.close()
+        await llm_clients.aclose()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass